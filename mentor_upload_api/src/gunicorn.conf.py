@@ -7,6 +7,7 @@
 # Gunicorn configuration file
 # https://docs.gunicorn.org/en/stable/configure.html#configuration-file
 # https://docs.gunicorn.org/en/stable/settings.html
+import os
 
 # needs ip set or will be unreachable from host
 # regardless of docker-run port mappings
@@ -17,3 +18,8 @@ timeout = 120
 
 # to prevent any memory leaks:
 max_requests = 1000
+
+# load the app once in the master and fork workers from it (shared memory,
+# faster worker restarts). aws clients are created per worker after the fork,
+# not supported with UPLOAD_ANSWER_VERSION=local (its pools start in create_app)
+preload_app = os.environ.get("GUNICORN_PRELOAD_APP", "") == "true"
@@ -17,8 +17,20 @@ from flask import Flask, request, g, has_request_context  # NOQA E402
 from flask_cors import CORS  # NOQA E402
 from werkzeug.exceptions import HTTPException  # NOQA E402
 from jsonschema import ValidationError  # NOQA E402
+from mentor_upload_api import (  # NOQA E402
+    local_pipeline,
+    profiling,
+    streaming_upload,
+    tracing,
+)
 from mentor_upload_api.blueprints.ping import ping_blueprint  # NOQA E402
-from mentor_upload_api.blueprints.upload.answer import answer_blueprint  # NOQA E402
+from mentor_upload_api.blueprints.upload.answer import (  # NOQA E402
+    answer_blueprint,
+    get_upload_root,
+)
+from mentor_upload_api.blueprints.upload.resumable import (  # NOQA E402
+    resumable_upload_blueprint,
+)
 from mentor_upload_api.blueprints.upload.transfer import transfer_blueprint  # NOQA E402
 from mentor_upload_api.blueprints.upload.thumbnail import (  # NOQA E402
     thumbnail_blueprint,
@@ -46,6 +58,7 @@ class JSONFormatter(logging.Formatter):
         "method",
         "url",
         "headers",
+        "request_id",
     ]
 
     def to_payload(self, record):
@@ -75,8 +88,7 @@ class JSONFormatter(logging.Formatter):
 class RequestJSONFormatter(JSONFormatter):
     def format(self, record):
         if has_request_context():
-            # todo for distributed tracing:
-            # record.request_id = g.request_id if hasattr(g, 'request_id') else '-'
+            record.request_id = g.request_id if hasattr(g, "request_id") else "-"
             if hasattr(g, "response_time"):
                 setattr(record, "response-time", g.response_time)
             record.path = request.full_path
@@ -152,6 +164,9 @@ def create_app():
     )
     app = Flask(__name__)
     CORS(app)
+    tracing.init_app(app)
+    profiling.init_app(app)
+    streaming_upload.init_app(app)
 
     def generic_exception_handler(e):
         """Return JSON instead of generic 500 internal error for Exceptions"""
@@ -218,10 +233,18 @@ def create_app():
         )
 
     app.register_blueprint(ping_blueprint, url_prefix="/upload/ping")
-    if os.environ.get("UPLOAD_ANSWER_VERSION", "queue") == "queue":
+    upload_answer_version = os.environ.get("UPLOAD_ANSWER_VERSION", "queue")
+    if upload_answer_version == "queue":
         logging.info("using queues to process answer uploads")
         app.register_blueprint(answer_queue_blueprint, url_prefix="/upload/answer")
         app.register_blueprint(answer_blueprint, url_prefix="/upload/answer-queue")
+    elif upload_answer_version == "local":
+        logging.info("using an in-process pipeline to process answer uploads")
+        local_pipeline.init_app(app, get_upload_root())
+        app.register_blueprint(answer_blueprint, url_prefix="/upload/answer")
+        app.register_blueprint(
+            answer_queue_blueprint, url_prefix="/upload/answer-queue"
+        )
     else:
         logging.info("using celery to process answer uploads")
         app.register_blueprint(answer_blueprint, url_prefix="/upload/answer")
@@ -229,6 +252,9 @@ def create_app():
             answer_queue_blueprint, url_prefix="/upload/answer-queue"
         )
 
+    app.register_blueprint(
+        resumable_upload_blueprint, url_prefix="/upload/answer/resumable"
+    )
     app.register_blueprint(transfer_blueprint, url_prefix="/upload/transfer")
     app.register_blueprint(thumbnail_blueprint, url_prefix="/upload/thumbnail")
 
@@ -12,6 +12,7 @@ from os import environ
 from typing import TypedDict, List
 
 from mentor_upload_api.helpers import validate_json, exec_graphql_with_json_validation
+from mentor_upload_api.tracing import traced
 
 log = logging.getLogger()
 
@@ -96,6 +97,7 @@ def upload_task_req_gql(req: UploadTaskRequest) -> GQLQueryBody:
     }
 
 
+@traced("graphql.upload_task_update")
 def upload_task_update(req: UploadTaskRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = upload_task_req_gql(req)
@@ -107,6 +109,7 @@ def upload_task_update(req: UploadTaskRequest) -> None:
         raise Exception(json.dumps(tdjson.get("errors")))
 
 
+@traced("graphql.mentor_thumbnail_update")
 def mentor_thumbnail_update(req: MentorThumbnailUpdateRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = thumbnail_update_gql(req)
@@ -157,6 +160,7 @@ fetch_upload_task_schema = {
 }
 
 
+@traced("graphql.is_upload_in_progress")
 def is_upload_in_progress(req: FetchUploadTaskReq) -> bool:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = fetch_upload_task_gql(req)
@@ -210,6 +214,7 @@ def upload_answer_and_task_req_gql(
     }
 
 
+@traced("graphql.upload_answer_and_task_update")
 def upload_answer_and_task_update(
     answer_req: AnswerUpdateRequest, task_req: UploadTaskRequest
 ) -> None:
@@ -293,6 +298,7 @@ fetch_answer_transcript_media_json_schema = {
 }
 
 
+@traced("graphql.fetch_answer_transcript_and_media")
 def fetch_answer_transcript_and_media(mentor: str, question: str):
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     gql_query = fetch_answer_transcript_and_media_gql(mentor, question)
@@ -353,6 +359,7 @@ def import_task_create_gql_query(req: ImportTaskGQLRequest) -> GQLQueryBody:
     }
 
 
+@traced("graphql.import_task_create_gql")
 def import_task_create_gql(req: ImportTaskGQLRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = import_task_create_gql_query(req)
@@ -4,16 +4,24 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from xml.dom import ValidationErr
 from flask import request, abort
 from os import environ
 import logging
+from typing import Optional, Tuple
+
 import jwt
-import json
-from json import JSONDecodeError
 
-from mentor_upload_api.helpers import validate_json
+from mentor_upload_api.helpers import (
+    get_request_json_body,
+    validate_json,
+    validate_request_json,
+)
 
 log = logging.getLogger()
 
@@ -32,15 +40,69 @@ jwt_payload_schema = {
 }
 
 
-def parse_payload_from_auth_header_jwt(request):
-    bearer_token = request.headers.get("Authorization", "")
-    token_authentication = bearer_token.lower().startswith("bearer")
-    token_split = bearer_token.split(" ")
-    if not token_authentication or len(token_split) == 1:
-        log.debug("no authentication token provided")
-        abort(401)
-    token = token_split[1]
-    jwt_secret = environ.get("JWT_SECRET")
+def get_jwt_cache_size() -> int:
+    # 0 disables caching of verified tokens
+    return int(environ.get("JWT_CACHE_SIZE") or "1024")
+
+
+def get_jwt_cache_max_age_secs() -> int:
+    # upper bound for tokens without exp
+    return int(environ.get("JWT_CACHE_MAX_AGE_SECS") or "300")
+
+
+class VerifiedTokenCache:
+    """LRU of verified (decoded and validated) jwt payloads by token digest, entries expire with their token"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, payload: dict, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+jwt_cache = VerifiedTokenCache(get_jwt_cache_size())
+
+
+def _token_cache_key(token: str, jwt_secret: str) -> str:
+    # a new secret must not hit tokens verified with the old one
+    return hashlib.sha256(f"{jwt_secret}:{token}".encode("utf-8")).hexdigest()
+
+
+def _decode_and_validate_jwt(token: str, jwt_secret: str) -> dict:
     try:
         payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
@@ -53,6 +115,28 @@ def parse_payload_from_auth_header_jwt(request):
     return payload
 
 
+def parse_payload_from_auth_header_jwt(request):
+    bearer_token = request.headers.get("Authorization", "")
+    token_authentication = bearer_token.lower().startswith("bearer")
+    token_split = bearer_token.split(" ")
+    if not token_authentication or len(token_split) == 1:
+        log.debug("no authentication token provided")
+        abort(401)
+    token = token_split[1]
+    jwt_secret = environ.get("JWT_SECRET")
+    if not jwt_cache.max_size:
+        return _decode_and_validate_jwt(token, jwt_secret)
+    cache_key = _token_cache_key(token, jwt_secret or "")
+    payload = jwt_cache.get(cache_key)
+    if payload is None:
+        payload = _decode_and_validate_jwt(token, jwt_secret)
+        expires_at = time.time() + get_jwt_cache_max_age_secs()
+        if isinstance(payload.get("exp"), (int, float)):
+            expires_at = min(expires_at, payload["exp"])
+        jwt_cache.put(cache_key, payload, expires_at)
+    return payload
+
+
 def authorize_to_manage_content(f):
     """Confirms the issuer is an admin or content manager via JWT"""
 
@@ -76,39 +160,35 @@ authorize_edit_mentor_payload_schema = {
 }
 
 
+def verify_can_edit_mentor(mentor_being_edited: str) -> None:
+    """Aborts with 401 unless the JWT is for mentor_being_edited or an admin/content manager"""
+    jwt_payload = parse_payload_from_auth_header_jwt(request)
+
+    # Check if the requester is either editing their own mentor, or has permissions to edit other mentors
+    requester_mentorids = jwt_payload["mentorIds"]
+    requester_can_manage_content = (
+        jwt_payload["role"] == "CONTENT_MANAGER" or jwt_payload["role"] == "ADMIN"
+    )
+
+    if (
+        mentor_being_edited not in requester_mentorids
+        and not requester_can_manage_content
+    ):
+        abort(401)
+
+
 def authorize_to_edit_mentor(f):
     """Crosschecks JWTs mentorId with the mentor being edited, or validates that the editor is an admin/content manager"""
 
     @wraps(f)
     def authorized_endpoint(*args, **kws):
         # Get the mentor being edited from the request body
-        body = request.form.get("body", {})
-        if body:
-            try:
-                json_body = json.loads(body)
-            except JSONDecodeError as err:
-                raise err
-        else:
-            json_body = request.json
+        json_body = get_request_json_body()
         if not json_body:
             raise Exception("missing required param body")
 
-        validate_json(json_body, authorize_edit_mentor_payload_schema)
-        mentor_being_edited = json_body["mentor"]
-
-        jwt_payload = parse_payload_from_auth_header_jwt(request)
-
-        # Check if the requester is either editing their own mentor, or has permissions to edit other mentors
-        requester_mentorids = jwt_payload["mentorIds"]
-        requester_can_manage_content = (
-            jwt_payload["role"] == "CONTENT_MANAGER" or jwt_payload["role"] == "ADMIN"
-        )
-
-        if (
-            mentor_being_edited not in requester_mentorids
-            and not requester_can_manage_content
-        ):
-            abort(401)
+        validate_request_json(json_body, authorize_edit_mentor_payload_schema)
+        verify_can_edit_mentor(json_body["mentor"])
         return f(*args, **kws)
 
     return authorized_endpoint
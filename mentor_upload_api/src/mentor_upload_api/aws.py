@@ -0,0 +1,64 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+boto3 clients, created on first use in each process: nothing is created at
+import time and a forked gunicorn worker never reuses its parent's clients,
+so the app can be preloaded
+"""
+import logging
+import os
+import threading
+from os import environ
+from typing import Any, Dict
+
+log = logging.getLogger()
+
+_clients: Dict[str, Any] = {}
+_clients_pid = 0
+_clients_lock = threading.Lock()
+
+
+def _require_env(n: str) -> str:
+    env_val = environ.get(n, "")
+    if not env_val:
+        raise EnvironmentError(f"missing required env var {n}")
+    return env_val
+
+
+def get_static_s3_bucket() -> str:
+    return _require_env("STATIC_AWS_S3_BUCKET")
+
+
+def get_client(service: str):
+    """The process' boto3 client for service (s3, sns, ssm...)"""
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        if service not in _clients:
+            import boto3  # slow to import, only needed once a client is
+
+            log.info("creating %s client", service)
+            _clients[service] = boto3.client(
+                service,
+                region_name=_require_env("STATIC_AWS_REGION"),
+                aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
+            )
+        return _clients[service]
+
+
+def reset_clients() -> None:
+    global _clients_lock
+    # the lock may have been held by another thread at fork time
+    _clients_lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
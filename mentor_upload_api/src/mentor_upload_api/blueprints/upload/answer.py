@@ -6,10 +6,10 @@
 #
 import logging
 import uuid
-from os import environ, listdir, path, makedirs, remove, scandir
-from datetime import datetime
-from dateutil import tz
-from flask import Blueprint, jsonify, request, send_from_directory
+from os import environ, path, makedirs, remove
+from typing import Dict
+from flask import Blueprint, jsonify, request
+from werkzeug.exceptions import BadRequest, NotFound
 from celery import group, chord
 
 
@@ -29,6 +29,24 @@ from mentor_upload_api.authorization_decorator import (
     authorize_to_edit_mentor,
     authorize_to_manage_content,
 )
+from mentor_upload_api.fair_queue import add_pending_job, count_pending_jobs
+from mentor_upload_api.local_pipeline import get_local_pipeline
+from mentor_upload_api.media_download import (
+    is_download_s3_redirect_enabled,
+    redirect_to_s3,
+    send_upload,
+)
+from mentor_upload_api.media_tools import find_duration
+from mentor_upload_api.pipeline import (
+    PipelineStage,
+    is_upload_pipeline_enabled,
+    start_pipeline,
+)
+from mentor_upload_api.profiling import is_profiling_requested
+from mentor_upload_api.streaming_upload import save_upload
+from mentor_upload_api.tracing import traced
+from mentor_upload_api.upload_index import SORT_KEYS, get_upload_index
+from mentor_upload_api.upload_layout import new_upload_path, resolve_upload_path
 from mentor_upload_api.helpers import (
     validate_json_payload_decorator,
     validate_form_payload_decorator,
@@ -48,13 +66,18 @@ def get_upload_root() -> str:
     return environ.get("UPLOAD_ROOT") or "./uploads"
 
 
-def begin_tasks_in_parallel(req):
+@traced("celery.begin_tasks_in_parallel", kind="producer")
+def begin_tasks_in_parallel(req, priority: int = None):
+    if priority is None:
+        priority = mentor_upload_tasks.get_task_priority(
+            mentor_upload_tasks.PRIORITY_LANE_INTERACTIVE
+        )
     parallel_group = group(
         mentor_upload_tasks.tasks.transcode_stage.s(req=req).set(
-            queue=mentor_upload_tasks.get_queue_transcode_stage()
+            queue=mentor_upload_tasks.get_queue_transcode_stage(), priority=priority
         ),
         mentor_upload_tasks.tasks.transcribe_stage.s(req=req).set(
-            queue=mentor_upload_tasks.get_queue_transcribe_stage()
+            queue=mentor_upload_tasks.get_queue_transcribe_stage(), priority=priority
         ),
     )
     my_chord = chord(
@@ -64,7 +87,8 @@ def begin_tasks_in_parallel(req):
                     group(
                         [
                             mentor_upload_tasks.tasks.trim_upload_stage.s(req=req).set(
-                                queue=mentor_upload_tasks.get_queue_trim_upload_stage()
+                                queue=mentor_upload_tasks.get_queue_trim_upload_stage(),
+                                priority=priority,
                             )
                         ]
                     ),
@@ -73,12 +97,58 @@ def begin_tasks_in_parallel(req):
             ]
         ),
         body=mentor_upload_tasks.tasks.finalization_stage.s(req=req).set(
-            queue=mentor_upload_tasks.get_queue_finalization_stage()
+            queue=mentor_upload_tasks.get_queue_finalization_stage(), priority=priority
         ),
     ).on_error(mentor_upload_tasks.tasks.on_chord_error.s())
     return my_chord.delay()
 
 
+@traced("celery.begin_upload_pipeline", kind="producer")
+def begin_upload_pipeline(req, priority: int = None) -> Dict[str, str]:
+    """Same stages as begin_tasks_in_parallel, returns the task id of each stage"""
+    if priority is None:
+        priority = mentor_upload_tasks.get_task_priority(
+            mentor_upload_tasks.PRIORITY_LANE_INTERACTIVE
+        )
+    return start_pipeline(
+        {
+            "trim_upload": PipelineStage(
+                mentor_upload_tasks.tasks.trim_upload_stage,
+                mentor_upload_tasks.get_queue_trim_upload_stage(),
+                priority,
+            ),
+            "transcode": PipelineStage(
+                mentor_upload_tasks.tasks.transcode_stage,
+                mentor_upload_tasks.get_queue_transcode_stage(),
+                priority,
+                deps=["trim_upload"],
+            ),
+            "transcribe": PipelineStage(
+                mentor_upload_tasks.tasks.transcribe_stage,
+                mentor_upload_tasks.get_queue_transcribe_stage(),
+                priority,
+                deps=["trim_upload"],
+            ),
+            "finalization": PipelineStage(
+                mentor_upload_tasks.tasks.finalization_stage,
+                mentor_upload_tasks.get_queue_finalization_stage(),
+                priority,
+                deps=["transcode", "transcribe"],
+            ),
+        },
+        req,
+    )
+
+
+def _probe_duration(file_path: str) -> float:
+    # only used to order jobs, an unreadable file is left for the worker to fail
+    try:
+        return find_duration(file_path)
+    except Exception as x:
+        log.warning("failed to probe duration of %s: %s", file_path, x)
+        return -1.0
+
+
 trim_existing_upload_json_schema = {
     "type": "object",
     "properties": {
@@ -112,8 +182,15 @@ def trim_existing_upload(body):
         "question": question,
         "trim": trim,
     }
+    if is_profiling_requested():
+        req["profile"] = True
     task = mentor_upload_tasks.tasks.trim_existing_upload.apply_async(
-        queue=mentor_upload_tasks.get_queue_trim_upload_stage(), args=[req]
+        queue=mentor_upload_tasks.get_queue_trim_upload_stage(),
+        args=[req],
+        priority=mentor_upload_tasks.get_task_priority(
+            mentor_upload_tasks.PRIORITY_LANE_INTERACTIVE,
+            trim.get("end") - trim.get("start"),
+        ),
     )
     task_list = [
         {
@@ -187,7 +264,7 @@ def upload(body):
     trim = body.get("trim")
     upload_file = request.files["video"]
     root_ext = path.splitext(upload_file.filename)
-    file_name = f"{uuid.uuid4()}-{mentor}-{question}{root_ext[1]}"
+    file_name = new_upload_path(f"{uuid.uuid4()}-{mentor}-{question}{root_ext[1]}")
     file_path = path.join(get_upload_root(), file_name)
     log.info(
         "%s",
@@ -199,41 +276,80 @@ def upload(body):
             "path": file_path,
         },
     )
-    makedirs(get_upload_root(), exist_ok=True)
-    upload_file.save(file_path)
+    makedirs(path.dirname(file_path), exist_ok=True)
+    file_size, file_sha256 = save_upload(upload_file, file_path)
+    log.info("%s", {"path": file_path, "size": file_size, "sha256": file_sha256})
+    ingest = getattr(upload_file.stream, "progressive_ingest", None)
+    # trimmed uploads are cut before encoding, so early outputs are of no use
+    early_media_dir = ingest.finish() if ingest and not trim else ""
+    return process_saved_upload(body, file_name, early_media_dir=early_media_dir)
+
+
+def process_saved_upload(body, file_name: str, early_media_dir: str = ""):
+    """Starts processing of an upload saved as file_name in the upload root"""
+    mentor = body.get("mentor")
+    question = body.get("question")
+    trim = body.get("trim")
+    file_path = path.join(get_upload_root(), file_name)
     req = {
         "mentor": mentor,
         "question": question,
         "video_path": file_name,
         "trim": trim,
     }
-    my_chord = begin_tasks_in_parallel(req)
-
-    task_ids = []
-    for task in my_chord.parent.results:
-        task_ids.append(task.id)  # transcode id, transcribe id
-    for task in my_chord.parent.parent.results:
-        task_ids.append(task.id)  # init_id
-    task_ids.append(my_chord.id)  # finalization id
+    if is_profiling_requested():
+        req["profile"] = True
+    if early_media_dir:
+        req["early_media_dir"] = early_media_dir
+    duration_secs = (
+        trim.get("end") - trim.get("start") if trim else _probe_duration(file_path)
+    )
+    priority = mentor_upload_tasks.get_task_priority(
+        mentor_upload_tasks.PRIORITY_LANE_INTERACTIVE,
+        duration_secs,
+        backlog_jobs=count_pending_jobs(mentor),
+    )
+    local_pipeline = get_local_pipeline()
+    if local_pipeline:
+        stage_task_ids = local_pipeline.submit(req)
+    elif is_upload_pipeline_enabled():
+        # the transcode stage removes the job again once it finishes
+        add_pending_job(mentor, file_name)
+        stage_task_ids = begin_upload_pipeline(req, priority=priority)
+    else:
+        add_pending_job(mentor, file_name)
+        my_chord = begin_tasks_in_parallel(req, priority=priority)
+        stage_task_ids = {
+            "trim_upload": my_chord.parent.parent.results[0].id,
+            "transcode": my_chord.parent.results[0].id,
+            "transcribe": my_chord.parent.results[1].id,
+            "finalization": my_chord.id,
+        }
+    task_ids = [
+        stage_task_ids["transcode"],
+        stage_task_ids["transcribe"],
+        stage_task_ids["trim_upload"],
+        stage_task_ids["finalization"],
+    ]
     task_list = [
         {
             "task_name": "trim_upload",
-            "task_id": my_chord.parent.parent.results[0].id,
+            "task_id": stage_task_ids["trim_upload"],
             "status": "QUEUED",
         },
         {
             "task_name": "transcoding",
-            "task_id": my_chord.parent.results[0].id,
+            "task_id": stage_task_ids["transcode"],
             "status": "QUEUED",
         },
         {
             "task_name": "transcribing",
-            "task_id": my_chord.parent.results[1].id,
+            "task_id": stage_task_ids["transcribe"],
             "status": "QUEUED",
         },
         {
             "task_name": "finalization",
-            "task_id": my_chord.id,
+            "task_id": stage_task_ids["finalization"],
             "status": "QUEUED",
         },
     ]
@@ -257,33 +373,41 @@ def upload(body):
     )
 
 
-def list_files_from_directory(file_directory: str):
-    files = []
-    cali_tz = tz.gettz("America/Los_Angeles")
-    for entry in scandir(file_directory):
-        files.append(
-            {
-                "fileName": entry.name,
-                "size": entry.stat().st_size,
-                "uploadDate": datetime.fromtimestamp(
-                    entry.stat().st_ctime, tz=cali_tz
-                ).strftime("%m/%d/%Y %I:%M:%S %p")
-                + " (PST)",
-            }
+def list_files_from_directory(
+    file_directory: str, sort: str = "-uploadDate", offset: int = 0, limit: int = 0
+):
+    """A page of the uploads in file_directory and their total count"""
+    files, total = get_upload_index(file_directory).list(sort, offset, limit)
+    return [f.to_mounted_file() for f in files], total
+
+
+def mounted_files_page_args():
+    """sort, offset and limit query params of mounted file listings"""
+    try:
+        offset = int(request.args.get("offset") or "0")
+        limit = int(request.args.get("limit") or "0")
+    except ValueError:
+        raise BadRequest("offset and limit must be integers")
+    sort = request.args.get("sort") or "-uploadDate"
+    if offset < 0 or limit < 0 or sort not in SORT_KEYS:
+        raise BadRequest(
+            f"offset and limit must be >= 0, sort one of {', '.join(SORT_KEYS)}"
         )
-    return files
+    return sort, offset, limit
 
 
 @answer_blueprint.route("/mounted_files/", methods=["GET"])
 @answer_blueprint.route("/mounted_files", methods=["GET"])
 @authorize_to_manage_content
 def mounted_files():
+    sort, offset, limit = mounted_files_page_args()
     try:
         file_directory = get_upload_root()
-        files = list_files_from_directory(file_directory)
+        files, total = list_files_from_directory(file_directory, sort, offset, limit)
         return {
             "data": {
                 "mountedFiles": files,
+                "total": total,
             }
         }
     except Exception as x:
@@ -296,8 +420,10 @@ def mounted_files():
 @authorize_to_manage_content
 def remove_mounted_file(file_name: str):
     try:
-        file_path = path.join(get_upload_root(), file_name)
-        remove(file_path)
+        rel_path = resolve_upload_path(get_upload_root(), file_name)
+        if not rel_path:
+            raise FileNotFoundError(file_name)
+        remove(path.join(get_upload_root(), rel_path))
         return {"data": {"fileRemoved": True}}
     except Exception as x:
         logging.error(f"failed to remove file {file_name} from uploads directory")
@@ -309,29 +435,21 @@ def remove_mounted_file(file_name: str):
 @answer_blueprint.route("/download_mounted_file/<file_name>", methods=["GET"])
 @authorize_to_manage_content
 def download_mounted_file(file_name: str):
-    try:
-        file_directory = get_upload_root()
-        return send_from_directory(file_directory, file_name, as_attachment=True)
-    except Exception as x:
-        logging.error(
-            f"failed to find video file {file_name} in folder {file_directory}"
-        )
-        logging.exception(x)
+    file_directory = get_upload_root()
+    rel_path = resolve_upload_path(file_directory, file_name)
+    if not rel_path:
+        raise NotFound(f"no file {file_name} in the uploads directory")
+    return send_upload(file_directory, rel_path)
 
 
 # why not glob *-{mentor}-{question}.mp4
 def full_video_file_name_from_directory(
     mentor: str, question: str, file_directory: str
 ):
-    files = listdir(file_directory)
-    for file_name in files:
-        # video file name format: uuid1-mentorID-questionID.mp4
-        file_name_split = file_name.split("-")
-        file_mentor = file_name_split[-2]
-        file_question = file_name_split[-1].split(".")[0]
-        if file_mentor == mentor and file_question == question:
-            return file_name
-    raise Exception(
+    upload = get_upload_index(file_directory).find(mentor, question)
+    if upload:
+        return upload.rel_path
+    raise NotFound(
         f"Failed to find video file for mentor: {mentor} and question: {question}"
     )
 
@@ -339,17 +457,14 @@ def full_video_file_name_from_directory(
 @answer_blueprint.route("/download_video/<mentor>/<question>/", methods=["GET"])
 @answer_blueprint.route("/download_video/<mentor>/<question>", methods=["GET"])
 def download_video(mentor: str, question: str):
-    try:
-        file_directory = get_upload_root()
-        file_name = full_video_file_name_from_directory(
-            mentor, question, file_directory
+    if is_download_s3_redirect_enabled():
+        # the original the answer-queue pipeline keeps in s3
+        return redirect_to_s3(
+            f"videos/{mentor}/{question}/original.mp4", f"{mentor}-{question}.mp4"
         )
-        return send_from_directory(file_directory, file_name, as_attachment=True)
-    except Exception as x:
-        logging.error(
-            f"failed to find video file for mentor: {mentor} and question: {question} in folder {file_directory}"
-        )
-        logging.exception(x)
+    file_directory = get_upload_root()
+    file_name = full_video_file_name_from_directory(mentor, question, file_directory)
+    return send_upload(file_directory, file_name)
 
 
 cancel_upload_json_schema = {
@@ -373,6 +488,12 @@ def cancel(body):
     question = body.get("question")
     task_id_list = body.get("task_ids_to_cancel")
 
+    local_pipeline = get_local_pipeline()
+    if local_pipeline:
+        for task_id in task_id_list:
+            local_pipeline.cancel(task_id)
+        return jsonify({"data": {"id": None, "cancelledIds": task_id_list}})
+
     task_list = []
 
     for task_id in task_id_list:
@@ -390,6 +511,19 @@ def cancel(body):
 @answer_blueprint.route("/status/<task_name>/<task_id>/", methods=["GET"])
 @answer_blueprint.route("/status/<task_name>/<task_id>", methods=["GET"])
 def task_status(task_name: str, task_id: str):
+    local_pipeline = get_local_pipeline()
+    if local_pipeline:
+        t = local_pipeline.task_state(task_id)
+        return jsonify(
+            {
+                "data": {
+                    "id": task_id,
+                    "state": t.state,
+                    "status": t.state,
+                    "info": t.info,
+                }
+            }
+        )
     if task_name == "transcribe":
         t = mentor_upload_tasks.tasks.transcribe_stage.AsyncResult(task_id)
     elif task_name == "transcode":
@@ -441,7 +575,11 @@ def regen_vtt(body):
         "question": question,
     }
     task = mentor_upload_tasks.tasks.regen_vtt.apply_async(
-        queue=mentor_upload_tasks.get_queue_trim_upload_stage(), args=[req]
+        queue=mentor_upload_tasks.get_queue_trim_upload_stage(),
+        args=[req],
+        priority=mentor_upload_tasks.get_task_priority(
+            mentor_upload_tasks.PRIORITY_LANE_INTERACTIVE, 0
+        ),
     )
     result = task.wait(timeout=None, interval=0.5)
 
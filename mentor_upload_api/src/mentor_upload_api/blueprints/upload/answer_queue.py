@@ -4,18 +4,19 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
-from datetime import datetime
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import copy
 import tempfile
-from dateutil import tz
-import json
 import logging
+import threading
 import uuid
-import boto3
+from botocore.exceptions import ClientError
 import os
-import ffmpy
-from typing import Tuple, Union
-from os import environ, path, makedirs, remove, scandir
-from flask import Blueprint, jsonify, request, send_from_directory
+from typing import List
+from os import environ, path, makedirs, remove
+from flask import Blueprint, jsonify, request
 from mentor_upload_api.api import (
     AnswerUpdateRequest,
     FetchUploadTaskReq,
@@ -24,7 +25,11 @@ from mentor_upload_api.api import (
     upload_answer_and_task_update,
     fetch_answer_transcript_and_media,
 )
-from mentor_upload_api.blueprints.upload.answer import video_upload_json_schema
+from mentor_upload_api.blueprints.upload.answer import (
+    list_files_from_directory,
+    mounted_files_page_args,
+    video_upload_json_schema,
+)
 from mentor_upload_api.helpers import (
     validate_form_payload_decorator,
     validate_json_payload_decorator,
@@ -35,45 +40,36 @@ from mentor_upload_api.authorization_decorator import (
     authorize_to_edit_mentor,
 )
 from pymediainfo import MediaInfo
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, NotFound
 from flask_wtf import FlaskForm
 from wtforms import StringField
 from wtforms.validators import DataRequired
 from flask_wtf.file import FileRequired, FileAllowed, FileField
 
-from mentor_upload_api.media_tools import transcript_to_vtt
+from mentor_upload_api import aws
+from mentor_upload_api.job_submitter import (
+    JobSubmitter,
+    create_job_topic,
+    get_job_submit_exit_flush_secs,
+    get_job_submit_max_retries,
+    get_job_submit_retry_secs,
+)
+from mentor_upload_api.media_download import send_upload
+from mentor_upload_api.media_tools import transcript_to_vtt, video_trim_copy
+from mentor_upload_api.streaming_upload import get_upload_max_bytes, save_upload
+from mentor_upload_api.tracing import span, traced
+from mentor_upload_api.upload_layout import new_upload_path, resolve_upload_path
 
 log = logging.getLogger()
 answer_queue_blueprint = Blueprint("answer-queue", __name__)
 
 
-def _require_env(n: str) -> str:
-    env_val = os.environ.get(n, "")
-    if not env_val:
-        raise EnvironmentError(f"missing required env var {n}")
-    return env_val
+def s3_client():
+    return aws.get_client("s3")
 
 
-static_s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
-log.info("using s3 bucket %s", static_s3_bucket)
-s3_client = boto3.client(
-    "s3",
-    region_name=_require_env("STATIC_AWS_REGION"),
-    aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
-)
-sns = boto3.client(
-    "sns",
-    region_name=os.environ.get("STATIC_AWS_REGION"),
-    aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
-)
-ssm = boto3.client(
-    "ssm",
-    region_name=os.environ.get("STATIC_AWS_REGION"),
-    aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
-)
+def get_presigned_upload_expires_secs() -> int:
+    return int(environ.get("PRESIGNED_UPLOAD_EXPIRES_SECS") or "3600")
 
 
 def _to_status_url(root: str, id: str) -> str:
@@ -84,49 +80,31 @@ def get_upload_root() -> str:
     return environ.get("UPLOAD_ROOT") or "./uploads"
 
 
-def format_secs(secs: Union[float, int, str]) -> str:
-    return f"{float(str(secs)):.3f}"
-
-
-def output_args_trim_video(start_secs: float, end_secs: float) -> Tuple[str, ...]:
-    return (
-        "-ss",
-        format_secs(start_secs),
-        "-to",
-        format_secs(end_secs),
-        "-c:v",
-        "libx264",
-        "-crf",
-        "30",
-    )
+_job_submitter = None
+_job_submitter_lock = threading.Lock()
 
 
-def video_trim(
-    input_file: str, output_file: str, start_secs: float, end_secs: float
-) -> None:
-    log.info("%s, %s, %s-%s", input_file, output_file, start_secs, end_secs)
-    # couldnt get to output to stdout like here
-    # https://aws.amazon.com/blogs/media/processing-user-generated-content-using-aws-lambda-and-ffmpeg/
-    ff = ffmpy.FFmpeg(
-        inputs={str(input_file): None},
-        outputs={str(output_file): output_args_trim_video(start_secs, end_secs)},
-    )
-    ff.run()
-    log.debug(ff)
+def get_job_submitter() -> JobSubmitter:
+    global _job_submitter
+    with _job_submitter_lock:
+        if _job_submitter is None:
+            _job_submitter = JobSubmitter(
+                create_job_topic(aws.get_client("sns"), aws.get_client("ssm")),
+                on_failed=_fail_upload_tasks,
+                max_retries=get_job_submit_max_retries(),
+                retry_secs=get_job_submit_retry_secs(),
+            )
+            # gunicorn recycles workers, queued jobs must not vanish with them
+            atexit.register(_job_submitter.close, get_job_submit_exit_flush_secs())
+        return _job_submitter
 
 
 def submit_job(req):
-    arn_param = f"/mentorpal/{os.environ.get('STAGE')}/shared/upload_sns_arn"
-    response = ssm.get_parameters(Names=[arn_param], WithDecryption=False)
-    log.debug("ssm response %s", response)
-    upload_arn = response["Parameters"][0]["Value"]
-    log.info("publishing job request to %s", upload_arn)
-    # todo test failure if we need to check sns_msg.ResponseMetadata.HTTPStatusCode != 200
-    sns_msg = sns.publish(TopicArn=upload_arn, Message=json.dumps(req))
-    log.info("sns message published %s", json.dumps(sns_msg))
+    """Queues a job request, it is published to the upload topic in the background"""
+    get_job_submitter().submit(req)
 
 
-def create_task_list(trim, has_edited_transcript):
+def create_task_list(trim, has_edited_transcript, trim_status: str = "DONE"):
     transcode_web_task = {
         "task_name": "transcoding-web",
         "task_id": str(uuid.uuid4()),
@@ -150,7 +128,7 @@ def create_task_list(trim, has_edited_transcript):
         {
             "task_name": "trim-upload",
             "task_id": str(uuid.uuid4()),
-            "status": "DONE",  # should this even be a task because it's done here anyways
+            "status": trim_status,  # DONE when the api trimmed the upload itself
         }
         if trim
         else None
@@ -159,18 +137,22 @@ def create_task_list(trim, has_edited_transcript):
     return transcode_web_task, transcode_mobile_task, transcribe_task, trim_upload_task
 
 
+def delete_video_artifacts(s3_path: str, names: List[str]) -> None:
+    s3_client().delete_objects(
+        Bucket=aws.get_static_s3_bucket(),
+        Delete={"Objects": [{"Key": f"{s3_path}/{name}"} for name in names]},
+    )
+
+
+@traced("s3.upload_original")
 def upload_to_s3(file_path, s3_path):
     log.info("uploading %s to %s", file_path, s3_path)
     # to prevent data inconsistency by partial failures (new web.mp3 - old transcript...)
-    all_artifacts = ["original.mp4", "web.mp4", "mobile.mp4", "en.vtt"]
-    s3_client.delete_objects(
-        Bucket=static_s3_bucket,
-        Delete={"Objects": [{"Key": f"{s3_path}/{name}"} for name in all_artifacts]},
-    )
+    delete_video_artifacts(s3_path, ["original.mp4", "web.mp4", "mobile.mp4", "en.vtt"])
 
-    s3_client.upload_file(
+    s3_client().upload_file(
         file_path,
-        static_s3_bucket,
+        aws.get_static_s3_bucket(),
         f"{s3_path}/original.mp4",
         ExtraArgs={"ContentType": "video/mp4"},
     )
@@ -182,6 +164,161 @@ def verify_no_upload_in_progress(mentor, question):
         raise BadRequest("There is an upload already in progress, please wait.")
 
 
+def submit_upload_job(
+    mentor: str,
+    question: str,
+    trim,
+    has_edited_transcript: bool,
+    trim_in_job: bool = False,
+):
+    """
+    Records the task list of an original.mp4 that is in s3 and submits its job,
+    returns the task list. With trim_in_job the job trims the original
+    """
+    job_req, task_list = record_upload_tasks(
+        mentor, question, trim, has_edited_transcript, trim_in_job=trim_in_job
+    )
+    submit_job(job_req)
+    return task_list
+
+
+def record_upload_tasks(
+    mentor: str,
+    question: str,
+    trim,
+    has_edited_transcript: bool,
+    trim_in_job: bool = False,
+    trim_status: str = "",
+):
+    """
+    Records the queued tasks of an upload, returns its job request and task list.
+    The trim task is QUEUED when the job trims, otherwise DONE unless trim_status is given
+    """
+    s3_path = f"videos/{mentor}/{question}"
+    (
+        transcode_web_task,
+        transcode_mobile_task,
+        transcribe_task,
+        trim_upload_task,
+    ) = create_task_list(
+        trim,
+        has_edited_transcript,
+        trim_status=trim_status or ("QUEUED" if trim_in_job else "DONE"),
+    )
+    task_list = [transcode_web_task, transcode_mobile_task]
+    if transcribe_task is not None:
+        task_list.append(transcribe_task)
+    if trim_upload_task is not None:
+        task_list.append(trim_upload_task)
+
+    req = {
+        "request": {
+            "mentor": mentor,
+            "question": question,
+            "video": f"{s3_path}/original.mp4",
+            "transcodeWebTask": transcode_web_task,
+            "transcodeMobileTask": transcode_mobile_task,
+            "trimUploadTask": trim_upload_task,
+            "transcribeTask": transcribe_task,
+        }
+    }
+    if trim_in_job:
+        req["request"]["trim"] = trim
+
+    original_video_url = get_original_video_url(mentor, question)
+    # we risk here overriding values, perhaps processing was already done, so status is DONE
+    # but this will overwrite and revert them back to QUEUED. Can we just append?
+    upload_answer_and_task_update(
+        AnswerUpdateRequest(mentor=mentor, question=question, transcript=""),
+        UploadTaskRequest(
+            mentor=mentor,
+            question=question,
+            transcode_web_task=transcode_web_task,
+            transcode_mobile_task=transcode_mobile_task,
+            trim_upload_task=trim_upload_task,
+            transcribe_task=transcribe_task,
+            transcript="",
+            original_media={
+                "type": "video",
+                "tag": "original",
+                "url": original_video_url,
+            },
+        ),
+    )
+    return req, task_list
+
+
+def _update_upload_tasks(job_req) -> None:
+    r = job_req["request"]
+    upload_answer_and_task_update(
+        AnswerUpdateRequest(mentor=r["mentor"], question=r["question"], transcript=""),
+        UploadTaskRequest(
+            mentor=r["mentor"],
+            question=r["question"],
+            transcode_web_task=r["transcodeWebTask"],
+            transcode_mobile_task=r["transcodeMobileTask"],
+            trim_upload_task=r["trimUploadTask"],
+            transcribe_task=r["transcribeTask"],
+            transcript="",
+        ),
+    )
+
+
+def _fail_upload_tasks(job_req) -> None:
+    r = job_req["request"]
+    for task in (
+        r["transcodeWebTask"],
+        r["transcodeMobileTask"],
+        r["trimUploadTask"],
+        r["transcribeTask"],
+    ):
+        if task is not None:
+            task["status"] = "FAILED"
+    _update_upload_tasks(job_req)
+
+
+def admit_upload(file_path: str, s3_path: str, job_req, trim=None) -> None:
+    """
+    Trims a validated upload (stream copy), moves it to s3 and submits its job,
+    runs after the response
+    """
+    trim_file = ""
+    try:
+        if trim:
+            trim_file = f"{file_path}-trim.mp4"
+            video_trim_copy(file_path, trim_file, trim["start"], trim["end"])
+        upload_to_s3(trim_file or file_path, s3_path)
+        if trim:
+            job_req["request"]["trimUploadTask"]["status"] = "DONE"
+            _update_upload_tasks(job_req)
+        submit_job(job_req)
+    except Exception as x:
+        log.exception("failed to admit upload %s: %s", file_path, x)
+        try:
+            _fail_upload_tasks(job_req)
+        except Exception as update_err:
+            log.exception("failed to mark upload tasks failed: %s", update_err)
+    finally:
+        if trim_file and path.exists(trim_file):
+            remove(trim_file)
+
+
+_admission_executor = None
+
+
+def get_admission_threads() -> int:
+    return int(environ.get("ANSWER_QUEUE_ADMISSION_THREADS") or "2")
+
+
+def _get_admission_executor() -> ThreadPoolExecutor:
+    global _admission_executor
+    if _admission_executor is None:
+        _admission_executor = ThreadPoolExecutor(
+            max_workers=get_admission_threads(), thread_name_prefix="upload-admission"
+        )
+    return _admission_executor
+
+
 # Flask-WTF form: defines schema for multipart/form-data request
 class UploadVideoFormSchema(FlaskForm):
     body = StringField(
@@ -208,12 +345,11 @@ def upload(body):
 
     mentor = body.get("mentor")
     question = body.get("question")
-    has_edited_transcript = body.get("hasEditedTranscript")
     verify_no_upload_in_progress(mentor, question)
     trim = body.get("trim")
     upload_file = request.files["video"]
     root_ext = path.splitext(upload_file.filename)
-    file_name = f"{uuid.uuid4()}-{mentor}-{question}{root_ext[1]}"
+    file_name = new_upload_path(f"{uuid.uuid4()}-{mentor}-{question}{root_ext[1]}")
     file_path = path.join(get_upload_root(), file_name)
     log.info(
         "%s",
@@ -225,9 +361,26 @@ def upload(body):
             "path": file_path,
         },
     )
-    makedirs(get_upload_root(), exist_ok=True)
-    upload_file.save(file_path)
-    minfo = MediaInfo.parse(file_path)
+    makedirs(path.dirname(file_path), exist_ok=True)
+    file_size, file_sha256 = save_upload(upload_file, file_path)
+    log.info("%s", {"path": file_path, "size": file_size, "sha256": file_sha256})
+    return process_saved_upload(body, file_name)
+
+
+def process_saved_upload(body, file_name: str):
+    """
+    Validates an upload saved as file_name in the upload root from its header
+    and queues its job. The trim and s3 upload run in the background, so the
+    request doesn't take longer with the video's length
+    """
+    mentor = body.get("mentor")
+    question = body.get("question")
+    has_edited_transcript = body.get("hasEditedTranscript")
+    trim = body.get("trim")
+    file_path = path.join(get_upload_root(), file_name)
+    with span("mediainfo.parse", kind="internal"):
+        # moov/metadata only, duration comes from the header
+        minfo = MediaInfo.parse(file_path, parse_speed=0)
     if len(minfo.video_tracks) == 0:
         raise BadRequest("No video tracks found!")
     try:
@@ -235,67 +388,176 @@ def upload(body):
             raise BadRequest("Video too short!")
     except Exception as e:
         log.info(f"Failed to check video duration: {e}")
-
-    if trim:
-        log.info("trimming file %s", trim)
-        trim_file = f"{file_path}-trim.mp4"
-        video_trim(
-            file_path,
-            trim_file,
-            trim["start"],
-            trim["end"],
-        )
-        file_path = trim_file  # from now on work with the trimmed file
+    if trim and trim["start"] >= trim["end"]:
+        raise BadRequest("Trim start must be before its end!")
 
     s3_path = f"videos/{mentor}/{question}"
-    upload_to_s3(file_path, s3_path)
+    job_req, task_list = record_upload_tasks(
+        mentor, question, trim, has_edited_transcript, trim_status="QUEUED"
+    )
+    # the background step updates its task statuses while task_list is sent
+    _get_admission_executor().submit(
+        copy_context().run,
+        admit_upload,
+        file_path,
+        s3_path,
+        copy.deepcopy(job_req),
+        trim,
+    )
 
-    (
-        transcode_web_task,
-        transcode_mobile_task,
-        transcribe_task,
-        trim_upload_task,
-    ) = create_task_list(trim, has_edited_transcript)
-    task_list = [transcode_web_task, transcode_mobile_task]
-    if transcribe_task is not None:
-        task_list.append(transcribe_task)
-    if trim_upload_task is not None:
-        task_list.append(trim_upload_task)
+    return jsonify(
+        {
+            "data": {
+                "taskList": task_list,
+                "statusUrl": _to_status_url(request.url_root, str(uuid.uuid4())),
+            }
+        }
+    )
 
-    req = {
-        "request": {
-            "mentor": mentor,
-            "question": question,
-            "video": f"{s3_path}/original.mp4",
-            "transcodeWebTask": transcode_web_task,
-            "transcodeMobileTask": transcode_mobile_task,
-            "trimUploadTask": trim_upload_task,
-            "transcribeTask": transcribe_task,
+
+presigned_upload_start_json_schema = {
+    "type": "object",
+    "properties": {
+        "mentor": {"type": "string", "maxLength": 60, "minLength": 5},
+        "question": {"type": "string", "maxLength": 60, "minLength": 5},
+        # s3 parts are 5MB-5GB (except the last one), at most 10000 of them
+        "parts": {"type": "integer", "minimum": 1, "maximum": 10000},
+    },
+    "required": ["mentor", "question", "parts"],
+    "additionalProperties": False,
+}
+
+
+@answer_queue_blueprint.route("/presigned/start/", methods=["POST"])
+@answer_queue_blueprint.route("/presigned/start", methods=["POST"])
+@validate_json_payload_decorator(json_schema=presigned_upload_start_json_schema)
+@authorize_to_edit_mentor
+def presigned_upload_start(body):
+    """Starts an s3 multipart upload of the original video, the client PUTs each part to its url"""
+    mentor = body.get("mentor")
+    question = body.get("question")
+    verify_no_upload_in_progress(mentor, question)
+    key = f"videos/{mentor}/{question}/original.mp4"
+    s3 = s3_client()
+    s3_bucket = aws.get_static_s3_bucket()
+    with span("s3.create_multipart_upload", kind="client"):
+        multipart_upload = s3.create_multipart_upload(
+            Bucket=s3_bucket, Key=key, ContentType="video/mp4"
+        )
+    upload_id = multipart_upload["UploadId"]
+    expires_secs = get_presigned_upload_expires_secs()
+    part_urls = [
+        {
+            "partNumber": part_number,
+            "url": s3.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": s3_bucket,
+                    "Key": key,
+                    "UploadId": upload_id,
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=expires_secs,
+            ),
         }
-    }
+        for part_number in range(1, body.get("parts") + 1)
+    ]
+    return jsonify(
+        {
+            "data": {
+                "uploadId": upload_id,
+                "key": key,
+                "parts": part_urls,
+                "expiresIn": expires_secs,
+            }
+        }
+    )
 
-    original_video_url = get_original_video_url(mentor, question)
-    # we risk here overriding values, perhaps processing was already done, so status is DONE
-    # but this will overwrite and revert them back to QUEUED. Can we just append?
-    upload_answer_and_task_update(
-        AnswerUpdateRequest(mentor=mentor, question=question, transcript=""),
-        UploadTaskRequest(
-            mentor=mentor,
-            question=question,
-            transcode_web_task=transcode_web_task,
-            transcode_mobile_task=transcode_mobile_task,
-            trim_upload_task=trim_upload_task,
-            transcribe_task=transcribe_task,
-            transcript="",
-            original_media={
-                "type": "video",
-                "tag": "original",
-                "url": original_video_url,
+
+presigned_upload_complete_json_schema = {
+    "type": "object",
+    "properties": {
+        "mentor": {"type": "string", "maxLength": 60, "minLength": 5},
+        "question": {"type": "string", "maxLength": 60, "minLength": 5},
+        "uploadId": {"type": "string", "minLength": 1},
+        "parts": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "partNumber": {"type": "integer", "minimum": 1},
+                    "etag": {"type": "string", "minLength": 1},
+                },
+                "required": ["partNumber", "etag"],
             },
-        ),
-    )
-    submit_job(req)
+        },
+        "trim": {
+            "type": "object",
+            "properties": {
+                "start": {"type": "number", "minimum": 0},
+                "end": {"type": "number", "exclusiveMinimum": 0},
+            },
+            "required": ["start", "end"],
+        },
+        "hasEditedTranscript": {"type": "boolean"},
+    },
+    "required": ["mentor", "question", "uploadId", "parts"],
+    "additionalProperties": False,
+}
+
 
+@answer_queue_blueprint.route("/presigned/complete/", methods=["POST"])
+@answer_queue_blueprint.route("/presigned/complete", methods=["POST"])
+@validate_json_payload_decorator(json_schema=presigned_upload_complete_json_schema)
+@authorize_to_edit_mentor
+def presigned_upload_complete(body):
+    """Completes a presigned multipart upload, validates the object and submits its job"""
+    mentor = body.get("mentor")
+    question = body.get("question")
+    upload_id = body.get("uploadId")
+    s3_path = f"videos/{mentor}/{question}"
+    key = f"{s3_path}/original.mp4"
+    try:
+        with span("s3.complete_multipart_upload", kind="client"):
+            s3_client().complete_multipart_upload(
+                Bucket=aws.get_static_s3_bucket(),
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    "Parts": [
+                        {"PartNumber": p["partNumber"], "ETag": p["etag"]}
+                        for p in sorted(
+                            body.get("parts"), key=lambda p: p["partNumber"]
+                        )
+                    ]
+                },
+            )
+    except ClientError as x:
+        log.warning("failed to complete multipart upload %s: %s", upload_id, x)
+        s3_client().abort_multipart_upload(
+            Bucket=aws.get_static_s3_bucket(), Key=key, UploadId=upload_id
+        )
+        raise BadRequest("Upload could not be completed, please upload again.")
+    with span("s3.head_object", kind="client"):
+        head = s3_client().head_object(Bucket=aws.get_static_s3_bucket(), Key=key)
+    size = head.get("ContentLength", 0)
+    max_bytes = get_upload_max_bytes()
+    if size == 0 or (max_bytes and size > max_bytes):
+        s3_client().delete_object(Bucket=aws.get_static_s3_bucket(), Key=key)
+        raise BadRequest(f"Invalid upload size {size}")
+    log.info("%s", {"key": key, "size": size, "etag": head.get("ETag")})
+    # only once the new original is in place: original.mp4 itself was
+    # replaced by the completed upload, its derived media are now stale
+    delete_video_artifacts(s3_path, ["web.mp4", "mobile.mp4", "en.vtt"])
+    # the api never has the video, so trimming is left to the job
+    task_list = submit_upload_job(
+        mentor,
+        question,
+        body.get("trim"),
+        body.get("hasEditedTranscript"),
+        trim_in_job=True,
+    )
     return jsonify(
         {
             "data": {
@@ -311,33 +573,18 @@ def get_original_video_url(mentor: str, question: str) -> str:
     return f"{base_url}/videos/{mentor}/{question}/original.mp4"
 
 
-def list_files_from_directory(file_directory: str):
-    files = []
-    cali_tz = tz.gettz("America/Los_Angeles")
-    for entry in scandir(file_directory):
-        files.append(
-            {
-                "fileName": entry.name,
-                "size": entry.stat().st_size,
-                "uploadDate": datetime.fromtimestamp(
-                    entry.stat().st_ctime, tz=cali_tz
-                ).strftime("%m/%d/%Y %I:%M:%S %p")
-                + " (PST)",
-            }
-        )
-    return files
-
-
 @answer_queue_blueprint.route("/mounted_files/", methods=["GET"])
 @answer_queue_blueprint.route("/mounted_files", methods=["GET"])
 @authorize_to_manage_content
 def mounted_files():
+    sort, offset, limit = mounted_files_page_args()
     try:
         file_directory = get_upload_root()
-        files = list_files_from_directory(file_directory)
+        files, total = list_files_from_directory(file_directory, sort, offset, limit)
         return {
             "data": {
                 "mountedFiles": files,
+                "total": total,
             }
         }
     except Exception as x:
@@ -350,8 +597,10 @@ def mounted_files():
 @authorize_to_manage_content
 def remove_mounted_file(file_name: str):
     try:
-        file_path = path.join(get_upload_root(), file_name)
-        remove(file_path)
+        rel_path = resolve_upload_path(get_upload_root(), file_name)
+        if not rel_path:
+            raise FileNotFoundError(file_name)
+        remove(path.join(get_upload_root(), rel_path))
         return {"data": {"fileRemoved": True}}
     except Exception as x:
         logging.error(f"failed to remove file {file_name} from uploads directory")
@@ -363,14 +612,11 @@ def remove_mounted_file(file_name: str):
 @answer_queue_blueprint.route("/download_mounted_file/<file_name>", methods=["GET"])
 @authorize_to_manage_content
 def download_mounted_file(file_name: str):
-    try:
-        file_directory = get_upload_root()
-        return send_from_directory(file_directory, file_name, as_attachment=True)
-    except Exception as x:
-        logging.error(
-            f"failed to find video file {file_name} in folder {file_directory}"
-        )
-        logging.exception(x)
+    file_directory = get_upload_root()
+    rel_path = resolve_upload_path(file_directory, file_name)
+    if not rel_path:
+        raise NotFound(f"no file {file_name} in the uploads directory")
+    return send_upload(file_directory, rel_path)
 
 
 regen_vtt_json_schema = {
@@ -413,12 +659,13 @@ def _regen_vtt(mentor: str, question: str):
             video_path_base = f"videos/{mentor}/{question}/"
             if path.isfile(vtt_file_path):
                 item_path = f"{video_path_base}en.vtt"
-                s3_client.upload_file(
-                    str(vtt_file_path),
-                    static_s3_bucket,
-                    item_path,
-                    ExtraArgs={"ContentType": "text/vtt"},
-                )
+                with span("s3.upload_file", kind="client", key=item_path):
+                    s3_client().upload_file(
+                        str(vtt_file_path),
+                        aws.get_static_s3_bucket(),
+                        item_path,
+                        ExtraArgs={"ContentType": "text/vtt"},
+                    )
             else:
                 raise Exception(f"Failed to find vtt file at {vtt_file_path}")
             return {"regen_vtt": True}
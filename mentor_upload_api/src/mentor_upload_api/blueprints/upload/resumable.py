@@ -0,0 +1,260 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Resumable answer uploads (modelled on tus): the client creates an upload,
+PATCHes chunks at the current offset (optionally with a sha256 per chunk),
+asks for the offset after a disconnect and finalizes, which hands the file to
+the same processing as a regular upload
+"""
+import base64
+import fcntl
+import hashlib
+import json
+import logging
+import time
+import uuid
+from os import environ, makedirs, path, remove, replace, scandir, utime
+from typing import Optional
+
+from flask import Blueprint, jsonify, make_response, request
+from werkzeug.exceptions import BadRequest, Conflict, NotFound, RequestEntityTooLarge
+
+from mentor_upload_api.blueprints.upload import answer, answer_queue
+from mentor_upload_api.authorization_decorator import (
+    authorize_to_edit_mentor,
+    verify_can_edit_mentor,
+)
+from mentor_upload_api.helpers import validate_json_payload_decorator
+from mentor_upload_api.streaming_upload import get_upload_max_bytes, get_upload_root
+from mentor_upload_api.upload_layout import new_upload_path
+
+log = logging.getLogger()
+resumable_upload_blueprint = Blueprint("resumable-upload", __name__)
+
+UPLOAD_OFFSET_HEADER = "Upload-Offset"
+UPLOAD_LENGTH_HEADER = "Upload-Length"
+UPLOAD_CHECKSUM_HEADER = "Upload-Checksum"
+# tus status for a chunk that does not match its checksum
+CHECKSUM_MISMATCH_STATUS = 460
+
+
+def get_resumable_upload_dir() -> str:
+    return path.join(get_upload_root(), ".resumable")
+
+
+def get_resumable_upload_ttl_secs() -> int:
+    return int(environ.get("RESUMABLE_UPLOAD_TTL_SECS") or "86400")
+
+
+def get_resumable_upload_max_chunk_bytes() -> int:
+    return int(environ.get("RESUMABLE_UPLOAD_MAX_CHUNK_BYTES") or str(64 * 1024**2))
+
+
+def _state_path(upload_id: str) -> str:
+    return path.join(get_resumable_upload_dir(), f"{upload_id}.json")
+
+
+def _data_path(upload_id: str) -> str:
+    return path.join(get_resumable_upload_dir(), f"{upload_id}.part")
+
+
+def _delete_upload(upload_id: str) -> None:
+    for p in [_state_path(upload_id), _data_path(upload_id)]:
+        if path.exists(p):
+            remove(p)
+
+
+def _delete_expired_uploads() -> None:
+    expired = time.time() - get_resumable_upload_ttl_secs()
+    for entry in scandir(get_resumable_upload_dir()):
+        if entry.name.endswith(".json") and entry.stat().st_mtime < expired:
+            log.info("deleting expired resumable upload %s", entry.name)
+            _delete_upload(entry.name[: -len(".json")])
+
+
+def _load_upload(upload_id: str) -> dict:
+    try:
+        uuid.UUID(upload_id)
+        with open(_state_path(upload_id)) as f:
+            state = json.load(f)
+    except (ValueError, OSError):
+        raise NotFound(f"no upload {upload_id}")
+    verify_can_edit_mentor(state["body"]["mentor"])
+    return state
+
+
+def _offset(upload_id: str) -> int:
+    return path.getsize(_data_path(upload_id))
+
+
+def _upload_status(upload_id: str, state: dict, status: int = 200):
+    offset = _offset(upload_id)
+    res = make_response(
+        jsonify(
+            {"data": {"uploadId": upload_id, "offset": offset, "size": state["size"]}}
+        ),
+        status,
+    )
+    res.headers[UPLOAD_OFFSET_HEADER] = str(offset)
+    res.headers[UPLOAD_LENGTH_HEADER] = str(state["size"])
+    res.headers["Cache-Control"] = "no-store"
+    return res
+
+
+def _parse_checksum(header: str) -> Optional[bytes]:
+    if not header:
+        return None
+    algorithm, _, digest = header.partition(" ")
+    if algorithm.lower() != "sha256":
+        raise BadRequest(f"unsupported checksum algorithm {algorithm}")
+    try:
+        return base64.b64decode(digest, validate=True)
+    except ValueError:
+        raise BadRequest("invalid checksum")
+
+
+resumable_upload_create_json_schema = {
+    "type": "object",
+    "properties": {
+        "mentor": {"type": "string", "maxLength": 60, "minLength": 5},
+        "question": {"type": "string", "maxLength": 60, "minLength": 5},
+        "trim": {
+            "type": "object",
+            "properties": {
+                "start": {"type": "number", "minimum": 0},
+                "end": {"type": "number", "exclusiveMinimum": 0},
+            },
+            "required": ["start", "end"],
+        },
+        "hasEditedTranscript": {"type": "boolean"},
+        "fileName": {"type": "string", "pattern": "\\.(mp3|mp4)$"},
+        "size": {"type": "integer", "minimum": 1},
+        "sha256": {"type": "string", "pattern": "^[0-9a-f]{64}$"},
+    },
+    "required": ["mentor", "question", "fileName", "size"],
+    "additionalProperties": False,
+}
+
+
+@resumable_upload_blueprint.route("/", methods=["POST"])
+@resumable_upload_blueprint.route("", methods=["POST"])
+@validate_json_payload_decorator(json_schema=resumable_upload_create_json_schema)
+@authorize_to_edit_mentor
+def create(body):
+    max_bytes = get_upload_max_bytes()
+    if max_bytes and body["size"] > max_bytes:
+        raise RequestEntityTooLarge(f"upload is larger than {max_bytes} bytes")
+    makedirs(get_resumable_upload_dir(), exist_ok=True)
+    _delete_expired_uploads()
+    upload_id = str(uuid.uuid4())
+    open(_data_path(upload_id), "wb").close()
+    state = {
+        "body": {
+            k: v for k, v in body.items() if k not in ["fileName", "size", "sha256"]
+        },
+        "ext": path.splitext(body["fileName"])[1],
+        "size": body["size"],
+        "sha256": body.get("sha256", ""),
+    }
+    with open(_state_path(upload_id), "w") as f:
+        json.dump(state, f)
+    log.info("created resumable upload %s: %s", upload_id, state)
+    res = _upload_status(upload_id, state, 201)
+    res.headers["Location"] = f"{request.base_url.rstrip('/')}/{upload_id}"
+    return res
+
+
+@resumable_upload_blueprint.route("/<upload_id>", methods=["GET", "HEAD"])
+def offset(upload_id: str):
+    return _upload_status(upload_id, _load_upload(upload_id))
+
+
+@resumable_upload_blueprint.route("/<upload_id>", methods=["PATCH"])
+def append(upload_id: str):
+    """Appends the request body at Upload-Offset, which must be the current offset"""
+    state = _load_upload(upload_id)
+    try:
+        chunk_offset = int(request.headers[UPLOAD_OFFSET_HEADER])
+    except (KeyError, ValueError):
+        raise BadRequest(f"missing or invalid {UPLOAD_OFFSET_HEADER} header")
+    expected_sha256 = _parse_checksum(request.headers.get(UPLOAD_CHECKSUM_HEADER, ""))
+    chunk_bytes = request.content_length or 0
+    if chunk_bytes > get_resumable_upload_max_chunk_bytes():
+        raise RequestEntityTooLarge("chunk too large")
+    if chunk_offset + chunk_bytes > state["size"]:
+        raise RequestEntityTooLarge("chunk goes past the end of the upload")
+    with open(_data_path(upload_id), "r+b") as f:
+        # one writer per upload, a retried chunk may race its timed out original
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0, 2)
+        if f.tell() != chunk_offset:
+            raise Conflict(f"upload is at offset {f.tell()}, not {chunk_offset}")
+        sha256 = hashlib.sha256()
+        written = 0
+        while written < chunk_bytes:
+            block = request.stream.read(min(1024 * 1024, chunk_bytes - written))
+            if not block:
+                break
+            sha256.update(block)
+            written += f.write(block)
+        if expected_sha256 is not None and sha256.digest() != expected_sha256:
+            f.truncate(chunk_offset)
+            return (
+                jsonify({"error": "ChecksumMismatch", "message": "chunk is corrupt"}),
+                CHECKSUM_MISMATCH_STATUS,
+            )
+    # the state file's mtime tracks activity for expiry
+    utime(_state_path(upload_id))
+    res = make_response("", 204)
+    res.headers[UPLOAD_OFFSET_HEADER] = str(chunk_offset + written)
+    return res
+
+
+@resumable_upload_blueprint.route("/<upload_id>", methods=["DELETE"])
+def abort_upload(upload_id: str):
+    _load_upload(upload_id)
+    _delete_upload(upload_id)
+    return make_response("", 204)
+
+
+def _file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _is_queue_mode() -> bool:
+    # same processing as a regular upload to /upload/answer
+    return environ.get("UPLOAD_ANSWER_VERSION", "queue") == "queue"
+
+
+@resumable_upload_blueprint.route("/<upload_id>/finalize/", methods=["POST"])
+@resumable_upload_blueprint.route("/<upload_id>/finalize", methods=["POST"])
+def finalize(upload_id: str):
+    state = _load_upload(upload_id)
+    offset = _offset(upload_id)
+    if offset != state["size"]:
+        raise Conflict(f"upload is at offset {offset} of {state['size']}")
+    if state["sha256"] and _file_sha256(_data_path(upload_id)) != state["sha256"]:
+        _delete_upload(upload_id)
+        raise BadRequest("upload does not match its sha256, please upload again")
+    body = state["body"]
+    if _is_queue_mode():
+        answer_queue.verify_no_upload_in_progress(body["mentor"], body["question"])
+    file_name = new_upload_path(
+        f"{uuid.uuid4()}-{body['mentor']}-{body['question']}{state['ext']}"
+    )
+    file_path = path.join(get_upload_root(), file_name)
+    makedirs(path.dirname(file_path), exist_ok=True)
+    replace(_data_path(upload_id), file_path)
+    remove(_state_path(upload_id))
+    log.info("finalized resumable upload %s as %s", upload_id, file_name)
+    if _is_queue_mode():
+        return answer_queue.process_saved_upload(body, file_name)
+    return answer.process_saved_upload(body, file_name)
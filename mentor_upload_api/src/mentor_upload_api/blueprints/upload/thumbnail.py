@@ -8,8 +8,6 @@ from datetime import datetime
 from os import environ
 from urllib.parse import urljoin
 
-import boto3
-from boto3_type_annotations.s3 import Client as S3Client
 from flask import Blueprint, jsonify, request
 
 from flask_wtf import FlaskForm
@@ -17,11 +15,13 @@ from wtforms import StringField
 from wtforms.validators import DataRequired
 from flask_wtf.file import FileRequired, FileAllowed, FileField
 
+from mentor_upload_api import aws
 from mentor_upload_api.api import (
     MentorThumbnailUpdateRequest,
     mentor_thumbnail_update,
 )
 
+from mentor_upload_api.tracing import span
 from mentor_upload_api.helpers import (
     validate_form_payload_decorator,
     ValidateFormJsonBody,
@@ -30,22 +30,6 @@ from mentor_upload_api.helpers import (
 thumbnail_blueprint = Blueprint("thumbnail", __name__)
 
 
-def _require_env(n: str) -> str:
-    env_val = environ.get(n, "")
-    if not env_val:
-        raise EnvironmentError(f"missing required env var {n}")
-    return env_val
-
-
-def _create_s3_client() -> S3Client:
-    return boto3.client(
-        "s3",
-        region_name=_require_env("STATIC_AWS_REGION"),
-        aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
-    )
-
-
 thumbnail_upload_json_schema = {
     "type": "object",
     "properties": {
@@ -85,14 +69,15 @@ def upload(body):
     mentor = body.get("mentor")
     upload_file = request.files["thumbnail"]
     thumbnail_path = f"mentor/thumbnails/{mentor}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}/thumbnail.png"
-    s3 = _create_s3_client()
-    s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
-    s3.upload_fileobj(
-        upload_file,
-        s3_bucket,
-        thumbnail_path,
-        ExtraArgs={"ContentType": "image/png"},
-    )
+    s3 = aws.get_client("s3")
+    s3_bucket = aws.get_static_s3_bucket()
+    with span("s3.upload_fileobj", kind="client", key=thumbnail_path):
+        s3.upload_fileobj(
+            upload_file,
+            s3_bucket,
+            thumbnail_path,
+            ExtraArgs={"ContentType": "image/png"},
+        )
     mentor_thumbnail_update(
         MentorThumbnailUpdateRequest(mentor=mentor, thumbnail=thumbnail_path)
     )
@@ -46,7 +46,11 @@ def transfer(body):
         "question": question,
     }
     t = mentor_upload_tasks.tasks.process_transfer_video.apply_async(
-        queue=mentor_upload_tasks.get_queue_finalization_stage(), args=[req]
+        queue=mentor_upload_tasks.get_queue_finalization_stage(),
+        args=[req],
+        priority=mentor_upload_tasks.get_task_priority(
+            mentor_upload_tasks.PRIORITY_LANE_BULK
+        ),
     )
     return jsonify(
         {
@@ -308,7 +312,11 @@ def transfer_mentor(body):
     }
 
     t = mentor_upload_tasks.tasks.process_transfer_mentor.apply_async(
-        queue=mentor_upload_tasks.get_queue_finalization_stage(), args=[req]
+        queue=mentor_upload_tasks.get_queue_finalization_stage(),
+        args=[req],
+        priority=mentor_upload_tasks.get_task_priority(
+            mentor_upload_tasks.PRIORITY_LANE_BULK
+        ),
     )
     return jsonify(
         {
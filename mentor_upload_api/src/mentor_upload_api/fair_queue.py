@@ -0,0 +1,125 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Per-mentor fair sharing of transcode capacity, api side: uploads are registered
+as pending for their mentor and mentors with a backlog get a lower priority.
+The worker limits in-flight transcodes per mentor and removes finished jobs
+"""
+import logging
+import threading
+import time
+from os import environ
+from typing import Dict
+
+log = logging.getLogger()
+
+
+def is_fair_queue_enabled() -> bool:
+    return environ.get("FAIR_QUEUE_ENABLED", "") == "true"
+
+
+def get_fair_queue_store_url() -> str:
+    # "memory://" keeps state in-process (tests, single process workers)
+    return (
+        environ.get("FAIR_QUEUE_STORE_URL")
+        or environ.get("UPLOAD_CELERY_BROKER_URL")
+        or environ.get("CELERY_BROKER_URL")
+        or "redis://redis:6379/0"
+    )
+
+
+def get_fair_queue_pending_ttl_secs() -> int:
+    return int(environ.get("FAIR_QUEUE_PENDING_TTL_SECS") or "86400")
+
+
+def _pending_key(mentor: str) -> str:
+    return f"mentor_upload:fair:pending:{mentor}"
+
+
+# sorted sets scored by expiry time, so entries of crashed jobs age out
+class RedisFairQueueStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def add(self, key: str, member: str, ttl_secs: int) -> None:
+        self._redis.zadd(key, {member: time.time() + ttl_secs})
+        self._redis.expire(key, ttl_secs)
+
+    def remove(self, key: str, member: str) -> None:
+        self._redis.zrem(key, member)
+
+    def count(self, key: str) -> int:
+        self._redis.zremrangebyscore(key, "-inf", time.time())
+        return self._redis.zcard(key)
+
+
+class InMemoryFairQueueStore:
+    def __init__(self):
+        self._sets: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Dict[str, float]:
+        now = time.time()
+        members = {
+            m: expires
+            for m, expires in self._sets.get(key, {}).items()
+            if expires > now
+        }
+        self._sets[key] = members
+        return members
+
+    def add(self, key: str, member: str, ttl_secs: int) -> None:
+        with self._lock:
+            self._live(key)[member] = time.time() + ttl_secs
+
+    def remove(self, key: str, member: str) -> None:
+        with self._lock:
+            self._live(key).pop(member, None)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._live(key))
+
+
+_store = None
+_store_url = ""
+
+
+def _get_store():
+    global _store, _store_url
+    url = get_fair_queue_store_url()
+    if _store is None or url != _store_url:
+        _store = (
+            InMemoryFairQueueStore()
+            if url.startswith("memory://")
+            else RedisFairQueueStore(url)
+        )
+        _store_url = url
+    return _store
+
+
+def add_pending_job(mentor: str, job_id: str) -> None:
+    if not is_fair_queue_enabled() or not mentor:
+        return
+    try:
+        _get_store().add(
+            _pending_key(mentor), job_id, get_fair_queue_pending_ttl_secs()
+        )
+    except Exception as x:
+        log.warning("failed to register pending job of %s: %s", mentor, x)
+
+
+def count_pending_jobs(mentor: str) -> int:
+    if not is_fair_queue_enabled() or not mentor:
+        return 0
+    try:
+        return _get_store().count(_pending_key(mentor))
+    except Exception as x:
+        log.warning("failed to count pending jobs of %s: %s", mentor, x)
+        return 0
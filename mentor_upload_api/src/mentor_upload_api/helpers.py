@@ -5,10 +5,9 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 import json
-from json import JSONDecodeError
 from functools import wraps
-from jsonschema import validate, ValidationError
-from flask import request
+from jsonschema import ValidationError
+from flask import g, request
 from werkzeug.exceptions import BadRequest
 import requests
 import logging
@@ -17,6 +16,10 @@ from os import environ
 
 from flask_wtf import FlaskForm
 
+from mentor_upload_process.json_validation import validate_json_schema
+
+from mentor_upload_api.tracing import span
+
 log = logging.getLogger()
 
 
@@ -25,7 +28,8 @@ def get_graphql_endpoint() -> str:
 
 
 def exec_graphql_with_json_validation(request_query, json_schema, **req_kwargs):
-    res = requests.post(get_graphql_endpoint(), json=request_query, **req_kwargs)
+    with span("graphql.request", kind="client"):
+        res = requests.post(get_graphql_endpoint(), json=request_query, **req_kwargs)
     res.raise_for_status()
     tdjson = res.json()
     if "errors" in tdjson:
@@ -36,34 +40,46 @@ def exec_graphql_with_json_validation(request_query, json_schema, **req_kwargs):
 
 def validate_json(json_data, json_schema):
     try:
-        validate(instance=json_data, schema=json_schema)
+        validate_json_schema(json_data, json_schema)
     except ValidationError as err:
         log.error(err)
         raise err
 
 
+def parse_json_body(raw_body: str):
+    """Decodes a json body once per request, later calls get the same object"""
+    parsed = g.setdefault("parsed_json_bodies", {})
+    if raw_body not in parsed:
+        parsed[raw_body] = json.loads(raw_body)
+    return parsed[raw_body]
+
+
+def get_request_json_body():
+    """The json in the "body" form field or else the request's json payload"""
+    body = request.form.get("body", {})
+    return parse_json_body(body) if body else request.json
+
+
+def validate_request_json(json_data, json_schema) -> None:
+    """validate_json, skipped when json_data was already validated against json_schema in this request"""
+    validated = g.setdefault("validated_json", set())
+    key = (id(json_data), id(json_schema))
+    if key not in validated:
+        validate_json(json_data, json_schema)
+        validated.add(key)
+
+
 def validate_json_payload_decorator(json_schema):
     def validate_json_wrapper(f):
         @wraps(f)
         def json_validated_function(*args, **kwargs):
             if not json_schema:
                 raise Exception("'json_schema' param not provided to validator")
-            body = request.form.get("body", {})
-            if body:
-                try:
-                    json_body = json.loads(body)
-                except JSONDecodeError as err:
-                    raise err
-            else:
-                json_body = request.json
+            json_body = get_request_json_body()
             if not json_body:
                 raise BadRequest("missing required param body")
-            try:
-                validate(instance=json_body, schema=json_schema)
-                return f(json_body, *args, **kwargs)
-            except ValidationError as err:
-                log.error(err)
-                raise err
+            validate_request_json(json_body, json_schema)
+            return f(json_body, *args, **kwargs)
 
         return json_validated_function
 
@@ -77,12 +93,12 @@ class ValidateFormJsonBody(object):
 
     def __call__(self, form, body):
         try:
-            json_data = json.loads(body.data)
+            json_data = parse_json_body(body.data)
         except json.decoder.JSONDecodeError as e:
             logging.error(e)
             raise e
         try:
-            validate_json(json_data, self.json_schema)
+            validate_request_json(json_data, self.json_schema)
         except ValidationError as e:
             logging.error(e)
             raise e
@@ -100,8 +116,7 @@ def validate_form_payload_decorator(flask_form: FlaskForm):
             body = form.data.get("body")
             # Return body in json if one exists
             if body:
-                json_body = json.loads(body)
-                return f(json_body, *args, **kwargs)
+                return f(parse_json_body(body), *args, **kwargs)
             return f(*args, **kwargs)
 
         return form_validated_function
@@ -0,0 +1,228 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Submits upload jobs to the upload topic (sns) from a background sender:
+the topic arn is resolved from ssm once and cached, jobs queued together are
+published with publish_batch and failed publishes are retried
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from os import environ
+from typing import Callable, List, Optional
+
+from mentor_upload_api.tracing import span
+
+log = logging.getLogger()
+
+# sns allows at most 10 messages per publish_batch
+MAX_BATCH_SIZE = 10
+
+
+def get_job_topic_url() -> str:
+    # "memory://" keeps published jobs in-process (tests)
+    return environ.get("JOB_TOPIC_URL") or "sns://"
+
+
+def get_upload_sns_arn_param() -> str:
+    return f"/mentorpal/{environ.get('STAGE')}/shared/upload_sns_arn"
+
+
+def get_upload_sns_arn_ttl_secs() -> int:
+    return int(environ.get("UPLOAD_SNS_ARN_TTL_SECS") or "600")
+
+
+def get_job_submit_max_retries() -> int:
+    return int(environ.get("JOB_SUBMIT_MAX_RETRIES") or "5")
+
+
+def get_job_submit_retry_secs() -> float:
+    # doubled after every failed attempt
+    return float(environ.get("JOB_SUBMIT_RETRY_SECS") or "1")
+
+
+def get_job_submit_exit_flush_secs() -> float:
+    # how long an exiting worker waits for queued jobs to be published
+    return float(environ.get("JOB_SUBMIT_EXIT_FLUSH_SECS") or "10")
+
+
+class SnsJobTopic:
+    def __init__(self, sns, ssm, arn_param: str, arn_ttl_secs: int):
+        self.sns = sns
+        self.ssm = ssm
+        self.arn_param = arn_param
+        self.arn_ttl_secs = arn_ttl_secs
+        self._arn = ""
+        self._arn_expires = 0.0
+        self._lock = threading.Lock()
+
+    def arn(self) -> str:
+        with self._lock:
+            if not self._arn or time.monotonic() >= self._arn_expires:
+                with span("ssm.get_parameters", kind="client"):
+                    response = self.ssm.get_parameters(
+                        Names=[self.arn_param], WithDecryption=False
+                    )
+                log.debug("ssm response %s", response)
+                self._arn = response["Parameters"][0]["Value"]
+                self._arn_expires = time.monotonic() + self.arn_ttl_secs
+            return self._arn
+
+    def invalidate_arn(self) -> None:
+        with self._lock:
+            self._arn = ""
+
+    def publish(self, messages: List[str]) -> List[int]:
+        """Publishes messages, returns the indexes of the ones that failed"""
+        arn = self.arn()
+        try:
+            return self._publish(arn, messages)
+        except Exception:
+            # the topic may have been replaced, resolve it again next time
+            self.invalidate_arn()
+            raise
+
+    def _publish(self, arn: str, messages: List[str]) -> List[int]:
+        log.info("publishing %d job requests to %s", len(messages), arn)
+        if len(messages) == 1:
+            with span("sns.publish", kind="producer", topic=arn):
+                sns_msg = self.sns.publish(TopicArn=arn, Message=messages[0])
+            log.info("sns message published %s", json.dumps(sns_msg))
+            return []
+        with span("sns.publish_batch", kind="producer", topic=arn):
+            response = self.sns.publish_batch(
+                TopicArn=arn,
+                PublishBatchRequestEntries=[
+                    {"Id": str(i), "Message": m} for i, m in enumerate(messages)
+                ],
+            )
+        log.info("sns batch published %s", json.dumps(response.get("Successful")))
+        return [int(f["Id"]) for f in response.get("Failed") or []]
+
+
+class InMemoryJobTopic:
+    def __init__(self):
+        self.messages: List[str] = []
+        self.batch_sizes: List[int] = []
+
+    def publish(self, messages: List[str]) -> List[int]:
+        self.messages.extend(messages)
+        self.batch_sizes.append(len(messages))
+        return []
+
+
+def create_job_topic(sns, ssm):
+    if get_job_topic_url().startswith("memory://"):
+        return InMemoryJobTopic()
+    return SnsJobTopic(
+        sns, ssm, get_upload_sns_arn_param(), get_upload_sns_arn_ttl_secs()
+    )
+
+
+class JobSubmitter:
+    """
+    Publishes submitted jobs from a background thread, batching whatever is
+    queued at the time. Jobs still failing after max_retries, or still unsent
+    when the submitter is closed, go to on_failed
+    """
+
+    def __init__(
+        self,
+        topic,
+        on_failed: Optional[Callable[[dict], None]] = None,
+        max_retries: int = 5,
+        retry_secs: float = 1.0,
+    ):
+        self.topic = topic
+        self.on_failed = on_failed
+        self.max_retries = max_retries
+        self.retry_secs = retry_secs
+        self._queue: "queue.Queue[dict]" = queue.Queue()
+        self._closing = threading.Event()
+        self._sender = threading.Thread(
+            target=self._send_forever, name="job-submitter", daemon=True
+        )
+        self._sender.start()
+
+    def submit(self, req: dict) -> None:
+        self._queue.put(req)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every submitted job was published (or gave up)"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Gives queued jobs timeout seconds to be published (the sender thread
+        dies with the process), then hands the ones still unsent to on_failed
+        """
+        if self.flush(timeout):
+            return
+        self._closing.set()
+        # the sender stops retrying and fails its current batch
+        while True:
+            try:
+                req = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self._fail(req)
+            finally:
+                self._queue.task_done()
+        if not self.flush(min(timeout, 1.0)):
+            log.error("job submitter closed while still publishing")
+
+    def _send_forever(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send(self, batch: List[dict]) -> None:
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if self._closing.is_set():
+                break
+            if attempt and self._closing.wait(self.retry_secs * 2 ** (attempt - 1)):
+                break
+            try:
+                failed = self.topic.publish([json.dumps(r) for r in pending])
+                pending = [pending[i] for i in failed]
+            except Exception as x:
+                log.warning(
+                    "failed to publish %d jobs (attempt %d): %s",
+                    len(pending),
+                    attempt + 1,
+                    x,
+                )
+            if not pending:
+                return
+        for req in pending:
+            self._fail(req)
+
+    def _fail(self, req: dict) -> None:
+        log.error("giving up on publishing job %s", json.dumps(req))
+        if self.on_failed:
+            try:
+                self.on_failed(req)
+            except Exception as x:
+                log.exception("failed to handle unpublished job: %s", x)
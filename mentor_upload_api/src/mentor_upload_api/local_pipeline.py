@@ -0,0 +1,265 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+In-process execution of answer uploads for single node installs
+(UPLOAD_ANSWER_VERSION=local): the stages of mentor_upload_process.process run
+on an asyncio loop in a background thread, trim and transcode (ffmpeg) in a
+process pool and transcribe and finalization in a thread pool, without broker,
+chords or result backend. Needs the worker package installed next to the api
+and a single api process, since task states are kept in memory
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from os import cpu_count, environ, path
+from typing import Callable, Dict, List, Optional
+
+log = logging.getLogger()
+
+UPLOAD_STAGES = ["trim_upload", "transcode", "transcribe", "finalization"]
+EXTENSION_NAME = "local_upload_pipeline"
+
+
+def get_local_pipeline_processes() -> int:
+    return int(environ.get("LOCAL_PIPELINE_PROCESSES") or str(cpu_count() or 1))
+
+
+def get_local_pipeline_threads() -> int:
+    return int(environ.get("LOCAL_PIPELINE_THREADS") or "8")
+
+
+def get_local_pipeline_result_ttl_secs() -> int:
+    # states of finished tasks are answered by the status api this long
+    return int(environ.get("LOCAL_PIPELINE_RESULT_TTL_SECS") or "3600")
+
+
+def get_local_pipeline_cancel_store_url(uploads_dir: str) -> str:
+    # the stages in pool processes must see the cancel requests, without redis
+    # they are marker files next to the uploads
+    return (
+        environ.get("CANCEL_STORE_URL") or f"file://{path.join(uploads_dir, '.cancel')}"
+    )
+
+
+def run_stage(
+    stage: str,
+    dict_tuple: Optional[list],
+    req: dict,
+    task_id: str,
+    uploads_dir: str,
+    on_progress: Optional[Callable[[dict], None]] = None,
+):
+    # runs in pool processes too, so the worker code is only imported here
+    from mentor_upload_process import process
+    from mentor_upload_process.cancellation import CancellationToken
+
+    environ.setdefault("UPLOADS", uploads_dir)
+    cancel_token = CancellationToken(
+        task_id, store_url=get_local_pipeline_cancel_store_url(uploads_dir)
+    )
+    if stage == "trim_upload":
+        return process.trim_upload_stage(
+            req, task_id, on_progress=on_progress, cancel_token=cancel_token
+        )
+    if stage == "transcode":
+        return process.transcode_stage(
+            dict_tuple, req, task_id, on_progress=on_progress, cancel_token=cancel_token
+        )
+    if stage == "transcribe":
+        return process.transcribe_stage(
+            dict_tuple, req, task_id, on_progress=on_progress, cancel_token=cancel_token
+        )
+    return process.finalization_stage(
+        dict_tuple, req=req, task_id=task_id, cancel_token=cancel_token
+    )
+
+
+def request_cancel(task_id: str, uploads_dir: str) -> None:
+    from mentor_upload_process.cancellation import request_cancel
+
+    request_cancel(task_id, get_local_pipeline_cancel_store_url(uploads_dir))
+
+
+@dataclass
+class LocalTaskState:
+    state: str = "PENDING"
+    info: object = None
+    updated_at: float = field(default_factory=time.time)
+
+
+_FINISHED_STATES = ["SUCCESS", "FAILURE", "REVOKED"]
+
+
+class LocalUploadPipeline:
+    def __init__(
+        self,
+        uploads_dir: str,
+        process_pool: Optional[Executor] = None,
+        thread_pool: Optional[Executor] = None,
+        stage_runner: Callable = run_stage,
+    ):
+        self.uploads_dir = uploads_dir
+        self._process_pool = process_pool
+        self._thread_pool = thread_pool
+        self._stage_runner = stage_runner
+        self._tasks: Dict[str, LocalTaskState] = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever, name="local-upload-pipeline", daemon=True
+        )
+        self._loop_thread.start()
+
+    def _get_process_pool(self) -> Executor:
+        if self._process_pool is None:
+            # spawn: forking a process that runs an event loop thread is unsafe
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=get_local_pipeline_processes(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._process_pool
+
+    def _get_thread_pool(self) -> Executor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=get_local_pipeline_threads(),
+                thread_name_prefix="local-upload-stage",
+            )
+        return self._thread_pool
+
+    def _set_state(self, task_id: str, state: str, info: object = None) -> None:
+        with self._lock:
+            self._tasks[task_id] = LocalTaskState(state=state, info=info)
+
+    def _prune(self) -> None:
+        expired = time.time() - get_local_pipeline_result_ttl_secs()
+        with self._lock:
+            for task_id in [
+                t
+                for t, s in self._tasks.items()
+                if s.state in _FINISHED_STATES and s.updated_at < expired
+            ]:
+                del self._tasks[task_id]
+
+    def task_state(self, task_id: str) -> LocalTaskState:
+        with self._lock:
+            # unknown ids are PENDING, like celery's AsyncResult
+            return self._tasks.get(task_id) or LocalTaskState()
+
+    def submit(self, req: dict) -> Dict[str, str]:
+        """Schedules the stages of an answer upload, returns the task id of every stage"""
+        self._prune()
+        task_ids = {stage: str(uuid.uuid4()) for stage in UPLOAD_STAGES}
+        for task_id in task_ids.values():
+            self._set_state(task_id, "PENDING")
+        asyncio.run_coroutine_threadsafe(self._run_upload(req, task_ids), self._loop)
+        return task_ids
+
+    def cancel(self, task_id: str) -> None:
+        with self._lock:
+            s = self._tasks.get(task_id)
+            if s and s.state == "PENDING":
+                s.state = "REVOKED"
+                s.updated_at = time.time()
+                return
+        # a running stage stops itself once it sees the cancel request
+        request_cancel(task_id, self.uploads_dir)
+
+    async def _run_stage(
+        self, stage: str, task_id: str, in_process_pool: bool, dict_tuple, req
+    ):
+        if self.task_state(task_id).state == "REVOKED":
+            return None
+        self._set_state(task_id, "STARTED")
+        # progress callbacks can't cross into pool processes
+        on_progress = (
+            None
+            if in_process_pool
+            else (lambda meta: self._set_state(task_id, "PROGRESS", meta))
+        )
+        try:
+            result = await self._loop.run_in_executor(
+                self._get_process_pool()
+                if in_process_pool
+                else self._get_thread_pool(),
+                partial(
+                    self._stage_runner,
+                    stage,
+                    dict_tuple,
+                    dict(req),
+                    task_id,
+                    self.uploads_dir,
+                    on_progress,
+                ),
+            )
+        except Exception as x:
+            log.exception("local %s stage %s failed", stage, task_id)
+            self._set_state(task_id, "FAILURE", repr(x))
+            return None
+        # the process stages report their own failures and return None
+        self._set_state(task_id, "SUCCESS" if result is not None else "FAILURE", result)
+        return result
+
+    def _skip(self, task_ids: Dict[str, str], stages: List[str], reason: str) -> None:
+        for stage in stages:
+            if self.task_state(task_ids[stage]).state != "REVOKED":
+                self._set_state(task_ids[stage], "FAILURE", reason)
+
+    async def _run_upload(self, req: dict, task_ids: Dict[str, str]) -> None:
+        trim = await self._run_stage(
+            "trim_upload", task_ids["trim_upload"], True, None, req
+        )
+        if trim is None:
+            self._skip(
+                task_ids,
+                ["transcode", "transcribe", "finalization"],
+                "trim_upload failed",
+            )
+            return
+        transcode, transcribe = await asyncio.gather(
+            self._run_stage("transcode", task_ids["transcode"], True, [trim], req),
+            self._run_stage("transcribe", task_ids["transcribe"], False, [trim], req),
+        )
+        if transcode is None or transcribe is None:
+            self._skip(task_ids, ["finalization"], "transcode or transcribe failed")
+            return
+        await self._run_stage(
+            "finalization",
+            task_ids["finalization"],
+            False,
+            # same shape as the result of the chord of (transcode, transcribe)
+            [[transcode, transcribe]],
+            req,
+        )
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        for pool in [self._process_pool, self._thread_pool]:
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+
+def init_app(app, uploads_dir: str) -> LocalUploadPipeline:
+    import atexit
+
+    local_pipeline = LocalUploadPipeline(uploads_dir)
+    app.extensions[EXTENSION_NAME] = local_pipeline
+    atexit.register(local_pipeline.close)
+    return local_pipeline
+
+
+def get_local_pipeline() -> Optional[LocalUploadPipeline]:
+    """The app's in-process pipeline, None when uploads go through celery"""
+    from flask import current_app
+
+    return current_app.extensions.get(EXTENSION_NAME)
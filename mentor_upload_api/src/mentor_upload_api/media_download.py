@@ -0,0 +1,95 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Downloads of uploaded media. Files are sent with Range and
+ETag/If-None-Match support, or handed off to the web server in front of
+gunicorn (DOWNLOAD_OFFLOAD=x-accel-redirect for nginx, x-sendfile for
+apache/lighttpd) so a multi-GB download does not hold an api worker
+"""
+import logging
+import mimetypes
+from os import environ, path
+from urllib.parse import quote
+
+from flask import Response, redirect, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+
+from mentor_upload_api import aws
+
+log = logging.getLogger()
+
+
+def get_download_offload() -> str:
+    # "" (gunicorn sends the file), "x-accel-redirect" or "x-sendfile"
+    return environ.get("DOWNLOAD_OFFLOAD") or ""
+
+
+def get_download_accel_prefix() -> str:
+    # nginx `internal` location aliased to UPLOAD_ROOT
+    return environ.get("DOWNLOAD_ACCEL_PREFIX") or "/protected-uploads/"
+
+
+def is_download_s3_redirect_enabled() -> bool:
+    return environ.get("DOWNLOAD_S3_REDIRECT", "") == "true"
+
+
+def get_download_presigned_url_expires_secs() -> int:
+    return int(environ.get("DOWNLOAD_PRESIGNED_URL_EXPIRES_SECS") or "3600")
+
+
+def _offload_response(upload_root: str, rel_path: str, offload: str) -> Response:
+    file_name = path.basename(rel_path)
+    res = Response(
+        mimetype=mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    )
+    res.headers.set("Content-Disposition", "attachment", filename=file_name)
+    res.headers["Accept-Ranges"] = "bytes"
+    if offload == "x-accel-redirect":
+        res.headers[
+            "X-Accel-Redirect"
+        ] = f"{get_download_accel_prefix().rstrip('/')}/{quote(rel_path)}"
+    else:
+        res.headers["X-Sendfile"] = path.abspath(path.join(upload_root, rel_path))
+    return res
+
+
+def send_upload(upload_root: str, rel_path: str) -> Response:
+    """Response that downloads the upload at rel_path (relative to upload_root) as an attachment"""
+    file_path = safe_join(upload_root, rel_path) if rel_path else None
+    if not file_path or not path.isfile(file_path):
+        raise NotFound(f"no upload {rel_path}")
+    offload = get_download_offload()
+    if offload in ("x-accel-redirect", "x-sendfile"):
+        return _offload_response(upload_root, rel_path, offload)
+    if offload:
+        log.warning("unknown DOWNLOAD_OFFLOAD %s, sending the file", offload)
+    # conditional handles Range (206) and If-None-Match/If-Modified-Since (304)
+    res = send_file(
+        path.abspath(file_path),
+        as_attachment=True,
+        conditional=True,
+        etag=True,
+        max_age=0,
+    )
+    # older werkzeug only advertises ranges on 206 responses
+    res.headers["Accept-Ranges"] = "bytes"
+    return res
+
+
+def redirect_to_s3(key: str, file_name: str) -> Response:
+    """Redirects to a presigned url of key in the static bucket, s3 serves the ranges"""
+    url = aws.get_client("s3").generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": aws.get_static_s3_bucket(),
+            "Key": key,
+            "ResponseContentDisposition": f'attachment; filename="{file_name}"',
+        },
+        ExpiresIn=get_download_presigned_url_expires_secs(),
+    )
+    return redirect(url, code=302)
@@ -8,11 +8,16 @@ import logging
 import os
 import re
 import math
+from typing import Tuple, Union
+import ffmpy
 from pymediainfo import MediaInfo
 
+from mentor_upload_api.tracing import traced
+
 log = logging.getLogger()
 
 
+@traced("mediainfo.find_duration", kind="internal")
 def find_duration(audio_or_video_file: str) -> float:
     log.info(audio_or_video_file)
     media_info = MediaInfo.parse(audio_or_video_file)
@@ -26,6 +31,122 @@ def find_duration(audio_or_video_file: str) -> float:
     return -1.0
 
 
+@traced("mediainfo.find_video_dims", kind="internal")
+def find_video_dims(video_file: str) -> Tuple[int, int]:
+    media_info = MediaInfo.parse(video_file)
+    video_tracks = [t for t in media_info.tracks if t.track_type == "Video"]
+    return (
+        (video_tracks[0].width, video_tracks[0].height)
+        if len(video_tracks) >= 1 and video_tracks[0].width
+        else (-1, -1)
+    )
+
+
+# the encode args below must stay the same as the worker's media_tools,
+# progressive ingest produces the files the worker would otherwise encode
+def output_args_video_encode_for_mobile(
+    video_dims: Tuple[int, int], target_height=480
+) -> Tuple[str, ...]:
+    i_w, i_h = video_dims
+    o_w, o_h = (target_height, target_height)
+    crop_w = 0
+    crop_h = 0
+    if i_w > i_h:
+        # for now assumes we want to zoom in slightly on landscape videos
+        # before cropping to square
+        crop_h = i_h * 0.25
+        crop_w = i_w - (i_h - crop_h)
+    else:
+        crop_h = crop_h - crop_h
+    return (
+        "-filter:v",
+        f"crop=iw-{crop_w:.0f}:ih-{crop_h:.0f},scale={o_w:.0f}:{o_h:.0f},fps=30",
+        "-c:v",
+        "libx264",
+        "-crf",
+        "23",
+        "-pix_fmt",
+        "yuv420p",
+        "-movflags",
+        "+faststart",
+        "-c:a",
+        "aac",
+        "-ac",
+        "1",
+    )
+
+
+def output_args_video_encode_for_web(
+    video_dims: Tuple[int, int], max_height=720, target_aspect=1.77777777778
+) -> Tuple[str, ...]:
+    i_w, i_h = video_dims
+    crop_w = 0
+    crop_h = 0
+    o_w = 0
+    o_h = 0
+    i_aspect = float(i_w) / float(i_h)
+    if i_aspect >= target_aspect:
+        crop_w = i_w - (i_h * target_aspect)
+        o_h = round(min(max_height, i_h))
+    else:
+        o_h = round(min(max_height, i_w * (1.0 / target_aspect)))
+    o_w = int(o_h * target_aspect)
+    if o_w % 2 != 0:
+        o_w += 1  # ensure width is divisible by 2
+    if o_h % 2 != 0:
+        o_h += 1  # ensure height is divisible by 2
+    return (
+        "-filter:v",
+        f"crop=iw-{crop_w:.0f}:ih-{crop_h:.0f},scale={o_w:.0f}:{o_h:.0f},fps=30",
+        "-c:v",
+        "libx264",
+        "-crf",
+        "23",
+        "-pix_fmt",
+        "yuv420p",
+        "-movflags",
+        "+faststart",
+        "-c:a",
+        "aac",
+        "-ac",
+        "1",
+    )
+
+
+def format_secs(secs: Union[float, int, str]) -> str:
+    return f"{float(str(secs)):.3f}"
+
+
+def input_args_trim_video_copy(start_secs: float) -> Tuple[str, ...]:
+    # seeking the input with stream copy starts at the keyframe before start_secs
+    return ("-ss", format_secs(start_secs))
+
+
+def output_args_trim_video_copy(start_secs: float, end_secs: float) -> Tuple[str, ...]:
+    # stream copy, no re-encode: takes about as long as copying the file
+    return (
+        "-t",
+        format_secs(float(end_secs) - float(start_secs)),
+        "-c",
+        "copy",
+        "-avoid_negative_ts",
+        "make_zero",
+    )
+
+
+@traced("ffmpeg.video_trim_copy", kind="internal")
+def video_trim_copy(
+    input_file: str, output_file: str, start_secs: float, end_secs: float
+) -> None:
+    log.info("%s, %s, %s-%s", input_file, output_file, start_secs, end_secs)
+    ff = ffmpy.FFmpeg(
+        inputs={str(input_file): input_args_trim_video_copy(start_secs)},
+        outputs={str(output_file): output_args_trim_video_copy(start_secs, end_secs)},
+    )
+    ff.run()
+    log.debug(ff)
+
+
 def find(
     s: str, ch: str
 ):  # gives indexes of all of the spaces so we don't split words apart
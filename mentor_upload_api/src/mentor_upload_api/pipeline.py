@@ -0,0 +1,135 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Starts upload pipelines: stages with dependencies instead of nested chords.
+The stage graph, request and dependency counters go to a store shared with
+the worker, only stages without dependencies are sent here. Each worker stage
+stores its result and sends the dependents it completes (see the worker's
+mentor_upload_process.pipeline)
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger()
+
+
+def is_upload_pipeline_enabled() -> bool:
+    return environ.get("UPLOAD_PIPELINE_ENABLED", "") == "true"
+
+
+def get_pipeline_store_url() -> str:
+    # "memory://" keeps state in-process (tests)
+    return (
+        environ.get("PIPELINE_STORE_URL")
+        or environ.get("UPLOAD_CELERY_BROKER_URL")
+        or environ.get("CELERY_BROKER_URL")
+        or "redis://redis:6379/0"
+    )
+
+
+def get_pipeline_ttl_secs() -> int:
+    return int(environ.get("PIPELINE_TTL_SECS") or "86400")
+
+
+def _pipeline_key(pipeline_id: str) -> str:
+    return f"mentor_upload:pipeline:{pipeline_id}"
+
+
+class RedisPipelineStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def create(self, pipeline_id: str, fields: Dict[str, str], ttl_secs: int) -> None:
+        key = _pipeline_key(pipeline_id)
+        with self._redis.pipeline() as p:
+            p.hset(key, mapping=fields)
+            p.expire(key, ttl_secs)
+            p.execute()
+
+    def get(self, pipeline_id: str, fields: List[str]) -> List[Optional[str]]:
+        return self._redis.hmget(_pipeline_key(pipeline_id), fields)
+
+
+class InMemoryPipelineStore:
+    def __init__(self):
+        self._pipelines: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, pipeline_id: str, fields: Dict[str, str], ttl_secs: int) -> None:
+        with self._lock:
+            self._pipelines[pipeline_id] = (time.time() + ttl_secs, dict(fields))
+
+    def get(self, pipeline_id: str, fields: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            expires, stored = self._pipelines.get(pipeline_id, (0.0, {}))
+            stored = stored if expires > time.time() else {}
+            return [stored.get(f) for f in fields]
+
+
+_store = None
+_store_url = ""
+
+
+def _get_store():
+    global _store, _store_url
+    url = get_pipeline_store_url()
+    if _store is None or url != _store_url:
+        _store = (
+            InMemoryPipelineStore()
+            if url.startswith("memory://")
+            else RedisPipelineStore(url)
+        )
+        _store_url = url
+    return _store
+
+
+@dataclass
+class PipelineStage:
+    task: object  # a celery task, sent with apply_async(kwargs={"pipeline_id": ...})
+    queue: str
+    priority: int
+    deps: List[str] = field(default_factory=list)
+
+
+def start_pipeline(stages: Dict[str, PipelineStage], req: dict) -> Dict[str, str]:
+    """Stores the pipeline and sends its root stages, returns the task id of every stage"""
+    unknown = {d for s in stages.values() for d in s.deps if d not in stages}
+    if unknown:
+        raise ValueError(f"pipeline stages depend on unknown stages {unknown}")
+    pipeline_id = str(uuid.uuid4())
+    task_ids = {name: str(uuid.uuid4()) for name in stages}
+    spec = {
+        name: {
+            "task": s.task.name,
+            "task_id": task_ids[name],
+            "queue": s.queue,
+            "priority": s.priority,
+            "deps": s.deps,
+        }
+        for name, s in stages.items()
+    }
+    fields = {"spec": json.dumps(spec), "req": json.dumps(req)}
+    fields.update({f"waiting:{name}": str(len(s.deps)) for name, s in stages.items()})
+    _get_store().create(pipeline_id, fields, get_pipeline_ttl_secs())
+    for name, s in stages.items():
+        if not s.deps:
+            s.task.apply_async(
+                kwargs={"pipeline_id": pipeline_id},
+                task_id=task_ids[name],
+                queue=s.queue,
+                priority=s.priority,
+            )
+    log.info("started pipeline %s: %s", pipeline_id, task_ids)
+    return task_ids
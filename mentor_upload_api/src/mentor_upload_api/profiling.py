@@ -0,0 +1,82 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""Flask and celery publishing hooks of the profiling in mentor_upload_process.profiling"""
+import time
+
+from mentor_upload_process.profiling import (
+    PROFILE_TASK_HEADER,
+    is_profiling_enabled,
+    profile,
+)
+
+PROFILE_HEADER = "X-Mentor-Upload-Profile"
+
+
+def _is_admin_request(request) -> bool:
+    from mentor_upload_api.authorization_decorator import (
+        parse_payload_from_auth_header_jwt,
+    )
+
+    try:
+        return parse_payload_from_auth_header_jwt(request)["role"] == "ADMIN"
+    except Exception:
+        # no, invalid or expired token (abort raises)
+        return False
+
+
+def is_profiling_requested() -> bool:
+    """
+    True if the current request asked to be profiled via header, which is
+    only honoured with PROFILING_ENABLED or from an admin: a profile is
+    expensive enough that anonymous clients must not be able to force one
+    """
+    from flask import has_request_context, request
+
+    if not has_request_context() or request.headers.get(PROFILE_HEADER, "") not in (
+        "1",
+        "true",
+    ):
+        return False
+    return is_profiling_enabled() or _is_admin_request(request)
+
+
+def _before_task_publish(headers=None, **kwargs):
+    if headers is not None and is_profiling_requested():
+        headers[PROFILE_TASK_HEADER] = True
+
+
+def install_celery_profiling() -> None:
+    """Asks the worker to profile the tasks published by a profiled request"""
+    from celery.signals import before_task_publish
+
+    before_task_publish.connect(_before_task_publish, weak=False)
+
+
+def init_app(app) -> None:
+    """Profiles requests sampled by PROFILING_* env or sent with the profile header"""
+    from flask import g
+
+    from mentor_upload_api.tracing import current_trace_id
+
+    install_celery_profiling()
+
+    @app.before_request
+    def start_request_profile():
+        cm = profile(
+            f"api-{current_trace_id() or time.time_ns()}",
+            forced=is_profiling_requested(),
+        )
+        if cm.__enter__():
+            g.profile_cm = cm
+        else:
+            cm.__exit__(None, None, None)
+
+    @app.teardown_request
+    def end_request_profile(exc):
+        cm = g.pop("profile_cm", None)
+        if cm is not None:
+            cm.__exit__(None, None, None)
@@ -0,0 +1,239 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Progressive ingest: while a faststart/fragmented mp4 is still being uploaded,
+ffmpeg already encodes the mobile and web videos and extracts the audio from
+the bytes received so far. The worker uses these early outputs instead of
+encoding again and falls back to the normal path when there are none
+(not streamable, trimmed upload, ffmpeg failed)
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from os import environ, makedirs, path
+from struct import unpack_from
+from typing import Optional, Tuple
+
+from mentor_upload_api.media_tools import (
+    find_video_dims,
+    output_args_video_encode_for_mobile,
+    output_args_video_encode_for_web,
+)
+
+log = logging.getLogger()
+
+EARLY_MEDIA_DIR_NAME = ".early"
+# touched while ffmpeg runs, the worker stops waiting once it goes stale
+HEARTBEAT_FILE = "heartbeat.json"
+
+
+def is_progressive_ingest_enabled() -> bool:
+    return environ.get("PROGRESSIVE_INGEST_ENABLED", "") == "true"
+
+
+def get_progressive_ingest_max_header_bytes() -> int:
+    # give up on files whose moov box doesn't end within this many bytes
+    return int(
+        environ.get("PROGRESSIVE_INGEST_MAX_HEADER_BYTES") or str(16 * 1024**2)
+    )
+
+
+def get_progressive_ingest_heartbeat_secs() -> float:
+    return float(environ.get("PROGRESSIVE_INGEST_HEARTBEAT_SECS") or "5")
+
+
+def get_early_media_root() -> str:
+    return path.join(environ.get("UPLOAD_ROOT") or "./uploads", EARLY_MEDIA_DIR_NAME)
+
+
+def find_mp4_header_end(head: bytes) -> Optional[int]:
+    """
+    Walks the top level boxes at the start of an mp4. Returns where its moov
+    (or first moof) box ends when metadata comes before media data, -1 when
+    media data comes first (not streamable), None when head is too short to tell
+    """
+    pos = 0
+    while pos + 8 <= len(head):
+        size, box = unpack_from(">I4s", head, pos)
+        if size == 1:
+            if pos + 16 > len(head):
+                return None
+            (size,) = unpack_from(">Q", head, pos + 8)
+        if box in (b"moov", b"moof"):
+            return pos + size if size else -1
+        if box == b"mdat" or size < 8:
+            return -1
+        pos += size
+    return None
+
+
+class ProgressiveIngest:
+    def __init__(self, source_path: str, name: str):
+        self.source_path = source_path
+        self.name = name
+        self.output_dir = path.join(get_early_media_root(), name)
+        self.state = "detecting"  # then encoding, off or cancelled
+        self.claimed = False
+        self._written = 0
+        self._next_check = 64 * 1024
+        self._header_end: Optional[int] = None
+        self._upload_done = False
+        self._data_available = threading.Condition()
+        self._process: Optional[subprocess.Popen] = None
+        self._pump_thread: Optional[threading.Thread] = None
+        self._last_heartbeat = 0.0
+
+    def feed(self, written: int) -> None:
+        """Called after every write to the incoming file with its size"""
+        with self._data_available:
+            self._written = written
+            self._data_available.notify_all()
+        if self.state != "detecting" or written < self._next_check:
+            return
+        self._next_check = written * 2
+        try:
+            self._detect()
+        except Exception as x:
+            log.warning("progressive ingest of %s failed to start: %s", self.name, x)
+            self.state = "off"
+
+    def _detect(self) -> None:
+        max_header_bytes = get_progressive_ingest_max_header_bytes()
+        if self._header_end is None:
+            with open(self.source_path, "rb") as f:
+                head = f.read(min(self._written, max_header_bytes))
+            self._header_end = find_mp4_header_end(head)
+            if self._header_end is None and self._written < max_header_bytes:
+                return
+        if self._header_end is None or not 0 < self._header_end <= max_header_bytes:
+            log.info("%s is not streamable, no progressive ingest", self.name)
+            self.state = "off"
+            return
+        if self._written < self._header_end:
+            self._next_check = self._header_end
+            return
+        video_dims = find_video_dims(self.source_path)
+        if video_dims[0] <= 0 or video_dims[1] <= 0:
+            self.state = "off"
+            return
+        self._start_encoding(video_dims)
+
+    def _heartbeat(self, force: bool = False) -> None:
+        heartbeat_file = path.join(self.output_dir, HEARTBEAT_FILE)
+        now = time.monotonic()
+        if (
+            not force
+            and now - self._last_heartbeat < get_progressive_ingest_heartbeat_secs()
+        ):
+            return
+        self._last_heartbeat = now
+        try:
+            if force:
+                with open(heartbeat_file, "w") as f:
+                    json.dump({"host": socket.gethostname(), "pid": os.getpid()}, f)
+            else:
+                os.utime(heartbeat_file)
+        except OSError as x:
+            log.warning("progressive ingest of %s heartbeat failed: %s", self.name, x)
+
+    def _start_encoding(self, video_dims: Tuple[int, int]) -> None:
+        makedirs(self.output_dir, exist_ok=True)
+        self._heartbeat(force=True)
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "quiet",
+                "-i",
+                "pipe:0",
+                *output_args_video_encode_for_mobile(video_dims),
+                path.join(self.output_dir, "mobile.mp4"),
+                *output_args_video_encode_for_web(video_dims),
+                path.join(self.output_dir, "web.mp4"),
+                path.join(self.output_dir, "audio.mp3"),
+            ],
+            stdin=subprocess.PIPE,
+        )
+        self.state = "encoding"
+        self._pump_thread = threading.Thread(
+            target=self._pump, name=f"progressive-ingest-{self.name}", daemon=True
+        )
+        self._pump_thread.start()
+        log.info("progressive ingest of %s started: %s", self.name, video_dims)
+
+    def _pump(self) -> None:
+        # follows the growing incoming file (or the file it was renamed to)
+        pos = 0
+        try:
+            with open(self.source_path, "rb") as source:
+                while True:
+                    with self._data_available:
+                        while (
+                            pos >= self._written
+                            and not self._upload_done
+                            and self.state == "encoding"
+                        ):
+                            self._data_available.wait(1)
+                            self._heartbeat()
+                        available = self._written - pos
+                    if self.state != "encoding":
+                        break
+                    if available <= 0:
+                        break  # upload done and everything sent
+                    chunk = source.read(min(available, 1024 * 1024))
+                    pos += len(chunk)
+                    self._process.stdin.write(chunk)
+                    self._heartbeat()
+            self._process.stdin.close()
+        except Exception as x:
+            log.warning("progressive ingest of %s failed: %s", self.name, x)
+            self.state = "off"
+            self._process.kill()
+        while True:
+            # ffmpeg keeps encoding for a while after the upload is done
+            try:
+                returncode = self._process.wait(
+                    timeout=get_progressive_ingest_heartbeat_secs()
+                )
+                break
+            except subprocess.TimeoutExpired:
+                self._heartbeat()
+        ok = returncode == 0 and self.state == "encoding"
+        if self.state == "cancelled":
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+            return
+        with open(path.join(self.output_dir, "done.json"), "w") as f:
+            json.dump({"ok": ok}, f)
+        log.info("progressive ingest of %s finished, ok=%s", self.name, ok)
+
+    def finish(self) -> str:
+        """
+        Marks the upload complete, returns the early media dir relative to
+        UPLOAD_ROOT for the worker or "" when ingest didn't start
+        """
+        self.claimed = True
+        with self._data_available:
+            self._upload_done = True
+            self._data_available.notify_all()
+        if self.state != "encoding":
+            return ""
+        return path.join(EARLY_MEDIA_DIR_NAME, self.name)
+
+    def cancel(self) -> None:
+        was_encoding = self.state == "encoding"
+        self.state = "cancelled"
+        with self._data_available:
+            self._upload_done = True
+            self._data_available.notify_all()
+        if was_encoding and self._process:
+            self._process.kill()
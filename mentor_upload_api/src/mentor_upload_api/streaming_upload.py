@@ -0,0 +1,133 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Multipart file parts are written straight into UPLOAD_ROOT/.incoming while
+the request body is parsed, hashed and counted on the way, so saving an upload
+is a rename instead of a copy out of werkzeug's spool file
+"""
+import hashlib
+import io
+import logging
+import uuid
+from os import environ, makedirs, path, remove, replace
+from typing import Callable, List, Optional, Tuple
+
+from flask import Request, request
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from mentor_upload_api.progressive_ingest import (
+    ProgressiveIngest,
+    is_progressive_ingest_enabled,
+)
+
+log = logging.getLogger()
+
+
+def get_upload_root() -> str:
+    return environ.get("UPLOAD_ROOT") or "./uploads"
+
+
+def get_incoming_upload_dir() -> str:
+    # must be on the same filesystem as UPLOAD_ROOT to rename into it
+    return path.join(get_upload_root(), ".incoming")
+
+
+def get_upload_max_bytes() -> int:
+    # 0 means unlimited
+    return int(environ.get("UPLOAD_MAX_BYTES") or str(5 * 1024**3))
+
+
+class HashingUploadFile(io.FileIO):
+    """Incoming upload file that keeps the sha256 and size of what is written to it"""
+
+    def __init__(self, file_path: str, max_bytes: int = 0):
+        super().__init__(file_path, "w+")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.on_write: Optional[Callable[[int], None]] = None
+        self.progressive_ingest: Optional[ProgressiveIngest] = None
+        self._sha256 = hashlib.sha256()
+
+    def write(self, b) -> int:
+        if self.max_bytes and self.size + len(b) > self.max_bytes:
+            raise RequestEntityTooLarge(
+                f"upload is larger than the limit of {self.max_bytes} bytes"
+            )
+        written = super().write(b)
+        self._sha256.update(memoryview(b)[:written])
+        self.size += written
+        if self.on_write:
+            self.on_write(self.size)
+        return written
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+
+class StreamingUploadRequest(Request):
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        max_bytes = get_upload_max_bytes()
+        if max_bytes and (total_content_length or 0) > max_bytes:
+            raise RequestEntityTooLarge(
+                f"upload is larger than the limit of {max_bytes} bytes"
+            )
+        makedirs(get_incoming_upload_dir(), exist_ok=True)
+        part_id = str(uuid.uuid4())
+        f = HashingUploadFile(
+            path.join(get_incoming_upload_dir(), f"{part_id}.part"), max_bytes
+        )
+        if is_progressive_ingest_enabled() and (content_type or "").startswith(
+            "video/"
+        ):
+            f.progressive_ingest = ProgressiveIngest(f.name, part_id)
+            f.on_write = f.progressive_ingest.feed
+        self.incoming_files.append(f)
+        return f
+
+    @property
+    def incoming_files(self) -> List[HashingUploadFile]:
+        if "_incoming_files" not in self.__dict__:
+            self.__dict__["_incoming_files"] = []
+        return self.__dict__["_incoming_files"]
+
+
+def save_upload(upload_file: FileStorage, file_path: str) -> Tuple[int, str]:
+    """Moves an uploaded file to file_path, returns its size and sha256"""
+    stream = upload_file.stream
+    if isinstance(stream, HashingUploadFile):
+        stream.close()
+        replace(stream.name, file_path)
+        return stream.size, stream.hexdigest()
+    # parsed without StreamingUploadRequest (or spooled in memory)
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(file_path, "wb") as f:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            sha256.update(chunk)
+            size += f.write(chunk)
+    return size, sha256.hexdigest()
+
+
+def _discard_incoming_files(exc) -> None:
+    # parts that were not saved (failed validation, errors) must not pile up
+    for f in getattr(request, "incoming_files", []):
+        if f.progressive_ingest and not f.progressive_ingest.claimed:
+            f.progressive_ingest.cancel()
+        try:
+            f.close()
+            if path.exists(f.name):
+                remove(f.name)
+        except OSError as x:
+            log.warning("failed to discard incoming upload %s: %s", f.name, x)
+
+
+def init_app(app) -> None:
+    app.request_class = StreamingUploadRequest
+    app.teardown_request(_discard_incoming_files)
@@ -0,0 +1,71 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""Flask and celery publishing hooks of the tracing in mentor_upload_process.tracing"""
+from mentor_upload_process.tracing import (  # noqa: F401
+    TRACEPARENT_HEADER,
+    current_context,
+    current_trace_id,
+    format_traceparent,
+    inject_headers,
+    parse_traceparent,
+    set_default_service_name,
+    span,
+    traced,
+)
+
+set_default_service_name("mentor-upload-api")
+
+
+def _before_task_publish(headers=None, **kwargs):
+    inject_headers(headers)
+
+
+def install_celery_tracing() -> None:
+    """Propagates the current trace context in the headers of every published task"""
+    from celery.signals import before_task_publish
+
+    before_task_publish.connect(_before_task_publish, weak=False)
+
+
+def init_app(app) -> None:
+    """Starts (or continues) a trace for every request handled by the app"""
+    from flask import g, request
+
+    install_celery_tracing()
+
+    @app.before_request
+    def start_request_span():
+        cm = span(
+            f"{request.method} {request.url_rule or request.path}",
+            parent=parse_traceparent(request.headers.get(TRACEPARENT_HEADER, "")),
+            kind="server",
+            **{"http.method": request.method, "http.target": request.full_path},
+        )
+        g.trace_span = cm.__enter__()
+        g.trace_span_cm = cm
+        g.request_id = current_trace_id()
+
+    @app.after_request
+    def add_trace_response_header(response):
+        ctx = current_context()
+        if ctx:
+            response.headers[TRACEPARENT_HEADER] = format_traceparent(ctx)
+        s = getattr(g, "trace_span", None)
+        if s is not None:
+            s.set_attribute("http.route", request.endpoint)
+            s.set_attribute("http.status_code", response.status_code)
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        cm = g.pop("trace_span_cm", None)
+        if cm is None:
+            return
+        if exc is not None:
+            cm.__exit__(type(exc), exc, exc.__traceback__)
+        else:
+            cm.__exit__(None, None, None)
@@ -0,0 +1,176 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+In-process index of the files in the upload root, so listing and finding
+uploads doesn't scan the (very large) upload mount on every request.
+The directory is only rescanned when its mtime changed and only files
+that are new since the last scan are stat'ed. Shard directories of the
+sharded layout (see upload_layout) are tracked the same way
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from os import environ, path, scandir, stat
+from typing import Dict, List, Optional, Tuple
+
+from dateutil import tz
+
+from mentor_upload_api.upload_layout import is_shard_dir_name, parse_upload_file_name
+
+log = logging.getLogger()
+
+SORT_KEYS = ("uploadDate", "-uploadDate", "fileName", "-fileName", "size", "-size")
+
+
+def get_upload_index_max_age_secs() -> float:
+    # rescan at least this often, some network mounts cache directory mtimes
+    return float(environ.get("UPLOAD_INDEX_MAX_AGE_SECS") or "60")
+
+
+@dataclass
+class UploadFile:
+    file_name: str
+    size: int
+    ctime: float
+    mentor: str = ""
+    question: str = ""
+    # relative to the upload root, differs from file_name in the sharded layout
+    rel_path: str = ""
+
+    def to_mounted_file(self) -> dict:
+        return {
+            "fileName": self.file_name,
+            "size": self.size,
+            "uploadDate": datetime.fromtimestamp(
+                self.ctime, tz=tz.gettz("America/Los_Angeles")
+            ).strftime("%m/%d/%Y %I:%M:%S %p")
+            + " (PST)",
+        }
+
+
+class UploadIndex:
+    def __init__(self, upload_dir: str):
+        self.upload_dir = upload_dir
+        # per directory (the root and its shards): mtime, scan time and files
+        self._dirs: Dict[str, Tuple[int, float, Dict[str, UploadFile]]] = {}
+        self._files: Dict[str, UploadFile] = {}
+        self._by_mentor_question: Dict[Tuple[str, str], UploadFile] = {}
+        self._sorted: Dict[str, List[UploadFile]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        with self._lock:
+            now = time.time()
+            shards = self._refresh_dir("", now)
+            changed = shards is not None
+            if shards is None:
+                shards = [d for d in self._dirs if d]
+            else:
+                for gone in set(self._dirs) - set(shards) - {""}:
+                    del self._dirs[gone]
+            for shard in shards:
+                changed = self._refresh_dir(shard, now) is not None or changed
+            if changed:
+                self._reindex()
+
+    def _refresh_dir(self, rel_dir: str, now: float) -> Optional[List[str]]:
+        """Rescans rel_dir if it changed, returns its shard dirs then or else None"""
+        dir_path = path.join(self.upload_dir, rel_dir)
+        try:
+            mtime_ns = stat(dir_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = -1
+        known_mtime_ns, scanned_at, known_files = self._dirs.get(rel_dir, (-2, 0, {}))
+        if (
+            mtime_ns == known_mtime_ns
+            and now - scanned_at < get_upload_index_max_age_secs()
+            # a change in the same mtime tick as the last scan looks like no change
+            and mtime_ns / 1e9 < scanned_at - 1
+        ):
+            return None
+        files: Dict[str, UploadFile] = {}
+        shards: List[str] = []
+        if mtime_ns != -1:
+            for entry in scandir(dir_path):
+                if entry.name.startswith("."):
+                    continue  # .incoming etc hold uploads still being received
+                if entry.is_dir():
+                    if not rel_dir and is_shard_dir_name(entry.name):
+                        shards.append(entry.name)
+                    continue
+                known = known_files.get(entry.name)
+                if known is None:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue  # removed while scanning
+                    mentor, question = parse_upload_file_name(entry.name)
+                    known = UploadFile(
+                        entry.name,
+                        st.st_size,
+                        st.st_ctime,
+                        mentor,
+                        question,
+                        path.join(rel_dir, entry.name),
+                    )
+                files[entry.name] = known
+        self._dirs[rel_dir] = (mtime_ns, now, files)
+        return shards
+
+    def _reindex(self) -> None:
+        files: Dict[str, UploadFile] = {}
+        for _, _, dir_files in self._dirs.values():
+            files.update(dir_files)
+        by_mentor_question: Dict[Tuple[str, str], UploadFile] = {}
+        for f in sorted(files.values(), key=lambda f: f.ctime):
+            if f.mentor:
+                by_mentor_question[(f.mentor, f.question)] = f  # latest wins
+        self._files = files
+        self._by_mentor_question = by_mentor_question
+        self._sorted = {}
+        log.debug("indexed %d uploads in %s", len(files), self.upload_dir)
+
+    def find(self, mentor: str, question: str) -> Optional[UploadFile]:
+        """The latest upload for mentor and question"""
+        self.refresh()
+        return self._by_mentor_question.get((mentor, question))
+
+    def list(
+        self, sort: str = "-uploadDate", offset: int = 0, limit: int = 0
+    ) -> Tuple[List[UploadFile], int]:
+        """A page of uploads and the total count, limit 0 means all"""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        self.refresh()
+        with self._lock:
+            files = self._sorted.get(sort)
+            if files is None:
+                key = sort.lstrip("-")
+                files = sorted(
+                    self._files.values(),
+                    key=lambda f: f.ctime
+                    if key == "uploadDate"
+                    else (f.file_name if key == "fileName" else f.size),
+                    reverse=sort.startswith("-"),
+                )
+                self._sorted[sort] = files
+        end = offset + limit if limit else None
+        return files[offset:end], len(files)
+
+
+_indexes: Dict[str, UploadIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_upload_index(upload_dir: str) -> UploadIndex:
+    key = path.abspath(upload_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = UploadIndex(upload_dir)
+        return _indexes[key]
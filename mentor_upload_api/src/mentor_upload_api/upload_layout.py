@@ -0,0 +1,101 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Layout of the upload root. "flat" keeps every upload directly in it,
+"sharded" puts an upload in a subdirectory named after the first two hex
+digits of the sha256 of its mentor, so no directory grows to tens of
+thousands of entries. Uploads are referred to by their path relative to
+the upload root, which is what the worker resolves, and lookups by file
+name work for both layouts. Existing flat uploads are moved with
+
+    python -m mentor_upload_api.upload_layout --root /path/to/uploads
+"""
+import argparse
+import hashlib
+import logging
+from os import environ, makedirs, path, replace, scandir
+from typing import Optional, Tuple
+
+log = logging.getLogger()
+
+SHARD_DIR_NAME_LEN = 2
+
+
+def get_upload_root_layout() -> str:
+    # "flat" or "sharded"
+    return environ.get("UPLOAD_ROOT_LAYOUT") or "flat"
+
+
+def parse_upload_file_name(file_name: str) -> Tuple[str, str]:
+    """mentor and question of an upload named uuid-mentorID-questionID.ext"""
+    name_split = path.splitext(file_name)[0].split("-")
+    if len(name_split) < 3:
+        return "", ""
+    return name_split[-2], name_split[-1]
+
+
+def is_shard_dir_name(name: str) -> bool:
+    return len(name) == SHARD_DIR_NAME_LEN and all(
+        c in "0123456789abcdef" for c in name
+    )
+
+
+def upload_shard(file_name: str) -> str:
+    mentor, _ = parse_upload_file_name(file_name)
+    return hashlib.sha256((mentor or file_name).encode("utf-8")).hexdigest()[
+        :SHARD_DIR_NAME_LEN
+    ]
+
+
+def new_upload_path(file_name: str) -> str:
+    """Where a new upload named file_name goes, relative to the upload root"""
+    if get_upload_root_layout() == "sharded":
+        return path.join(upload_shard(file_name), file_name)
+    return file_name
+
+
+def resolve_upload_path(upload_root: str, file_name: str) -> Optional[str]:
+    """Path relative to upload_root of the existing upload file_name in either layout"""
+    if not file_name or path.basename(file_name) != file_name or file_name[0] == ".":
+        return None
+    for rel_path in (path.join(upload_shard(file_name), file_name), file_name):
+        if path.isfile(path.join(upload_root, rel_path)):
+            return rel_path
+    return None
+
+
+def migrate_upload_root(upload_root: str, dry_run: bool = False) -> int:
+    """Moves the flat uploads in upload_root into their shards, returns how many"""
+    moved = 0
+    for entry in scandir(upload_root):
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        shard_dir = path.join(upload_root, upload_shard(entry.name))
+        log.info("%s -> %s", entry.name, shard_dir)
+        if not dry_run:
+            makedirs(shard_dir, exist_ok=True)
+            replace(entry.path, path.join(shard_dir, entry.name))
+        moved += 1
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="moves flat uploads of an upload root into the sharded layout"
+    )
+    parser.add_argument(
+        "--root", default=environ.get("UPLOAD_ROOT") or "./uploads", help="upload root"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only list the moves")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    moved = migrate_upload_root(args.root, dry_run=args.dry_run)
+    log.info("%s %d uploads", "would move" if args.dry_run else "moved", moved)
+
+
+if __name__ == "__main__":
+    main()
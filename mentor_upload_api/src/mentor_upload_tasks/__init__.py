@@ -30,6 +30,47 @@ def get_queue_cancel_task() -> str:
     return environ.get("CANCEL_TASK_QUEUE_NAME") or "cancel"
 
 
+PRIORITY_LANE_INTERACTIVE = "interactive"
+PRIORITY_LANE_BULK = "bulk"
+# with the redis broker 0 is consumed first and 9 last,
+# interactive work gets 0-4 and bulk work 5-9
+_PRIORITY_LANE_BASE = {PRIORITY_LANE_INTERACTIVE: 0, PRIORITY_LANE_BULK: 5}
+# within a lane shorter media goes first
+_PRIORITY_DURATION_BUCKETS_SECS = [30, 60, 180, 600]
+_PRIORITY_UNKNOWN_DURATION_BUCKET = 2
+
+
+def get_fair_queue_backlog_step() -> int:
+    # a mentor's jobs drop one priority step per this many jobs already pending
+    return int(environ.get("FAIR_QUEUE_BACKLOG_STEP") or "5")
+
+
+def get_task_priority(
+    lane: str, duration_secs: float = -1.0, backlog_jobs: int = 0
+) -> int:
+    bucket = (
+        _PRIORITY_UNKNOWN_DURATION_BUCKET
+        if duration_secs is None or duration_secs < 0
+        else next(
+            (
+                i
+                for i, limit in enumerate(_PRIORITY_DURATION_BUCKETS_SECS)
+                if duration_secs <= limit
+            ),
+            len(_PRIORITY_DURATION_BUCKETS_SECS),
+        )
+    )
+    backlog_penalty = max(backlog_jobs, 0) // max(get_fair_queue_backlog_step(), 1)
+    return _PRIORITY_LANE_BASE[lane] + min(
+        bucket + backlog_penalty, len(_PRIORITY_DURATION_BUCKETS_SECS)
+    )
+
+
+def get_broker_transport_options() -> dict:
+    # one redis list per priority, so a priority is honoured across the whole queue
+    return {"priority_steps": list(range(10)), "sep": ":"}
+
+
 class TrimRequest(TypedDict):
     start: float
     end: float
@@ -22,6 +22,9 @@ from . import (
     get_queue_trim_upload_stage,
     get_queue_transcode_stage,
     get_queue_cancel_task,
+    get_broker_transport_options,
+    get_task_priority,
+    PRIORITY_LANE_INTERACTIVE,
 )
 
 log = logging.getLogger()
@@ -44,6 +47,8 @@ celery_config = {
         or "redis://redis:6379/0"
     ),
     "result_serializer": os.environ.get("CELERY_RESULT_SERIALIZER", "json"),
+    "broker_transport_options": get_broker_transport_options(),
+    "task_default_priority": get_task_priority(PRIORITY_LANE_INTERACTIVE),
     "task_default_queue": get_queue_finalization_stage(),
     "task_default_exchange": get_queue_finalization_stage(),
     "task_default_routing_key": get_queue_finalization_stage(),
@@ -109,24 +114,24 @@ celery.conf.update(celery_config)
 
 
 @celery.task()
-def trim_upload_stage(
-    req: ProcessAnswerRequest,
-):
+def trim_upload_stage(req: ProcessAnswerRequest = None, pipeline_id: str = ""):
     pass
 
 
 @celery.task()
 def transcode_stage(
-    dict_tuple: dict,
-    req: ProcessAnswerRequest,
+    dict_tuple: dict = None,
+    req: ProcessAnswerRequest = None,
+    pipeline_id: str = "",
 ):
     pass
 
 
 @celery.task()
 def transcribe_stage(
-    dict_tuple: dict,
-    req: ProcessAnswerRequest,
+    dict_tuple: dict = None,
+    req: ProcessAnswerRequest = None,
+    pipeline_id: str = "",
 ):
     pass
 
@@ -137,7 +142,11 @@ def trim_existing_upload(req: TrimExistingUploadRequest):
 
 
 @celery.task()
-def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest):
+def finalization_stage(
+    dict_tuple: dict = None,
+    req: ProcessAnswerRequest = None,
+    pipeline_id: str = "",
+):
     pass
 
 
@@ -23,3 +23,23 @@ def app():
     myapp.debug = True
     myapp.response_class = Response
     return myapp
+
+
+@pytest.fixture(autouse=True)
+def reset_aws_clients():
+    # tests patch boto3.client, clients must not outlive a test
+    from mentor_upload_api import aws
+
+    aws.reset_clients()
+    yield
+    aws.reset_clients()
+
+
+@pytest.fixture(autouse=True)
+def clear_jwt_cache():
+    # tests mock jwt.decode per test, verified tokens must not carry over
+    from mentor_upload_api.authorization_decorator import jwt_cache
+
+    jwt_cache.clear()
+    yield
+    jwt_cache.clear()
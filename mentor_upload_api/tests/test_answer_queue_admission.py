@@ -0,0 +1,129 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import io
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_api.blueprints.upload import answer_queue
+
+MENTOR = "mentor-fake-id"
+QUESTION = "question-fake-id"
+
+
+class _RunNow:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def admission(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    monkeypatch.setattr(answer_queue, "_admission_executor", _RunNow())
+    minfo = Mock(video_tracks=[Mock(duration=10000)])
+    with patch.object(
+        answer_queue.MediaInfo, "parse", return_value=minfo
+    ) as mediainfo_parse, patch.object(
+        answer_queue, "is_upload_in_progress", return_value=False
+    ), patch.object(
+        answer_queue, "upload_answer_and_task_update"
+    ) as task_update, patch.object(
+        answer_queue, "upload_to_s3"
+    ) as upload_to_s3, patch.object(
+        answer_queue, "submit_job"
+    ) as submit_job, patch.object(
+        answer_queue, "video_trim_copy"
+    ) as video_trim_copy:
+        yield Mock(
+            mediainfo_parse=mediainfo_parse,
+            task_update=task_update,
+            upload_to_s3=upload_to_s3,
+            submit_job=submit_job,
+            video_trim_copy=video_trim_copy,
+        )
+
+
+def _upload(client, body: dict):
+    return client.post(
+        "/upload/answer-queue",
+        data={
+            "body": json.dumps(body),
+            "video": (io.BytesIO(b"fake video"), "v.mp4"),
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def test_upload_probes_header_and_trims_in_the_background(client, admission):
+    res = _upload(
+        client,
+        {"mentor": MENTOR, "question": QUESTION, "trim": {"start": 1, "end": 5}},
+    )
+    assert res.status_code == 200
+    assert admission.mediainfo_parse.call_args.kwargs == {"parse_speed": 0}
+    file_path, trim_file, start, end = admission.video_trim_copy.call_args.args
+    assert trim_file == f"{file_path}-trim.mp4"
+    assert (start, end) == (1, 5)
+    admission.upload_to_s3.assert_called_once_with(
+        trim_file, f"videos/{MENTOR}/{QUESTION}"
+    )
+    # recorded QUEUED with the response, DONE once trimmed and in s3
+    recorded, trimmed = admission.task_update.call_args_list
+    assert [t["task_name"] for t in res.json["data"]["taskList"]] == [
+        "transcoding-web",
+        "transcoding-mobile",
+        "transcribing",
+        "trim-upload",
+    ]
+    assert res.json["data"]["taskList"][3]["status"] == "QUEUED"
+    assert trimmed.args[1].trim_upload_task["status"] == "DONE"
+    job = admission.submit_job.call_args.args[0]["request"]
+    assert "trim" not in job
+    assert job["trimUploadTask"]["status"] == "DONE"
+
+
+def test_upload_without_trim_sends_the_upload(client, admission):
+    res = _upload(client, {"mentor": MENTOR, "question": QUESTION})
+    assert res.status_code == 200
+    admission.video_trim_copy.assert_not_called()
+    assert admission.upload_to_s3.call_args.args[0].endswith(".mp4")
+    assert admission.task_update.call_count == 1
+    assert admission.submit_job.call_args.args[0]["request"]["trimUploadTask"] is None
+
+
+def test_failed_trim_marks_tasks_failed(client, admission):
+    admission.video_trim_copy.side_effect = Exception("ffmpeg failed")
+    res = _upload(
+        client,
+        {"mentor": MENTOR, "question": QUESTION, "trim": {"start": 1, "end": 5}},
+    )
+    assert res.status_code == 200
+    admission.upload_to_s3.assert_not_called()
+    admission.submit_job.assert_not_called()
+    failed = admission.task_update.call_args.args[1]
+    assert failed.trim_upload_task["status"] == "FAILED"
+
+
+def test_upload_rejects_empty_trim(client, admission):
+    res = _upload(
+        client,
+        {"mentor": MENTOR, "question": QUESTION, "trim": {"start": 5, "end": 5}},
+    )
+    assert res.status_code == 400
+    admission.upload_to_s3.assert_not_called()
+
+
+def test_failed_admission_marks_tasks_failed(client, admission):
+    admission.upload_to_s3.side_effect = Exception("s3 is down")
+    res = _upload(client, {"mentor": MENTOR, "question": QUESTION})
+    assert res.status_code == 200
+    admission.submit_job.assert_not_called()
+    failed = admission.task_update.call_args.args[1]
+    assert failed.transcode_web_task["status"] == "FAILED"
+    assert failed.transcode_mobile_task["status"] == "FAILED"
+    assert failed.trim_upload_task is None
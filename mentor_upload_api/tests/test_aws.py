@@ -0,0 +1,21 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import Mock, patch
+
+from mentor_upload_api import aws
+
+
+@patch("boto3.client")
+def test_clients_are_created_once_per_process(mock_boto3_client: Mock):
+    mock_boto3_client.side_effect = lambda service, **kwargs: Mock(name=service)
+    s3 = aws.get_client("s3")
+    assert aws.get_client("s3") is s3
+    assert aws.get_client("sns") is not s3
+    assert mock_boto3_client.call_count == 2
+    # as seen by a forked child
+    aws._clients_pid = -1
+    assert aws.get_client("s3") is not s3
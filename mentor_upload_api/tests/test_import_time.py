@@ -0,0 +1,42 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import os
+import re
+import subprocess
+import sys
+
+# generous, catches heavy imports (boto3 clients, ...) sneaking back into startup
+IMPORT_TIME_BUDGET_SECS = float(os.environ.get("IMPORT_TIME_BUDGET_SECS") or "3")
+
+
+def test_create_app_does_not_import_boto3_and_stays_in_budget():
+    res = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys; from mentor_upload_api import create_app; create_app(); "
+            "print('boto3' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    assert res.returncode == 0, res.stderr[-2000:]
+    assert res.stdout.strip() == "False"
+    # "import time: self [us] | cumulative | name", the package line closes last
+    cumulative_us = [
+        int(m.group(1))
+        for m in re.finditer(
+            r"import time:\s+\d+ \|\s+(\d+) \| mentor_upload_api$",
+            res.stderr,
+            re.MULTILINE,
+        )
+    ]
+    assert cumulative_us
+    assert cumulative_us[-1] / 1_000_000 < IMPORT_TIME_BUDGET_SECS
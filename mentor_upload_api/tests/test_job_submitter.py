@@ -0,0 +1,110 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from mentor_upload_api.job_submitter import (
+    MAX_BATCH_SIZE,
+    InMemoryJobTopic,
+    JobSubmitter,
+    SnsJobTopic,
+)
+
+
+def _ssm(*arns):
+    ssm = Mock()
+    ssm.get_parameters.side_effect = [{"Parameters": [{"Value": arn}]} for arn in arns]
+    return ssm
+
+
+def test_sns_topic_caches_arn_and_resolves_it_again_after_an_error():
+    sns = Mock()
+    sns.publish.return_value = {"MessageId": "m"}
+    ssm = _ssm("arn:1", "arn:2")
+    topic = SnsJobTopic(sns, ssm, "/mentorpal/test/shared/upload_sns_arn", 600)
+    topic.publish(["a"])
+    topic.publish(["b"])
+    assert ssm.get_parameters.call_count == 1
+    sns.publish.side_effect = Exception("topic not found")
+    try:
+        topic.publish(["c"])
+    except Exception:
+        pass
+    sns.publish.side_effect = None
+    topic.publish(["d"])
+    assert ssm.get_parameters.call_count == 2
+    assert sns.publish.call_args.kwargs == {"TopicArn": "arn:2", "Message": "d"}
+
+
+def test_sns_topic_publishes_batches_and_returns_failed_entries():
+    sns = Mock()
+    sns.publish_batch.return_value = {
+        "Successful": [{"Id": "0"}],
+        "Failed": [{"Id": "1", "Code": "InternalError"}],
+    }
+    topic = SnsJobTopic(sns, _ssm("arn:1"), "p", 600)
+    assert topic.publish(["a", "b"]) == [1]
+    entries = sns.publish_batch.call_args.kwargs["PublishBatchRequestEntries"]
+    assert entries == [{"Id": "0", "Message": "a"}, {"Id": "1", "Message": "b"}]
+
+
+def test_submitter_publishes_in_the_background():
+    topic = InMemoryJobTopic()
+    submitter = JobSubmitter(topic)
+    for i in range(3):
+        submitter.submit({"request": {"question": i}})
+    assert submitter.flush(timeout=5)
+    assert [json.loads(m)["request"]["question"] for m in topic.messages] == [0, 1, 2]
+    assert sum(topic.batch_sizes) == 3
+
+
+def test_submitter_retries_then_gives_up():
+    topic = Mock()
+    topic.publish.side_effect = [Exception("throttled"), [0], [0]]
+    failed = []
+    submitter = JobSubmitter(
+        topic, on_failed=failed.append, max_retries=2, retry_secs=0.001
+    )
+    submitter.submit({"request": {"question": "q"}})
+    assert submitter.flush(timeout=5)
+    assert topic.publish.call_count == 3
+    assert failed == [{"request": {"question": "q"}}]
+
+
+def test_close_hands_unsent_jobs_to_on_failed():
+    topic = Mock()
+    topic.publish.side_effect = Exception("sns unreachable")
+    failed = []
+    submitter = JobSubmitter(
+        topic, on_failed=failed.append, max_retries=100, retry_secs=60
+    )
+    for i in range(MAX_BATCH_SIZE + 2):
+        submitter.submit({"request": {"question": i}})
+    submitter.close(timeout=0.2)
+    assert sorted(r["request"]["question"] for r in failed) == list(
+        range(MAX_BATCH_SIZE + 2)
+    )
+    assert submitter.flush(timeout=0)
+
+
+def test_job_submitter_is_created_once(monkeypatch):
+    from mentor_upload_api.blueprints.upload import answer_queue
+
+    monkeypatch.setenv("JOB_TOPIC_URL", "memory://")
+    monkeypatch.setattr(answer_queue, "_job_submitter", None)
+    registered = []
+    monkeypatch.setattr(
+        answer_queue.atexit, "register", lambda *args: registered.append(args)
+    )
+    with patch.object(answer_queue.aws, "get_client"):
+        with ThreadPoolExecutor(8) as executor:
+            submitters = set(
+                executor.map(lambda _: answer_queue.get_job_submitter(), range(32))
+            )
+    assert len(submitters) == 1
+    assert len(registered) == 1
@@ -0,0 +1,66 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import time
+from unittest.mock import patch
+
+import jsonschema
+import pytest
+
+from mentor_upload_api.blueprints.upload.transfer import transfer_mentor_json_schema
+from mentor_upload_process.json_validation import get_json_validator
+
+from mentor_upload_api.helpers import validate_json
+
+MENTOR_EXPORT = {
+    "mentor": "mentor-fake-id",
+    "mentorExportJson": {},
+    "replacedMentorDataChanges": {},
+}
+
+
+def test_validator_is_compiled_once_per_schema():
+    validator = get_json_validator(transfer_mentor_json_schema)
+    assert get_json_validator(transfer_mentor_json_schema) is validator
+    assert get_json_validator({"type": "object"}) is not validator
+
+
+def test_raises_the_same_error_as_jsonschema_validate():
+    with pytest.raises(jsonschema.ValidationError) as expected:
+        jsonschema.validate(MENTOR_EXPORT, transfer_mentor_json_schema)
+    with pytest.raises(jsonschema.ValidationError) as actual:
+        validate_json(MENTOR_EXPORT, transfer_mentor_json_schema)
+    assert actual.value.message == expected.value.message
+    assert list(actual.value.path) == list(expected.value.path)
+
+
+def _validate_uncached(instance, schema) -> list:
+    # what jsonschema.validate does on every call
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return list(cls(schema).iter_errors(instance))
+
+
+def _time_validations(validate, n: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        validate()
+    return time.perf_counter() - start
+
+
+def test_benchmark_transfer_mentor_schema(record_property):
+    validator = get_json_validator(transfer_mentor_json_schema)
+    uncached = _time_validations(
+        lambda: _validate_uncached(MENTOR_EXPORT, transfer_mentor_json_schema)
+    )
+    cached = _time_validations(lambda: list(validator.iter_errors(MENTOR_EXPORT)))
+    # recorded, not asserted: wall clock ratios are too noisy on shared runners
+    record_property("uncached_secs", uncached)
+    record_property("cached_secs", cached)
+    with patch.object(type(validator), "check_schema") as check_schema:
+        with pytest.raises(jsonschema.ValidationError):
+            validate_json(MENTOR_EXPORT, transfer_mentor_json_schema)
+        check_schema.assert_not_called()
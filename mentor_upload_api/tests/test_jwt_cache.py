@@ -0,0 +1,66 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from flask import Flask
+
+from mentor_upload_api.authorization_decorator import (
+    VerifiedTokenCache,
+    jwt_cache,
+    parse_payload_from_auth_header_jwt,
+)
+
+MENTOR = "mentor-fake-id"
+
+
+def _parse(token: str) -> dict:
+    app = Flask(__name__)
+    with app.test_request_context(headers={"Authorization": f"bearer {token}"}):
+        from flask import request
+
+        return parse_payload_from_auth_header_jwt(request)
+
+
+@pytest.fixture
+def jwt_decode():
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": MENTOR, "role": "USER", "mentorIds": [MENTOR]}
+        yield jwt_decode
+
+
+def test_verified_tokens_are_cached(jwt_decode: Mock):
+    assert _parse("token-a")["id"] == MENTOR
+    assert _parse("token-a")["id"] == MENTOR
+    _parse("token-b")
+    assert jwt_decode.call_count == 2
+    assert jwt_cache.stats() == {"size": 2, "hits": 1, "misses": 2}
+
+
+def test_cached_tokens_expire_with_their_exp(jwt_decode: Mock):
+    jwt_decode.return_value = {
+        "id": MENTOR,
+        "role": "USER",
+        "mentorIds": [MENTOR],
+        "exp": time.time() - 1,
+    }
+    _parse("token-a")
+    _parse("token-a")
+    assert jwt_decode.call_count == 2
+
+
+def test_cache_evicts_least_recently_used():
+    cache = VerifiedTokenCache(2)
+    expires_at = time.time() + 60
+    cache.put("a", {"id": "a"}, expires_at)
+    cache.put("b", {"id": "b"}, expires_at)
+    cache.get("a")
+    cache.put("c", {"id": "c"}, expires_at)
+    assert cache.get("b") is None
+    assert cache.get("a") == {"id": "a"}
+    assert cache.get("c") == {"id": "c"}
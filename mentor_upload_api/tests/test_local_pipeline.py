@@ -0,0 +1,153 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from mentor_upload_api.local_pipeline import (
+    EXTENSION_NAME,
+    LocalUploadPipeline,
+    get_local_pipeline_cancel_store_url,
+)
+
+
+def _wait_for_state(local_pipeline, task_id: str, state: str, timeout_secs=5.0):
+    deadline = time.time() + timeout_secs
+    while local_pipeline.task_state(task_id).state != state:
+        assert time.time() < deadline, local_pipeline.task_state(task_id)
+        time.sleep(0.01)
+
+
+class FakeStages:
+    def __init__(self, fail: str = ""):
+        self.fail = fail
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, stage, dict_tuple, req, task_id, uploads_dir, on_progress):
+        self.calls.append((stage, dict_tuple))
+        if stage == "trim_upload":
+            self.release.wait(5)
+        if stage == self.fail:
+            return None
+        return {"stage": stage}
+
+
+@pytest.fixture
+def make_pipeline():
+    created = []
+
+    def make(stages: FakeStages) -> LocalUploadPipeline:
+        p = LocalUploadPipeline(
+            "/uploads",
+            process_pool=ThreadPoolExecutor(2),
+            thread_pool=ThreadPoolExecutor(2),
+            stage_runner=stages,
+        )
+        created.append(p)
+        return p
+
+    yield make
+    for p in created:
+        p.close()
+
+
+def test_it_runs_stages_in_dependency_order(make_pipeline):
+    stages = FakeStages()
+    local_pipeline = make_pipeline(stages)
+    task_ids = local_pipeline.submit({"mentor": "m1", "video_path": "v.mp4"})
+    assert local_pipeline.task_state(task_ids["finalization"]).state == "PENDING"
+    stages.release.set()
+    _wait_for_state(local_pipeline, task_ids["finalization"], "SUCCESS")
+    assert stages.calls[0] == ("trim_upload", None)
+    assert sorted(stages.calls[1:3]) == [
+        ("transcode", [{"stage": "trim_upload"}]),
+        ("transcribe", [{"stage": "trim_upload"}]),
+    ]
+    assert stages.calls[3] == (
+        "finalization",
+        [[{"stage": "transcode"}, {"stage": "transcribe"}]],
+    )
+    assert local_pipeline.task_state(task_ids["transcode"]).info == {
+        "stage": "transcode"
+    }
+
+
+def test_failed_stage_fails_stages_depending_on_it(make_pipeline):
+    stages = FakeStages(fail="transcribe")
+    stages.release.set()
+    local_pipeline = make_pipeline(stages)
+    task_ids = local_pipeline.submit({"mentor": "m1"})
+    _wait_for_state(local_pipeline, task_ids["finalization"], "FAILURE")
+    assert local_pipeline.task_state(task_ids["transcribe"]).state == "FAILURE"
+    assert "finalization" not in [stage for stage, _ in stages.calls]
+
+
+def test_cancelled_pending_stage_does_not_run(make_pipeline):
+    stages = FakeStages()
+    local_pipeline = make_pipeline(stages)
+    task_ids = local_pipeline.submit({"mentor": "m1"})
+    local_pipeline.cancel(task_ids["transcode"])
+    stages.release.set()
+    _wait_for_state(local_pipeline, task_ids["finalization"], "FAILURE")
+    assert local_pipeline.task_state(task_ids["transcode"]).state == "REVOKED"
+    assert "transcode" not in [stage for stage, _ in stages.calls]
+
+
+def test_cancel_endpoint_stops_running_stage_without_redis(
+    app, client, tmpdir, monkeypatch
+):
+    from mentor_upload_process.cancellation import CancellationToken
+
+    monkeypatch.delenv("CANCEL_STORE_URL", raising=False)
+    monkeypatch.setenv("CELERY_BROKER_URL", "redis://unreachable:6379/0")
+    store_url = get_local_pipeline_cancel_store_url(str(tmpdir))
+    started = threading.Event()
+
+    def stages(stage, dict_tuple, req, task_id, uploads_dir, on_progress):
+        # like a process stage, stops once it sees its cancel request
+        token = CancellationToken(task_id, poll_interval_secs=0, store_url=store_url)
+        started.set()
+        deadline = time.time() + 5
+        while not token.is_cancelled():
+            if time.time() > deadline:
+                return {"stage": stage}
+            time.sleep(0.01)
+        return None
+
+    local_pipeline = LocalUploadPipeline(
+        str(tmpdir),
+        process_pool=ThreadPoolExecutor(2),
+        thread_pool=ThreadPoolExecutor(2),
+        stage_runner=stages,
+    )
+    app.extensions[EXTENSION_NAME] = local_pipeline
+    try:
+        task_ids = local_pipeline.submit({"mentor": "m1"})
+        assert started.wait(5)
+        with patch(
+            "mentor_upload_api.authorization_decorator.jwt.decode",
+            return_value={"id": "admin-fake-id", "role": "ADMIN", "mentorIds": []},
+        ):
+            res = client.post(
+                "/upload/answer/cancel",
+                json={
+                    "mentor": "mentor-fake-id",
+                    "question": "question-fake-id",
+                    "task_ids_to_cancel": [task_ids["trim_upload"]],
+                },
+                headers={"Authorization": "bearer abcdefg1234567"},
+            )
+        assert res.status_code == 200
+        assert res.json["data"]["cancelledIds"] == [task_ids["trim_upload"]]
+        _wait_for_state(local_pipeline, task_ids["trim_upload"], "FAILURE")
+        assert tmpdir.join(".cancel").check(dir=1)
+    finally:
+        local_pipeline.close()
@@ -0,0 +1,105 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import patch
+
+import pytest
+
+MENTOR = "mentor-fake-id"
+FILE_NAME = "1111-aaaa-m1-q1.mp4"
+AUTH_HEADERS = {"Authorization": "bearer abcdefg1234567"}
+
+
+@pytest.fixture
+def uploads(tmpdir, monkeypatch):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    tmpdir.join(FILE_NAME).write_binary(bytes(range(256)) * 4)
+    return tmpdir
+
+
+@pytest.fixture
+def admin():
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": MENTOR, "role": "ADMIN", "mentorIds": []}
+        yield
+
+
+@pytest.mark.parametrize("blueprint", ["answer", "answer-queue"])
+def test_download_mounted_file_ranges_and_etags(client, uploads, admin, blueprint):
+    url = f"/upload/{blueprint}/download_mounted_file/{FILE_NAME}"
+    res = client.get(url, headers=AUTH_HEADERS)
+    assert res.status_code == 200
+    assert res.headers["Accept-Ranges"] == "bytes"
+    assert len(res.data) == 1024
+    etag = res.headers["ETag"]
+    res.close()
+    res = client.get(url, headers={**AUTH_HEADERS, "Range": "bytes=256-511"})
+    assert res.status_code == 206
+    assert res.headers["Content-Range"] == "bytes 256-511/1024"
+    assert res.data == bytes(range(256))
+    res.close()
+    res = client.get(url, headers={**AUTH_HEADERS, "If-None-Match": etag})
+    assert res.status_code == 304
+    res.close()
+
+
+def test_download_missing_files_is_not_found(client, uploads, admin):
+    res = client.get(
+        "/upload/answer/download_mounted_file/2222-bbbb-m1-q2.mp4",
+        headers=AUTH_HEADERS,
+    )
+    assert res.status_code == 404
+    res = client.get("/upload/answer/download_video/m2/q1")
+    assert res.status_code == 404
+
+
+def test_download_video_finds_latest_upload(client, uploads):
+    res = client.get("/upload/answer/download_video/m1/q1")
+    assert res.status_code == 200
+    assert FILE_NAME in res.headers["Content-Disposition"]
+    res.close()
+
+
+def test_download_offload_to_nginx(client, uploads, admin, monkeypatch):
+    monkeypatch.setenv("DOWNLOAD_OFFLOAD", "x-accel-redirect")
+    monkeypatch.setenv("UPLOAD_ROOT_LAYOUT", "sharded")
+    from mentor_upload_api.upload_layout import migrate_upload_root, upload_shard
+
+    migrate_upload_root(str(uploads))
+    res = client.get(
+        f"/upload/answer/download_mounted_file/{FILE_NAME}", headers=AUTH_HEADERS
+    )
+    assert res.status_code == 200
+    assert res.data == b""
+    assert (
+        res.headers["X-Accel-Redirect"]
+        == f"/protected-uploads/{upload_shard(FILE_NAME)}/{FILE_NAME}"
+    )
+    assert res.headers["Content-Type"] == "video/mp4"
+    monkeypatch.setenv("DOWNLOAD_OFFLOAD", "x-sendfile")
+    res = client.get(
+        f"/upload/answer/download_mounted_file/{FILE_NAME}", headers=AUTH_HEADERS
+    )
+    assert res.headers["Accept-Ranges"] == "bytes"
+    assert res.headers["X-Sendfile"] == str(
+        uploads.join(upload_shard(FILE_NAME), FILE_NAME)
+    )
+
+
+def test_download_video_redirects_to_s3(client, uploads, monkeypatch):
+    monkeypatch.setenv("DOWNLOAD_S3_REDIRECT", "true")
+    monkeypatch.setenv("STATIC_AWS_S3_BUCKET", "mentorpal-origin")
+    with patch("mentor_upload_api.aws.get_client") as get_client:
+        get_client.return_value.generate_presigned_url.return_value = (
+            "https://s3.example/videos/m1/q1/original.mp4?sig"
+        )
+        res = client.get("/upload/answer/download_video/m1/q1")
+        assert res.status_code == 302
+        assert res.headers["Location"] == (
+            "https://s3.example/videos/m1/q1/original.mp4?sig"
+        )
+        _, kwargs = get_client.return_value.generate_presigned_url.call_args
+        assert kwargs["Params"]["Key"] == "videos/m1/q1/original.mp4"
@@ -0,0 +1,57 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from mentor_upload_api import pipeline
+from mentor_upload_api.pipeline import PipelineStage, start_pipeline
+
+
+@pytest.fixture(autouse=True)
+def memory_pipeline_store(monkeypatch):
+    monkeypatch.setenv("PIPELINE_STORE_URL", "memory://")
+    monkeypatch.setattr(pipeline, "_store", None)
+
+
+def _task(name: str) -> Mock:
+    task = Mock()
+    task.name = f"mentor_upload_tasks.tasks.{name}"
+    return task
+
+
+def test_it_sends_only_stages_without_dependencies():
+    trim, transcode, finalization = _task("trim"), _task("transcode"), _task("final")
+    task_ids = start_pipeline(
+        {
+            "trim": PipelineStage(trim, "trim_upload", 1),
+            "transcode": PipelineStage(transcode, "transcode", 1, deps=["trim"]),
+            "final": PipelineStage(
+                finalization, "finalization", 1, deps=["trim", "transcode"]
+            ),
+        },
+        {"mentor": "m1"},
+    )
+    assert set(task_ids) == {"trim", "transcode", "final"}
+    assert len(set(task_ids.values())) == 3
+    trim.apply_async.assert_called_once()
+    pipeline_id = trim.apply_async.call_args.kwargs["kwargs"]["pipeline_id"]
+    assert trim.apply_async.call_args.kwargs["task_id"] == task_ids["trim"]
+    transcode.apply_async.assert_not_called()
+    finalization.apply_async.assert_not_called()
+    spec, req, waiting = pipeline._get_store().get(
+        pipeline_id, ["spec", "req", "waiting:final"]
+    )
+    assert json.loads(spec)["final"]["task_id"] == task_ids["final"]
+    assert json.loads(req) == {"mentor": "m1"}
+    assert waiting == "2"
+
+
+def test_it_rejects_dependencies_on_unknown_stages():
+    with pytest.raises(ValueError):
+        start_pipeline({"a": PipelineStage(_task("a"), "q", 1, deps=["b"])}, {})
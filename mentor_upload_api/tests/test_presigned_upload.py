@@ -0,0 +1,134 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_api.blueprints.upload import answer_queue
+
+MENTOR = "mentor-fake-id"
+QUESTION = "question-fake-id"
+
+
+@pytest.fixture
+def authorized():
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": MENTOR, "role": "USER", "mentorIds": [MENTOR]}
+        yield
+
+
+@pytest.fixture
+def s3_client():
+    with patch.object(answer_queue, "s3_client") as s3_client_factory:
+        s3_client = s3_client_factory.return_value
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+        s3_client.generate_presigned_url.side_effect = (
+            lambda op, Params, ExpiresIn: f"https://s3/{Params['PartNumber']}"
+        )
+        s3_client.head_object.return_value = {"ContentLength": 1000, "ETag": "e"}
+        yield s3_client
+
+
+def _post(client, route: str, body: dict):
+    return client.post(
+        f"/upload/answer-queue/presigned/{route}",
+        json=body,
+        headers={"Authorization": "bearer abcdefg1234567"},
+    )
+
+
+@patch.object(answer_queue, "is_upload_in_progress", Mock(return_value=False))
+def test_start_returns_a_presigned_url_per_part(client, authorized, s3_client):
+    res = _post(client, "start", {"mentor": MENTOR, "question": QUESTION, "parts": 2})
+    assert res.status_code == 200
+    assert res.json["data"]["uploadId"] == "upload-1"
+    assert res.json["data"]["key"] == f"videos/{MENTOR}/{QUESTION}/original.mp4"
+    assert res.json["data"]["parts"] == [
+        {"partNumber": 1, "url": "https://s3/1"},
+        {"partNumber": 2, "url": "https://s3/2"},
+    ]
+
+
+@patch.object(answer_queue, "submit_job")
+@patch.object(answer_queue, "upload_answer_and_task_update")
+def test_complete_submits_job_that_trims(
+    mock_task_update, mock_submit_job, client, authorized, s3_client
+):
+    res = _post(
+        client,
+        "complete",
+        {
+            "mentor": MENTOR,
+            "question": QUESTION,
+            "uploadId": "upload-1",
+            "parts": [{"partNumber": 2, "etag": "b"}, {"partNumber": 1, "etag": "a"}],
+            "trim": {"start": 1, "end": 5},
+        },
+    )
+    assert res.status_code == 200
+    assert [c[0] for c in s3_client.method_calls] == [
+        "complete_multipart_upload",
+        "head_object",
+        "delete_objects",
+    ]
+    assert s3_client.complete_multipart_upload.call_args.kwargs["MultipartUpload"] == {
+        "Parts": [{"PartNumber": 1, "ETag": "a"}, {"PartNumber": 2, "ETag": "b"}]
+    }
+    job = mock_submit_job.call_args.args[0]["request"]
+    assert job["video"] == f"videos/{MENTOR}/{QUESTION}/original.mp4"
+    assert job["trim"] == {"start": 1, "end": 5}
+    assert job["trimUploadTask"]["status"] == "QUEUED"
+    assert [t["task_name"] for t in res.json["data"]["taskList"]] == [
+        "transcoding-web",
+        "transcoding-mobile",
+        "transcribing",
+        "trim-upload",
+    ]
+
+
+@patch.object(answer_queue, "submit_job")
+def test_complete_rejects_empty_upload(mock_submit_job, client, authorized, s3_client):
+    s3_client.head_object.return_value = {"ContentLength": 0}
+    res = _post(
+        client,
+        "complete",
+        {
+            "mentor": MENTOR,
+            "question": QUESTION,
+            "uploadId": "upload-1",
+            "parts": [{"partNumber": 1, "etag": "a"}],
+        },
+    )
+    assert res.status_code == 400
+    s3_client.delete_object.assert_called_once()
+    s3_client.delete_objects.assert_not_called()
+    mock_submit_job.assert_not_called()
+
+
+@patch.object(answer_queue, "submit_job")
+def test_failed_complete_keeps_the_answer_media(
+    mock_submit_job, client, authorized, s3_client
+):
+    from botocore.exceptions import ClientError
+
+    s3_client.complete_multipart_upload.side_effect = ClientError(
+        {"Error": {"Code": "InvalidPart"}}, "CompleteMultipartUpload"
+    )
+    res = _post(
+        client,
+        "complete",
+        {
+            "mentor": MENTOR,
+            "question": QUESTION,
+            "uploadId": "upload-1",
+            "parts": [{"partNumber": 1, "etag": "a"}],
+        },
+    )
+    assert res.status_code == 400
+    s3_client.abort_multipart_upload.assert_called_once()
+    s3_client.delete_objects.assert_not_called()
+    mock_submit_job.assert_not_called()
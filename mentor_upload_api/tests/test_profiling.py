@@ -0,0 +1,68 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import patch
+
+import pytest
+from mentor_upload_process import profiling as profiling_core
+
+from mentor_upload_api import profiling
+
+PROFILE_HEADERS = {profiling.PROFILE_HEADER: "1"}
+
+
+@pytest.fixture(autouse=True)
+def profiling_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("PROFILING_ENABLED", raising=False)
+    monkeypatch.setenv("PROFILING_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling_core, "_last_profile_started", 0.0)
+    monkeypatch.setattr(profiling_core, "_active", False)
+    return tmp_path
+
+
+def _profiled(app, headers: dict) -> bool:
+    with app.test_request_context("/upload/ping/", headers=headers):
+        return profiling.is_profiling_requested()
+
+
+def test_anonymous_profile_header_is_ignored_unless_enabled(app, monkeypatch):
+    assert not _profiled(app, PROFILE_HEADERS)
+    monkeypatch.setenv("PROFILING_ENABLED", "true")
+    assert _profiled(app, PROFILE_HEADERS)
+    assert not _profiled(app, {})
+
+
+@pytest.mark.parametrize("role,expected", [("ADMIN", True), ("USER", False)])
+def test_admins_can_request_a_profile(app, role, expected):
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {
+            "id": "mentor-fake-id",
+            "role": role,
+            "mentorIds": [],
+        }
+        assert (
+            _profiled(
+                app,
+                {**PROFILE_HEADERS, "Authorization": "bearer abcdefg1234567"},
+            )
+            == expected
+        )
+
+
+def test_anonymous_request_with_header_writes_no_profile(client, profiling_env):
+    res = client.get("/upload/ping/", headers=PROFILE_HEADERS)
+    assert res.status_code == 200
+    assert list(profiling_env.iterdir()) == []
+
+
+def test_profiled_request_asks_the_worker_to_profile_its_tasks(app, monkeypatch):
+    headers: dict = {}
+    with app.test_request_context("/upload/answer/", headers=PROFILE_HEADERS):
+        profiling._before_task_publish(headers=headers)
+        assert headers == {}
+        monkeypatch.setenv("PROFILING_ENABLED", "true")
+        profiling._before_task_publish(headers=headers)
+    assert headers == {profiling.PROFILE_TASK_HEADER: True}
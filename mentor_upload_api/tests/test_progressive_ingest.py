@@ -0,0 +1,132 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import io
+import json
+import os
+import subprocess
+from os import path
+from struct import pack
+
+import pytest
+from flask import Flask, jsonify, request
+
+from mentor_upload_api import progressive_ingest, streaming_upload
+from mentor_upload_api.progressive_ingest import ProgressiveIngest, find_mp4_header_end
+
+
+def _box(box: bytes, payload_size: int) -> bytes:
+    return pack(">I4s", 8 + payload_size, box) + b"\0" * payload_size
+
+
+@pytest.mark.parametrize(
+    "head,expected",
+    [
+        (_box(b"ftyp", 16) + _box(b"moov", 100) + _box(b"mdat", 10), 24 + 108),
+        (_box(b"ftyp", 16) + _box(b"moof", 40), 24 + 48),
+        (_box(b"ftyp", 16) + _box(b"mdat", 100) + _box(b"moov", 10), -1),
+        # a moov header is enough, its payload hasn't arrived yet
+        (_box(b"ftyp", 16) + pack(">I4s", 5000, b"moov"), 24 + 5000),
+        (_box(b"ftyp", 16)[:20], None),
+        (_box(b"ftyp", 16) + _box(b"free", 4), None),
+        (b"", None),
+        # 64 bit box size
+        (_box(b"ftyp", 16) + pack(">I4sQ", 1, b"moov", 70000), 24 + 70000),
+    ],
+)
+def test_find_mp4_header_end(head, expected):
+    assert find_mp4_header_end(head) == expected
+
+
+def test_ingest_turns_off_for_uploads_that_are_not_streamable(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    source = tmpdir.join("v.part")
+    content = _box(b"ftyp", 16) + _box(b"mdat", 200 * 1024)
+    source.write_binary(content)
+    ingest = ProgressiveIngest(str(source), "v")
+    ingest.feed(len(content))
+    assert ingest.state == "off"
+    assert ingest.finish() == ""
+    assert not tmpdir.join(".early").exists()
+
+
+@pytest.fixture
+def upload_app(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    monkeypatch.setenv("PROGRESSIVE_INGEST_ENABLED", "true")
+    app = Flask(__name__)
+    streaming_upload.init_app(app)
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        return jsonify(
+            {
+                name: f.stream.progressive_ingest is not None
+                for name, f in request.files.items()
+            }
+        )
+
+    return app
+
+
+def test_ingest_is_attached_to_video_parts_and_cancelled_if_unclaimed(
+    upload_app, monkeypatch
+):
+    cancelled = []
+    monkeypatch.setattr(
+        progressive_ingest.ProgressiveIngest,
+        "cancel",
+        lambda self: cancelled.append(self.name),
+    )
+    res = upload_app.test_client().post(
+        "/upload",
+        data={
+            "video": (io.BytesIO(b"x" * 10), "v.mp4", "video/mp4"),
+            "other": (io.BytesIO(b"x" * 10), "o.txt", "text/plain"),
+        },
+        content_type="multipart/form-data",
+    )
+    assert res.status_code == 200
+    assert res.json == {"video": True, "other": False}
+    assert len(cancelled) == 1
+
+
+class _FakeFfmpeg:
+    def __init__(self, *args, **kwargs):
+        self.stdin = io.BytesIO()
+        self.stdin.close = lambda: None
+        self.waits = 0
+
+    def wait(self, timeout=None):
+        self.waits += 1
+        if self.waits == 1:
+            # still encoding after the upload is done
+            raise subprocess.TimeoutExpired("ffmpeg", timeout)
+        return 0
+
+    def kill(self):
+        pass
+
+
+def test_ingest_beats_while_ffmpeg_runs(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    monkeypatch.setenv("PROGRESSIVE_INGEST_HEARTBEAT_SECS", "0")
+    monkeypatch.setattr(progressive_ingest.subprocess, "Popen", _FakeFfmpeg)
+    beats = []
+    monkeypatch.setattr(
+        progressive_ingest.os, "utime", lambda p, *args: beats.append(p)
+    )
+    source = tmpdir.join("v.part")
+    source.write_binary(b"x" * 100)
+    ingest = ProgressiveIngest(str(source), "v")
+    ingest.feed(100)
+    ingest._start_encoding((640, 480))
+    assert ingest.finish() == path.join(".early", "v")
+    ingest._pump_thread.join(5)
+    early = tmpdir.join(".early", "v")
+    assert json.loads(early.join("heartbeat.json").read())["pid"] == os.getpid()
+    assert json.loads(early.join("done.json").read()) == {"ok": True}
+    assert beats and all(b == str(early.join("heartbeat.json")) for b in beats)
@@ -0,0 +1,64 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+from unittest.mock import patch
+
+import pytest
+from flask import Flask, jsonify
+
+from mentor_upload_api import helpers
+from mentor_upload_api.authorization_decorator import authorize_to_edit_mentor
+from mentor_upload_api.helpers import validate_json_payload_decorator
+
+MENTOR = "mentor-fake-id"
+
+body_schema = {
+    "type": "object",
+    "properties": {"mentor": {"type": "string"}, "question": {"type": "string"}},
+    "required": ["mentor", "question"],
+}
+
+
+@pytest.fixture
+def body_app():
+    app = Flask(__name__)
+
+    @app.route("/edit", methods=["POST"])
+    @validate_json_payload_decorator(json_schema=body_schema)
+    @authorize_to_edit_mentor
+    def edit(body):
+        return jsonify({"question": body["question"]})
+
+    return app
+
+
+@pytest.fixture
+def authorized():
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": MENTOR, "role": "USER", "mentorIds": [MENTOR]}
+        yield
+
+
+@pytest.mark.parametrize("as_form", [True, False])
+def test_body_is_decoded_and_validated_once_per_request(body_app, authorized, as_form):
+    body = {"mentor": MENTOR, "question": "q1"}
+    with patch.object(
+        helpers.json, "loads", wraps=json.loads
+    ) as json_loads, patch.object(
+        helpers, "validate_json", wraps=helpers.validate_json
+    ) as validate_json:
+        res = body_app.test_client().post(
+            "/edit",
+            headers={"Authorization": "bearer abcdefg1234567"},
+            **({"data": {"body": json.dumps(body)}} if as_form else {"json": body}),
+        )
+    assert res.status_code == 200
+    assert res.json == {"question": "q1"}
+    # json is the stdlib module, so this also counts flask decoding request.json
+    assert json_loads.call_count == 1
+    # once per schema: the body's and authorize_to_edit_mentor's
+    assert validate_json.call_count == 2
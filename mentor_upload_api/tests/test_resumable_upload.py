@@ -0,0 +1,107 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import base64
+import hashlib
+from os import listdir, path
+from unittest.mock import patch
+
+import pytest
+from flask import jsonify
+
+from mentor_upload_api.authorization_decorator import jwt_cache
+from mentor_upload_api.blueprints.upload import answer
+
+MENTOR = "mentor-fake-id"
+QUESTION = "question-fake-id"
+AUTH = {"Authorization": "bearer abcdefg1234567"}
+CONTENT = b"0123456789" * 1000
+
+
+@pytest.fixture(autouse=True)
+def upload_root(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": MENTOR, "role": "USER", "mentorIds": [MENTOR]}
+        yield tmpdir
+
+
+def _create(client, **body) -> str:
+    res = client.post(
+        "/upload/answer/resumable",
+        json={
+            "mentor": MENTOR,
+            "question": QUESTION,
+            "fileName": "answer.mp4",
+            "size": len(CONTENT),
+            **body,
+        },
+        headers=AUTH,
+    )
+    assert res.status_code == 201
+    return res.json["data"]["uploadId"]
+
+
+def _append(client, upload_id: str, offset: int, chunk: bytes, checksum=None):
+    headers = {**AUTH, "Upload-Offset": str(offset)}
+    if checksum is not None:
+        headers["Upload-Checksum"] = f"sha256 {base64.b64encode(checksum).decode()}"
+    return client.patch(
+        f"/upload/answer/resumable/{upload_id}", data=chunk, headers=headers
+    )
+
+
+def _offset(client, upload_id: str) -> int:
+    res = client.head(f"/upload/answer/resumable/{upload_id}", headers=AUTH)
+    return int(res.headers["Upload-Offset"])
+
+
+@patch.object(answer, "process_saved_upload")
+def test_it_resumes_at_offset_and_finalizes(
+    mock_process_saved_upload, client, upload_root
+):
+    mock_process_saved_upload.return_value = jsonify({"data": {"taskList": []}})
+    upload_id = _create(client, sha256=hashlib.sha256(CONTENT).hexdigest())
+    assert _append(client, upload_id, 0, CONTENT[:4000]).status_code == 204
+    # a retried chunk at a stale offset is rejected
+    assert _append(client, upload_id, 0, CONTENT[:4000]).status_code == 409
+    assert _offset(client, upload_id) == 4000
+    res = _append(client, upload_id, 4000, CONTENT[4000:])
+    assert res.headers["Upload-Offset"] == str(len(CONTENT))
+    res = client.post(f"/upload/answer/resumable/{upload_id}/finalize", headers=AUTH)
+    assert res.status_code == 200
+    body, file_name = mock_process_saved_upload.call_args.args
+    assert body == {"mentor": MENTOR, "question": QUESTION}
+    assert file_name.endswith(f"-{MENTOR}-{QUESTION}.mp4")
+    with open(path.join(upload_root, file_name), "rb") as f:
+        assert f.read() == CONTENT
+    assert listdir(path.join(upload_root, ".resumable")) == []
+
+
+def test_it_rejects_chunk_with_wrong_checksum(client):
+    upload_id = _create(client)
+    chunk = CONTENT[:1000]
+    res = _append(client, upload_id, 0, chunk, hashlib.sha256(b"other").digest())
+    assert res.status_code == 460
+    assert _offset(client, upload_id) == 0
+    res = _append(client, upload_id, 0, chunk, hashlib.sha256(chunk).digest())
+    assert res.status_code == 204
+
+
+def test_it_does_not_finalize_incomplete_upload(client):
+    upload_id = _create(client)
+    _append(client, upload_id, 0, CONTENT[:10])
+    res = client.post(f"/upload/answer/resumable/{upload_id}/finalize", headers=AUTH)
+    assert res.status_code == 409
+
+
+def test_it_only_lets_the_mentor_access_upload(client):
+    upload_id = _create(client)
+    # stands in for another user's token, the test reuses the same one
+    jwt_cache.clear()
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": "other", "role": "USER", "mentorIds": []}
+        assert _append(client, upload_id, 0, CONTENT[:10]).status_code == 401
@@ -0,0 +1,68 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import hashlib
+import io
+from os import listdir, path
+
+import pytest
+from flask import Flask, jsonify, request
+
+from mentor_upload_api import streaming_upload
+from mentor_upload_api.streaming_upload import StreamingUploadRequest, save_upload
+
+
+@pytest.fixture
+def upload_app(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", str(tmpdir))
+    app = Flask(__name__)
+    streaming_upload.init_app(app)
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        if request.form.get("skip_save"):
+            return jsonify({"saved": False})
+        size, sha256 = save_upload(request.files["video"], path.join(tmpdir, "v.mp4"))
+        return jsonify({"size": size, "sha256": sha256})
+
+    return app
+
+
+def _post(app, content: bytes, **form):
+    return app.test_client().post(
+        "/upload",
+        data={"video": (io.BytesIO(content), "v.mp4"), **form},
+        content_type="multipart/form-data",
+    )
+
+
+def test_it_hashes_upload_and_renames_it_into_place(upload_app, tmpdir):
+    content = b"0123456789" * 100000
+    res = _post(upload_app, content)
+    assert res.json == {
+        "size": len(content),
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+    with open(path.join(tmpdir, "v.mp4"), "rb") as f:
+        assert f.read() == content
+    assert listdir(path.join(tmpdir, ".incoming")) == []
+
+
+def test_it_discards_upload_that_was_not_saved(upload_app, tmpdir):
+    res = _post(upload_app, b"abc", skip_save="1")
+    assert res.json == {"saved": False}
+    assert listdir(path.join(tmpdir, ".incoming")) == []
+
+
+def test_it_rejects_upload_over_max_size(upload_app, monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_MAX_BYTES", "1000")
+    res = _post(upload_app, b"x" * 5000)
+    assert res.status_code == 413
+    assert not path.exists(path.join(tmpdir, "v.mp4"))
+
+
+def test_app_uses_streaming_request(app):
+    assert app.request_class is StreamingUploadRequest
@@ -0,0 +1,51 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import pytest
+
+from mentor_upload_tasks import (
+    PRIORITY_LANE_BULK,
+    PRIORITY_LANE_INTERACTIVE,
+    get_task_priority,
+)
+
+
+@pytest.mark.parametrize(
+    "lane,duration_secs,expected_priority",
+    [
+        (PRIORITY_LANE_INTERACTIVE, 12.5, 0),
+        (PRIORITY_LANE_INTERACTIVE, 30, 0),
+        (PRIORITY_LANE_INTERACTIVE, 45, 1),
+        (PRIORITY_LANE_INTERACTIVE, 120, 2),
+        (PRIORITY_LANE_INTERACTIVE, 2400, 4),
+        (PRIORITY_LANE_INTERACTIVE, -1, 2),
+        (PRIORITY_LANE_BULK, 12.5, 5),
+        (PRIORITY_LANE_BULK, 2400, 9),
+        (PRIORITY_LANE_BULK, -1, 7),
+    ],
+)
+def test_it_orders_by_lane_then_duration(lane, duration_secs, expected_priority):
+    assert get_task_priority(lane, duration_secs) == expected_priority
+
+
+def test_any_interactive_job_goes_before_any_bulk_job():
+    assert max(
+        get_task_priority(PRIORITY_LANE_INTERACTIVE, d) for d in [-1, 0, 10000]
+    ) < min(get_task_priority(PRIORITY_LANE_BULK, d) for d in [-1, 0, 10000])
+
+
+@pytest.mark.parametrize(
+    "backlog_jobs,expected_priority",
+    [(0, 0), (4, 0), (5, 1), (12, 2), (100, 4)],
+)
+def test_mentor_backlog_lowers_priority_within_lane(
+    monkeypatch, backlog_jobs, expected_priority
+):
+    monkeypatch.setenv("FAIR_QUEUE_BACKLOG_STEP", "5")
+    assert (
+        get_task_priority(PRIORITY_LANE_INTERACTIVE, 10, backlog_jobs=backlog_jobs)
+        == expected_priority
+    )
@@ -0,0 +1,48 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+
+import pytest
+
+
+def test_it_continues_trace_from_request_header(client):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    res = client.get(
+        "/upload/ping/",
+        headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+    )
+    assert res.status_code == 200
+    assert res.headers["traceparent"].startswith(f"00-{trace_id}-")
+
+
+@pytest.mark.parametrize("traceparent", ["", "garbage", "00-abc-def-01"])
+def test_it_starts_new_trace_for_missing_or_invalid_header(client, traceparent):
+    res = client.get("/upload/ping/", headers={"traceparent": traceparent})
+    assert res.status_code == 200
+    _, trace_id, span_id, _ = res.headers["traceparent"].split("-")
+    assert len(trace_id) == 32
+    assert len(span_id) == 16
+
+
+def test_it_exports_request_span_to_file_when_enabled(app, monkeypatch, tmp_path):
+    from mentor_upload_process import tracing
+
+    export_file = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACING_ENABLED", "true")
+    monkeypatch.setenv("TRACE_EXPORT_FILE", str(export_file))
+    monkeypatch.setattr(tracing, "_exporter", None)
+    # pytest-flask's client keeps the request context (and the span) open
+    res = app.test_client().get("/upload/ping/")
+    assert res.status_code == 200
+    spans = [json.loads(line) for line in export_file.read_text().splitlines()]
+    assert len(spans) == 1
+    assert spans[0]["kind"] == "server"
+    assert spans[0]["parent_id"] == ""
+    assert spans[0]["attributes"]["http.status_code"] == "200"
+    assert res.headers["traceparent"] == (
+        f"00-{spans[0]['trace_id']}-{spans[0]['span_id']}-01"
+    )
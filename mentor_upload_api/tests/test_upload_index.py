@@ -0,0 +1,90 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from os import utime
+from unittest.mock import patch
+
+import pytest
+
+from mentor_upload_api.upload_index import UploadIndex, parse_upload_file_name
+
+MENTOR = "mentor-fake-id"
+
+
+def _upload(tmpdir, name: str, size: int):
+    f = tmpdir.join(name)
+    f.write("x" * size)
+    return f
+
+
+@pytest.fixture
+def uploads(tmpdir):
+    _upload(tmpdir, "1111-aaaa-m1-q1.mp4", 10)
+    _upload(tmpdir, "2222-bbbb-m1-q2.mp4", 30)
+    _upload(tmpdir, "3333-cccc-m2-q1.mp4", 20)
+    tmpdir.mkdir(".incoming").join("x.part").write("x")
+    return tmpdir
+
+
+def test_parse_upload_file_name():
+    assert parse_upload_file_name("1111-aaaa-m1-q1.mp4") == ("m1", "q1")
+    assert parse_upload_file_name("notes.txt") == ("", "")
+
+
+def test_lists_sorted_pages(uploads):
+    index = UploadIndex(str(uploads))
+    files, total = index.list("-size", offset=1, limit=1)
+    assert total == 3
+    assert [f.file_name for f in files] == ["3333-cccc-m2-q1.mp4"]
+    files, _ = index.list("fileName")
+    assert [f.file_name for f in files] == [
+        "1111-aaaa-m1-q1.mp4",
+        "2222-bbbb-m1-q2.mp4",
+        "3333-cccc-m2-q1.mp4",
+    ]
+    with pytest.raises(ValueError):
+        index.list("owner")
+
+
+def test_finds_uploads_by_mentor_and_question(uploads):
+    index = UploadIndex(str(uploads))
+    assert index.find("m1", "q2").file_name == "2222-bbbb-m1-q2.mp4"
+    assert index.find("m3", "q1") is None
+    _upload(uploads, "4444-dddd-m3-q1.mp4", 5)
+    assert index.find("m3", "q1").file_name == "4444-dddd-m3-q1.mp4"
+
+
+def test_only_rescans_when_the_directory_changed(uploads):
+    index = UploadIndex(str(uploads))
+    index.refresh()
+    # make the last change look older than the same-tick guard
+    utime(str(uploads), (1_000_000, 1_000_000))
+    index.refresh()
+    with patch("mentor_upload_api.upload_index.scandir") as scandir:
+        index.list()
+        index.find("m1", "q1")
+        scandir.assert_not_called()
+    uploads.join("1111-aaaa-m1-q1.mp4").remove()
+    files, total = index.list()
+    assert total == 2
+
+
+def test_mounted_files_endpoint_pages(client, uploads, monkeypatch):
+    monkeypatch.setenv("UPLOAD_ROOT", str(uploads))
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {"id": MENTOR, "role": "ADMIN", "mentorIds": []}
+        res = client.get(
+            "/upload/answer/mounted_files?sort=size&limit=2",
+            headers={"Authorization": "bearer abcdefg1234567"},
+        )
+        assert res.status_code == 200
+        assert res.json["data"]["total"] == 3
+        assert [f["size"] for f in res.json["data"]["mountedFiles"]] == [10, 20]
+        res = client.get(
+            "/upload/answer/mounted_files?sort=owner",
+            headers={"Authorization": "bearer abcdefg1234567"},
+        )
+        assert res.status_code == 400
@@ -0,0 +1,51 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from os import path
+
+from mentor_upload_api.upload_index import UploadIndex
+from mentor_upload_api.upload_layout import (
+    migrate_upload_root,
+    new_upload_path,
+    resolve_upload_path,
+    upload_shard,
+)
+
+FILE_NAME = "1111-aaaa-m1-q1.mp4"
+
+
+def test_new_uploads_go_to_the_mentor_shard(monkeypatch):
+    assert new_upload_path(FILE_NAME) == FILE_NAME
+    monkeypatch.setenv("UPLOAD_ROOT_LAYOUT", "sharded")
+    assert new_upload_path(FILE_NAME) == path.join(upload_shard(FILE_NAME), FILE_NAME)
+    assert upload_shard(FILE_NAME) == upload_shard("2222-bbbb-m1-q2.mp4")
+
+
+def test_resolves_uploads_in_either_layout(tmpdir):
+    tmpdir.join(FILE_NAME).write("x")
+    assert resolve_upload_path(str(tmpdir), FILE_NAME) == FILE_NAME
+    assert migrate_upload_root(str(tmpdir), dry_run=True) == 1
+    assert tmpdir.join(FILE_NAME).exists()
+    assert migrate_upload_root(str(tmpdir)) == 1
+    sharded = path.join(upload_shard(FILE_NAME), FILE_NAME)
+    assert tmpdir.join(sharded).exists()
+    assert resolve_upload_path(str(tmpdir), FILE_NAME) == sharded
+    assert resolve_upload_path(str(tmpdir), "../etc/passwd") is None
+    assert resolve_upload_path(str(tmpdir), "missing.mp4") is None
+
+
+def test_index_covers_shards(tmpdir):
+    tmpdir.join("3333-cccc-m2-q1.mp4").write("x")
+    tmpdir.mkdir(upload_shard(FILE_NAME)).join(FILE_NAME).write("xx")
+    tmpdir.mkdir(".incoming").join("x.part").write("x")
+    index = UploadIndex(str(tmpdir))
+    _, total = index.list()
+    assert total == 2
+    assert index.find("m1", "q1").rel_path == path.join(
+        upload_shard(FILE_NAME), FILE_NAME
+    )
+    tmpdir.join(upload_shard(FILE_NAME)).join("4444-dddd-m1-q3.mp4").write("x")
+    assert index.find("m1", "q3") is not None
@@ -1,2 +1,3 @@
 #!/usr/bin/env bash
-celery --app mentor_upload_tasks.tasks.celery worker --loglevel=INFO
+# WORKER_PROFILE=cpu|io|all (default all), see mentor_upload_tasks/worker.py
+python -m mentor_upload_tasks.worker --profile "${WORKER_PROFILE:-all}" --loglevel=INFO
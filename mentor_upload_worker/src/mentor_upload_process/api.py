@@ -13,6 +13,7 @@ from typing import List, TypedDict
 import requests
 
 from mentor_upload_process.helpers import exec_graphql_with_json_validation
+from mentor_upload_process.tracing import traced
 
 from . import MentorExportJson, ReplacedMentorDataChanges
 
@@ -190,6 +191,7 @@ def fetch_answer(mentor: str, question: str) -> dict:
     return data
 
 
+@traced("graphql.upload_update_answer")
 def upload_update_answer(req: AnswerUpdateRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = answer_upload_update_gql(req)
@@ -200,6 +202,7 @@ def upload_update_answer(req: AnswerUpdateRequest) -> None:
         raise Exception(json.dumps(tdjson.get("errors")))
 
 
+@traced("graphql.upload_task_update")
 def upload_task_update(req: UploadTaskRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = upload_task_req_gql(req)
@@ -230,6 +233,7 @@ def upload_task_status_req_gql(req: UpdateTaskStatusRequest) -> GQLQueryBody:
     }
 
 
+@traced("graphql.upload_task_status_update")
 def upload_task_status_update(req: UpdateTaskStatusRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = upload_task_status_req_gql(req)
@@ -364,6 +368,7 @@ def media_update_gql(req: MediaUpdateRequest) -> GQLQueryBody:
     }
 
 
+@traced("graphql.update_media")
 def update_media(req: MediaUpdateRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = media_update_gql(req)
@@ -423,6 +428,7 @@ def import_task_create_gql_query(req: ImportTaskGQLRequest) -> GQLQueryBody:
     }
 
 
+@traced("graphql.import_task_create_gql")
 def import_task_create_gql(req: ImportTaskGQLRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = import_task_create_gql_query(req)
@@ -661,6 +667,7 @@ def import_task_update_gql_query(req: ImportTaskUpdateGQLRequest) -> GQLQueryBod
     }
 
 
+@traced("graphql.import_task_update_gql")
 def import_task_update_gql(req: ImportTaskGQLRequest) -> None:
     headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
     body = import_task_update_gql_query(req)
@@ -0,0 +1,203 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import hashlib
+import logging
+import os
+import threading
+import time
+from os import environ, path
+from typing import Dict, Optional
+
+log = logging.getLogger()
+
+
+class TaskCancelledError(Exception):
+    pass
+
+
+def get_cancel_store_url() -> str:
+    # "memory://" keeps cancel requests in-process (tests, single process workers),
+    # "file:///some/dir" in marker files shared by the processes of one host
+    return (
+        environ.get("CANCEL_STORE_URL")
+        or environ.get("UPLOAD_CELERY_BROKER_URL")
+        or environ.get("CELERY_BROKER_URL")
+        or "redis://redis:6379/0"
+    )
+
+
+def get_cancel_ttl_secs() -> int:
+    return int(environ.get("CANCEL_TTL_SECS") or "86400")
+
+
+def get_cancel_poll_interval_secs() -> float:
+    return float(environ.get("CANCEL_POLL_INTERVAL_SECS") or "1")
+
+
+def _cancel_key(task_id: str) -> str:
+    return f"mentor_upload:cancel:{task_id}"
+
+
+class InMemoryCancelStore:
+    def __init__(self):
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, key: str, ttl_secs: int) -> None:
+        with self._lock:
+            self._expires[key] = time.monotonic() + ttl_secs
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return self._expires.get(key, 0) > time.monotonic()
+
+
+class FileCancelStore:
+    def __init__(self, dir_path: str):
+        self.dir_path = dir_path
+
+    def _path(self, key: str) -> str:
+        # keys end with a task id from the request, so they are never used as a path
+        return path.join(self.dir_path, hashlib.sha1(key.encode()).hexdigest())
+
+    def _prune(self, now: float) -> None:
+        for entry in os.scandir(self.dir_path):
+            if entry.name.endswith(".tmp"):
+                continue  # still being written
+            try:
+                if self._expires(entry.path) <= now:
+                    os.remove(entry.path)
+            except (OSError, ValueError):
+                pass
+
+    def _expires(self, file_path: str) -> float:
+        with open(file_path) as f:
+            return float(f.read())
+
+    def set(self, key: str, ttl_secs: int) -> None:
+        os.makedirs(self.dir_path, exist_ok=True)
+        now = time.time()
+        self._prune(now)
+        file_path = self._path(key)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(now + ttl_secs))
+        os.replace(tmp_path, file_path)
+
+    def exists(self, key: str) -> bool:
+        try:
+            return self._expires(self._path(key)) > time.time()
+        except FileNotFoundError:
+            return False
+
+
+class RedisCancelStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def set(self, key: str, ttl_secs: int) -> None:
+        self._redis.set(key, "1", ex=ttl_secs)
+
+    def exists(self, key: str) -> bool:
+        return bool(self._redis.exists(key))
+
+
+_stores: Dict[str, object] = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(url: str = ""):
+    url = url or get_cancel_store_url()
+    with _stores_lock:
+        store = _stores.get(url)
+        if store is None:
+            if url.startswith("memory://"):
+                store = InMemoryCancelStore()
+            elif url.startswith("file://"):
+                store = FileCancelStore(url.replace("file://", "", 1))
+            else:
+                store = RedisCancelStore(url)
+            _stores[url] = store
+        return store
+
+
+def request_cancel(task_id: str, store_url: str = "") -> None:
+    """
+    Marks a task cancelled for whichever worker is running it,
+    store_url defaults to CANCEL_STORE_URL
+    """
+    _get_store(store_url).set(_cancel_key(task_id), get_cancel_ttl_secs())
+
+
+def is_cancel_requested(task_id: str, store_url: str = "") -> bool:
+    try:
+        return _get_store(store_url).exists(_cancel_key(task_id))
+    except Exception as x:
+        # an unreachable store must not fail the job, just stop cancellation
+        log.warning("failed to check cancellation of task %s: %s", task_id, x)
+        return False
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation for a running task,
+    lookups in the store are throttled to one per poll interval
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        poll_interval_secs: Optional[float] = None,
+        store_url: str = "",
+    ):
+        self.task_id = task_id
+        self.store_url = store_url
+        self.poll_interval_secs = (
+            get_cancel_poll_interval_secs()
+            if poll_interval_secs is None
+            else poll_interval_secs
+        )
+        self._cancelled = False
+        self._last_checked: Optional[float] = None
+
+    def is_cancelled(self) -> bool:
+        if self._cancelled:
+            return True
+        now = time.monotonic()
+        if (
+            self._last_checked is not None
+            and now - self._last_checked < self.poll_interval_secs
+        ):
+            return False
+        self._last_checked = now
+        self._cancelled = is_cancel_requested(self.task_id, self.store_url)
+        return self._cancelled
+
+    def raise_if_cancelled(self) -> None:
+        if self.is_cancelled():
+            raise TaskCancelledError(f"task {self.task_id} was cancelled")
+
+
+def raise_if_cancelled(token: Optional[CancellationToken]) -> None:
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def s3_transfer_callback(token: Optional[CancellationToken]):
+    """
+    S3 upload progress callback that raises once the task is cancelled,
+    which makes s3transfer abort the (multipart) upload
+    """
+    if token is None:
+        return None
+
+    def callback(bytes_transferred: int) -> None:
+        token.raise_if_cancelled()
+
+    return callback
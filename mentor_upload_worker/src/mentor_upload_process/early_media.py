@@ -0,0 +1,91 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Outputs of the api's progressive ingest (ffmpeg started while the upload was
+still streaming in), see mentor_upload_api.progressive_ingest
+"""
+import json
+import logging
+import shutil
+import time
+from os import environ, path
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger()
+
+# touched by the api while its ffmpeg runs
+HEARTBEAT_FILE = "heartbeat.json"
+
+
+def get_early_media_wait_secs() -> float:
+    # the api's ffmpeg usually finishes shortly after the upload completes
+    return float(environ.get("PROGRESSIVE_INGEST_WAIT_SECS") or "600")
+
+
+def get_early_media_stale_secs() -> float:
+    # the api touches the heartbeat every PROGRESSIVE_INGEST_HEARTBEAT_SECS (5)
+    return float(environ.get("PROGRESSIVE_INGEST_STALE_SECS") or "30")
+
+
+def _is_stale(media_dir: Path) -> bool:
+    """True when the api process running the ingest has stopped (e.g. recycled)"""
+    heartbeat_file = media_dir / HEARTBEAT_FILE
+    try:
+        last_beat = (
+            (heartbeat_file if heartbeat_file.exists() else media_dir).stat().st_mtime
+        )
+    except FileNotFoundError:
+        return True
+    return time.time() - last_beat > get_early_media_stale_secs()
+
+
+def _early_media_path(early_media_dir: str) -> Path:
+    return Path(path.join(environ.get("UPLOADS") or "./uploads", early_media_dir))
+
+
+def wait_for_early_media(
+    early_media_dir: str, poll_secs: float = 1.0
+) -> Optional[Path]:
+    """
+    Waits for the api's early outputs, returns their dir once complete
+    or None when there are none, ingest failed or it took too long
+    """
+    if not early_media_dir:
+        return None
+    media_dir = _early_media_path(early_media_dir)
+    done_file = media_dir / "done.json"
+    deadline = time.monotonic() + get_early_media_wait_secs()
+    while not done_file.exists():
+        if time.monotonic() >= deadline or not media_dir.is_dir():
+            log.warning("no early media in %s, encoding from the upload", media_dir)
+            return None
+        if _is_stale(media_dir) and not done_file.exists():
+            log.warning(
+                "early media in %s stopped progressing, encoding from the upload",
+                media_dir,
+            )
+            return None
+        time.sleep(poll_secs)
+    try:
+        with open(done_file) as f:
+            ok = bool(json.load(f).get("ok"))
+    except (OSError, ValueError):
+        ok = False
+    if not ok or not all(
+        (media_dir / f).is_file() for f in ("mobile.mp4", "web.mp4", "audio.mp3")
+    ):
+        log.warning(
+            "early media in %s is incomplete, encoding from the upload", media_dir
+        )
+        return None
+    return media_dir
+
+
+def delete_early_media(early_media_dir: str) -> None:
+    if early_media_dir:
+        shutil.rmtree(_early_media_path(early_media_dir), ignore_errors=True)
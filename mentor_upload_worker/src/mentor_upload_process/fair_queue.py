@@ -0,0 +1,195 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Per-mentor fair sharing of transcode capacity.
+The api registers each upload as pending for its mentor (and lowers the priority
+of mentors with a backlog), the worker allows at most
+MENTOR_MAX_INFLIGHT_TRANSCODES transcodes per mentor at a time and sends the
+rest to the back of the queue, so other mentors' jobs interleave
+"""
+import logging
+import threading
+import time
+from os import environ
+from typing import Dict
+
+log = logging.getLogger()
+
+
+def is_fair_queue_enabled() -> bool:
+    return environ.get("FAIR_QUEUE_ENABLED", "") == "true"
+
+
+def get_fair_queue_store_url() -> str:
+    # "memory://" keeps state in-process (tests, single process workers)
+    return (
+        environ.get("FAIR_QUEUE_STORE_URL")
+        or environ.get("UPLOAD_CELERY_BROKER_URL")
+        or environ.get("CELERY_BROKER_URL")
+        or "redis://redis:6379/0"
+    )
+
+
+def get_mentor_max_inflight_transcodes() -> int:
+    return int(environ.get("MENTOR_MAX_INFLIGHT_TRANSCODES") or "2")
+
+
+def get_fair_queue_slot_ttl_secs() -> int:
+    # a slot held longer than this (crashed worker) is released
+    return int(environ.get("FAIR_QUEUE_SLOT_TTL_SECS") or "3600")
+
+
+def get_fair_queue_pending_ttl_secs() -> int:
+    return int(environ.get("FAIR_QUEUE_PENDING_TTL_SECS") or "86400")
+
+
+def _inflight_key(mentor: str) -> str:
+    return f"mentor_upload:fair:inflight:{mentor}"
+
+
+def _pending_key(mentor: str) -> str:
+    return f"mentor_upload:fair:pending:{mentor}"
+
+
+# sorted sets scored by expiry time, so entries of crashed jobs age out
+_ACQUIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if redis.call('ZSCORE', KEYS[1], ARGV[1])
+    or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('ZADD', KEYS[1], tonumber(ARGV[3]) + tonumber(ARGV[4]), ARGV[1])
+  redis.call('EXPIRE', KEYS[1], ARGV[4])
+  return 1
+end
+return 0
+"""
+
+
+class RedisFairQueueStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._acquire = self._redis.register_script(_ACQUIRE_LUA)
+
+    def try_acquire(self, key: str, member: str, limit: int, ttl_secs: int) -> bool:
+        return bool(
+            self._acquire(keys=[key], args=[member, limit, time.time(), ttl_secs])
+        )
+
+    def add(self, key: str, member: str, ttl_secs: int) -> None:
+        self._redis.zadd(key, {member: time.time() + ttl_secs})
+        self._redis.expire(key, ttl_secs)
+
+    def remove(self, key: str, member: str) -> None:
+        self._redis.zrem(key, member)
+
+    def count(self, key: str) -> int:
+        self._redis.zremrangebyscore(key, "-inf", time.time())
+        return self._redis.zcard(key)
+
+
+class InMemoryFairQueueStore:
+    def __init__(self):
+        self._sets: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Dict[str, float]:
+        now = time.time()
+        members = {
+            m: expires
+            for m, expires in self._sets.get(key, {}).items()
+            if expires > now
+        }
+        self._sets[key] = members
+        return members
+
+    def try_acquire(self, key: str, member: str, limit: int, ttl_secs: int) -> bool:
+        with self._lock:
+            members = self._live(key)
+            if member not in members and len(members) >= limit:
+                return False
+            members[member] = time.time() + ttl_secs
+            return True
+
+    def add(self, key: str, member: str, ttl_secs: int) -> None:
+        with self._lock:
+            self._live(key)[member] = time.time() + ttl_secs
+
+    def remove(self, key: str, member: str) -> None:
+        with self._lock:
+            self._live(key).pop(member, None)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._live(key))
+
+
+_store = None
+_store_url = ""
+
+
+def _get_store():
+    global _store, _store_url
+    url = get_fair_queue_store_url()
+    if _store is None or url != _store_url:
+        _store = (
+            InMemoryFairQueueStore()
+            if url.startswith("memory://")
+            else RedisFairQueueStore(url)
+        )
+        _store_url = url
+    return _store
+
+
+def try_acquire_transcode_slot(mentor: str, job_id: str) -> bool:
+    """True if the job may transcode now, always True when fair queuing is off"""
+    if not is_fair_queue_enabled() or not mentor:
+        return True
+    try:
+        return _get_store().try_acquire(
+            _inflight_key(mentor),
+            job_id,
+            get_mentor_max_inflight_transcodes(),
+            get_fair_queue_slot_ttl_secs(),
+        )
+    except Exception as x:
+        # an unreachable store must not stop transcoding, just fairness
+        log.warning("fair queue unavailable, not limiting %s: %s", mentor, x)
+        return True
+
+
+def release_transcode_slot(mentor: str, job_id: str) -> None:
+    """Frees the job's slot and removes it from the mentor's pending jobs"""
+    if not is_fair_queue_enabled() or not mentor:
+        return
+    try:
+        store = _get_store()
+        store.remove(_inflight_key(mentor), job_id)
+        store.remove(_pending_key(mentor), job_id)
+    except Exception as x:
+        log.warning("failed to release fair queue slot of %s: %s", mentor, x)
+
+
+def add_pending_job(mentor: str, job_id: str) -> None:
+    if not is_fair_queue_enabled() or not mentor:
+        return
+    try:
+        _get_store().add(
+            _pending_key(mentor), job_id, get_fair_queue_pending_ttl_secs()
+        )
+    except Exception as x:
+        log.warning("failed to register pending job of %s: %s", mentor, x)
+
+
+def count_pending_jobs(mentor: str) -> int:
+    if not is_fair_queue_enabled() or not mentor:
+        return 0
+    try:
+        return _get_store().count(_pending_key(mentor))
+    except Exception as x:
+        log.warning("failed to count pending jobs of %s: %s", mentor, x)
+        return 0
@@ -6,18 +6,21 @@
 #
 import json
 import jsonschema
-from jsonschema import validate
 import requests
 import logging
 from os import environ
 
+from .json_validation import validate_json_schema
+from .tracing import span
+
 
 def get_graphql_endpoint() -> str:
     return environ.get("GRAPHQL_ENDPOINT") or "http://graphql/graphql"
 
 
 def exec_graphql_with_json_validation(request_query, json_schema, **req_kwargs):
-    res = requests.post(get_graphql_endpoint(), json=request_query, **req_kwargs)
+    with span("graphql.request", kind="client"):
+        res = requests.post(get_graphql_endpoint(), json=request_query, **req_kwargs)
     res.raise_for_status()
     tdjson = res.json()
     if "errors" in tdjson:
@@ -28,7 +31,7 @@ def exec_graphql_with_json_validation(request_query, json_schema, **req_kwargs):
 
 def validate_json(json_data, json_schema):
     try:
-        validate(instance=json_data, schema=json_schema)
+        validate_json_schema(json_data, json_schema)
     except jsonschema.exceptions.ValidationError as err:
         logging.error(msg=err)
         raise Exception(err)
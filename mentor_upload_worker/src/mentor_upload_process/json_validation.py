@@ -0,0 +1,35 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""Compiled json schema validators, shared by the api and the worker"""
+from typing import Any, Dict, Tuple
+
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+_validators: Dict[int, Tuple[dict, Any]] = {}
+
+
+def get_json_validator(json_schema: dict):
+    """
+    Validator for json_schema, the schema is checked and its validator built
+    once and reused for every later validation against it
+    """
+    cached = _validators.get(id(json_schema))
+    # holding on to the schema keeps its id from being reused by another one
+    if cached is None or cached[0] is not json_schema:
+        validator_cls = validator_for(json_schema)
+        validator_cls.check_schema(json_schema)
+        cached = (json_schema, validator_cls(json_schema))
+        _validators[id(json_schema)] = cached
+    return cached[1]
+
+
+def validate_json_schema(instance, json_schema: dict) -> None:
+    """Raises the same ValidationError jsonschema.validate would"""
+    error = best_match(get_json_validator(json_schema).iter_errors(instance))
+    if error is not None:
+        raise error
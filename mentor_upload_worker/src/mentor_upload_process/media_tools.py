@@ -8,14 +8,22 @@ from dataclasses import dataclass
 import logging
 import os
 import re
-from typing import List, Optional, Tuple, Union
+import signal
+import subprocess
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import math
 import ffmpy
 from pymediainfo import MediaInfo
 
+from .cancellation import CancellationToken, TaskCancelledError, raise_if_cancelled
+from .tracing import traced
+
 log = logging.getLogger()
 
 
+@traced("mediainfo.find_duration", kind="internal")
 def find_duration(audio_or_video_file: str) -> float:
     log.info(audio_or_video_file)
     media_info = MediaInfo.parse(audio_or_video_file)
@@ -29,6 +37,7 @@ def find_duration(audio_or_video_file: str) -> float:
     return -1.0
 
 
+@traced("mediainfo.find_video_dims", kind="internal")
 def find_video_dims(video_file: str) -> Tuple[int, int]:
     log.info(video_file)
     media_info = MediaInfo.parse(video_file)
@@ -41,6 +50,213 @@ def find_video_dims(video_file: str) -> Tuple[int, int]:
     )
 
 
+@dataclass
+class FFmpegProgress:
+    out_time_secs: float
+    speed: float  # multiple of realtime, 0 when unknown
+    percent: float  # 0-100, -1 when the duration is unknown
+    eta_secs: float  # -1 when unknown
+    done: bool
+
+
+ProgressCallback = Callable[[FFmpegProgress], None]
+
+
+class FFmpegProgressParser:
+    """
+    Incrementally parses the key=value blocks ffmpeg writes with `-progress`,
+    each block is terminated by progress=continue|end
+    """
+
+    def __init__(self, duration_secs: float = -1.0):
+        self.duration_secs = duration_secs
+        self._block: Dict[str, str] = {}
+
+    def feed(self, line: str) -> Optional[FFmpegProgress]:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        self._block[key] = value.strip()
+        if key != "progress":
+            return None
+        block, self._block = self._block, {}
+        return self._to_progress(block, done=value.strip() == "end")
+
+    def _to_progress(self, block: Dict[str, str], done: bool) -> FFmpegProgress:
+        # out_time_ms is (despite the name) microseconds, same as out_time_us
+        out_time_secs = max(
+            _parse_float(block.get("out_time_us") or block.get("out_time_ms")) / 1e6,
+            0.0,
+        )
+        speed = _parse_float((block.get("speed") or "").rstrip("x"))
+        percent = -1.0
+        eta_secs = -1.0
+        if self.duration_secs > 0:
+            percent = min(100.0 * out_time_secs / self.duration_secs, 100.0)
+            if speed > 0:
+                eta_secs = max(self.duration_secs - out_time_secs, 0.0) / speed
+        if done:
+            percent = 100.0
+            eta_secs = 0.0
+        return FFmpegProgress(
+            out_time_secs=out_time_secs,
+            speed=speed,
+            percent=percent,
+            eta_secs=eta_secs,
+            done=done,
+        )
+
+
+def _parse_float(s: Optional[str]) -> float:
+    try:
+        return float(s)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _ProgressFileWatcher(threading.Thread):
+    """Tails the file ffmpeg writes progress to and feeds it to the callback"""
+
+    def __init__(self, progress_file: str, parser: FFmpegProgressParser, on_progress):
+        super().__init__(daemon=True)
+        self.progress_file = progress_file
+        self.parser = parser
+        self.on_progress = on_progress
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        with open(self.progress_file) as f:
+            pending = ""
+            while True:
+                chunk = f.readline()
+                if chunk:
+                    pending += chunk
+                    if pending.endswith("\n"):
+                        self._handle(pending)
+                        pending = ""
+                    continue
+                if self._stopped.is_set():
+                    break
+                self._stopped.wait(0.25)
+
+    def _handle(self, line: str) -> None:
+        progress = self.parser.feed(line)
+        if progress is None:
+            return
+        try:
+            self.on_progress(progress)
+        except Exception as x:
+            # reporting progress must never fail the encode
+            log.warning("ffmpeg progress callback failed: %s", x)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class _CancelWatcher(threading.Thread):
+    """Kills the ffmpeg process group once the task is cancelled"""
+
+    def __init__(self, ff, cancel_token: CancellationToken):
+        super().__init__(daemon=True)
+        self.ff = ff
+        self.cancel_token = cancel_token
+        self.killed = False
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(max(self.cancel_token.poll_interval_secs, 0.1)):
+            process = getattr(self.ff, "process", None)
+            if process is None or not self.cancel_token.is_cancelled():
+                continue
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+                self.killed = True
+            except ProcessLookupError:
+                pass
+            return
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def _run_in_new_session(ff) -> None:
+    """
+    Same as ff.run() but starts ffmpeg in its own session (process group).
+    ffmpy 0.3.0's run() does not forward Popen kwargs, so the process is started here
+    """
+    try:
+        ff.process = subprocess.Popen(
+            ff._cmd, stdin=subprocess.PIPE, start_new_session=True
+        )
+    except FileNotFoundError as x:
+        raise ffmpy.FFExecutableNotFoundError(
+            f"Executable '{ff.executable}' not found"
+        ) from x
+    out = ff.process.communicate()
+    if ff.process.returncode != 0:
+        raise ffmpy.FFRuntimeError(ff.cmd, ff.process.returncode, out[0], out[1])
+
+
+def run_ffmpeg(
+    inputs: dict,
+    outputs: dict,
+    on_progress: Optional[ProgressCallback] = None,
+    duration_secs: float = -1.0,
+    cancel_token: Optional[CancellationToken] = None,
+) -> None:
+    """
+    Runs ffmpeg, when on_progress is given ffmpeg also writes `-progress`
+    to a temp file that is parsed as it grows.
+    When cancel_token is given ffmpeg runs in its own process group,
+    which is killed (with any children) as soon as the task is cancelled
+    """
+    if on_progress is None and cancel_token is None:
+        ff = ffmpy.FFmpeg(inputs=inputs, outputs=outputs)
+        ff.run()
+        log.debug(ff)
+        return
+    raise_if_cancelled(cancel_token)
+    ff_kwargs: dict = {"inputs": inputs, "outputs": outputs}
+    watchers: list = []
+    progress_file = ""
+    if on_progress is not None:
+        fd, progress_file = tempfile.mkstemp(prefix="ffmpeg-progress-", suffix=".txt")
+        os.close(fd)
+        ff_kwargs["global_options"] = ("-progress", progress_file, "-nostats")
+    ff = ffmpy.FFmpeg(**ff_kwargs)
+    if on_progress is not None:
+        watchers.append(
+            _ProgressFileWatcher(
+                progress_file, FFmpegProgressParser(duration_secs), on_progress
+            )
+        )
+    cancel_watcher = None
+    if cancel_token is not None:
+        cancel_watcher = _CancelWatcher(ff, cancel_token)
+        watchers.append(cancel_watcher)
+    for w in watchers:
+        w.start()
+    try:
+        if cancel_token is not None:
+            _run_in_new_session(ff)
+        else:
+            ff.run()
+    except ffmpy.FFRuntimeError as x:
+        if cancel_watcher is not None and cancel_watcher.killed:
+            raise TaskCancelledError(
+                f"task {cancel_token.task_id} was cancelled"
+            ) from x
+        raise
+    finally:
+        for w in watchers:
+            w.stop()
+        if progress_file:
+            os.remove(progress_file)
+    log.debug(ff)
+
+
 def format_secs(secs: Union[float, int, str]) -> str:
     return f"{float(str(secs)):.3f}"
 
@@ -140,40 +356,60 @@ def output_args_video_to_audio() -> Tuple[str, ...]:
     return ("-loglevel", "quiet", "-y")
 
 
-def video_encode_for_mobile(src_file: str, tgt_file: str, target_height=480) -> None:
+@traced("ffmpeg.video_encode_for_mobile", kind="internal")
+def video_encode_for_mobile(
+    src_file: str,
+    tgt_file: str,
+    target_height=480,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
+) -> None:
     log.info("%s, %s, %s", src_file, tgt_file, target_height)
     os.makedirs(os.path.dirname(tgt_file), exist_ok=True)
-    ff = ffmpy.FFmpeg(
+    run_ffmpeg(
         inputs={str(src_file): None},
         outputs={
             str(tgt_file): output_args_video_encode_for_mobile(
                 src_file, target_height=target_height
             )
         },
+        on_progress=on_progress,
+        duration_secs=find_duration(src_file) if on_progress else -1.0,
+        cancel_token=cancel_token,
     )
-    ff.run()
-    log.debug(ff)
 
 
+@traced("ffmpeg.video_encode_for_web", kind="internal")
 def video_encode_for_web(
-    src_file: str, tgt_file: str, max_height=720, target_aspect=1.77777777778
+    src_file: str,
+    tgt_file: str,
+    max_height=720,
+    target_aspect=1.77777777778,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> None:
     log.info("%s, %s, %s, %s", src_file, tgt_file, max_height, target_aspect)
     os.makedirs(os.path.dirname(tgt_file), exist_ok=True)
-    ff = ffmpy.FFmpeg(
+    run_ffmpeg(
         inputs={str(src_file): None},
         outputs={
             str(tgt_file): output_args_video_encode_for_web(
                 src_file, max_height=max_height, target_aspect=target_aspect
             )
         },
+        on_progress=on_progress,
+        duration_secs=find_duration(src_file) if on_progress else -1.0,
+        cancel_token=cancel_token,
     )
-    ff.run()
-    log.debug(ff)
 
 
+@traced("ffmpeg.video_to_audio", kind="internal")
 def video_to_audio(
-    input_file: str, output_file: str = "", output_audio_encoding="mp3"
+    input_file: str,
+    output_file: str = "",
+    output_audio_encoding="mp3",
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> str:
     """
     Converts the .mp4 file to an audio file (.mp3 by default).
@@ -192,41 +428,56 @@ def video_to_audio(
     output_file = (
         output_file or f"{os.path.splitext(input_file)[0]}.{output_audio_encoding}"
     )
-    ff = ffmpy.FFmpeg(
+    run_ffmpeg(
         inputs={str(input_file): None},
         outputs={str(output_file): output_args_video_to_audio()},
+        on_progress=on_progress,
+        duration_secs=find_duration(input_file) if on_progress else -1.0,
+        cancel_token=cancel_token,
     )
-    ff.run()
-    log.debug(ff)
     return output_file
 
 
+@traced("ffmpeg.video_trim", kind="internal")
 def video_trim(
-    input_file: str, output_file: str, start_secs: float, end_secs: float
+    input_file: str,
+    output_file: str,
+    start_secs: float,
+    end_secs: float,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> None:
     log.info("%s, %s, %s-%s", input_file, output_file, start_secs, end_secs)
     if not os.path.exists(input_file):
         raise Exception(f"ERROR: Can't trim, {input_file} doesn't exist")
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    ff = ffmpy.FFmpeg(
+    run_ffmpeg(
         inputs={str(input_file): None},
         outputs={str(output_file): output_args_trim_video(start_secs, end_secs)},
+        on_progress=on_progress,
+        duration_secs=float(end_secs) - float(start_secs),
+        cancel_token=cancel_token,
     )
-    ff.run()
-    log.debug(ff)
 
 
+@traced("ffmpeg.existing_video_trim", kind="internal")
 def existing_video_trim(
-    input_file: str, output_file: str, start_secs: float, end_secs: float
+    input_file: str,
+    output_file: str,
+    start_secs: float,
+    end_secs: float,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> None:
     log.info("%s, %s, %s-%s", input_file, output_file, start_secs, end_secs)
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    ff = ffmpy.FFmpeg(
+    run_ffmpeg(
         inputs={str(input_file): None},
         outputs={str(output_file): output_args_trim_video(start_secs, end_secs)},
+        on_progress=on_progress,
+        duration_secs=float(end_secs) - float(start_secs),
+        cancel_token=cancel_token,
     )
-    ff.run()
-    log.debug(ff)
 
 
 def find(
@@ -0,0 +1,231 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Dependency driven stage dispatch for upload pipelines.
+The api stores the stage graph (with pre-assigned task ids), the request and a
+counter of unfinished dependencies per stage, then sends only the stages
+without dependencies. Every stage stores its result as an artifact and the
+stage that completes a dependent's last dependency sends it, so the messages
+only carry the pipeline id and no chord-unlock polling is involved
+"""
+import json
+import logging
+import threading
+import time
+from os import environ
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .api import UpdateTaskStatusRequest, upload_task_status_update
+
+log = logging.getLogger()
+
+
+def get_pipeline_store_url() -> str:
+    # "memory://" keeps state in-process (tests, single process workers)
+    return (
+        environ.get("PIPELINE_STORE_URL")
+        or environ.get("UPLOAD_CELERY_BROKER_URL")
+        or environ.get("CELERY_BROKER_URL")
+        or "redis://redis:6379/0"
+    )
+
+
+def get_pipeline_ttl_secs() -> int:
+    return int(environ.get("PIPELINE_TTL_SECS") or "86400")
+
+
+def _pipeline_key(pipeline_id: str) -> str:
+    return f"mentor_upload:pipeline:{pipeline_id}"
+
+
+# records the artifact and decrements the dependents' counters atomically,
+# a redelivered stage (acks_late) finds its done flag and changes nothing
+_COMPLETE_LUA = """
+if redis.call('HSETNX', KEYS[1], 'done:' .. ARGV[1], 1) == 0 then
+  return {}
+end
+redis.call('HSET', KEYS[1], 'artifact:' .. ARGV[1], ARGV[2])
+local ready = {}
+for i = 3, #ARGV do
+  if redis.call('HINCRBY', KEYS[1], 'waiting:' .. ARGV[i], -1) == 0 then
+    table.insert(ready, ARGV[i])
+  end
+end
+return ready
+"""
+
+
+class RedisPipelineStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._complete = self._redis.register_script(_COMPLETE_LUA)
+
+    def create(self, pipeline_id: str, fields: Dict[str, str], ttl_secs: int) -> None:
+        key = _pipeline_key(pipeline_id)
+        with self._redis.pipeline() as p:
+            p.hset(key, mapping=fields)
+            p.expire(key, ttl_secs)
+            p.execute()
+
+    def get(self, pipeline_id: str, fields: List[str]) -> List[Optional[str]]:
+        return self._redis.hmget(_pipeline_key(pipeline_id), fields)
+
+    def complete(
+        self, pipeline_id: str, stage: str, artifact: str, dependents: List[str]
+    ) -> List[str]:
+        return self._complete(
+            keys=[_pipeline_key(pipeline_id)], args=[stage, artifact, *dependents]
+        )
+
+    def delete(self, pipeline_id: str) -> None:
+        self._redis.delete(_pipeline_key(pipeline_id))
+
+
+class InMemoryPipelineStore:
+    def __init__(self):
+        self._pipelines: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def _fields(self, pipeline_id: str) -> Dict[str, str]:
+        expires, fields = self._pipelines.get(pipeline_id, (0.0, {}))
+        return fields if expires > time.time() else {}
+
+    def create(self, pipeline_id: str, fields: Dict[str, str], ttl_secs: int) -> None:
+        with self._lock:
+            self._pipelines[pipeline_id] = (time.time() + ttl_secs, dict(fields))
+
+    def get(self, pipeline_id: str, fields: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            stored = self._fields(pipeline_id)
+            return [stored.get(f) for f in fields]
+
+    def complete(
+        self, pipeline_id: str, stage: str, artifact: str, dependents: List[str]
+    ) -> List[str]:
+        with self._lock:
+            fields = self._fields(pipeline_id)
+            if f"done:{stage}" in fields:
+                return []
+            fields[f"done:{stage}"] = "1"
+            fields[f"artifact:{stage}"] = artifact
+            ready = []
+            for d in dependents:
+                waiting = int(fields.get(f"waiting:{d}", "0")) - 1
+                fields[f"waiting:{d}"] = str(waiting)
+                if waiting == 0:
+                    ready.append(d)
+            return ready
+
+    def delete(self, pipeline_id: str) -> None:
+        with self._lock:
+            self._pipelines.pop(pipeline_id, None)
+
+
+_store = None
+_store_url = ""
+
+
+def _get_store():
+    global _store, _store_url
+    url = get_pipeline_store_url()
+    if _store is None or url != _store_url:
+        _store = (
+            InMemoryPipelineStore()
+            if url.startswith("memory://")
+            else RedisPipelineStore(url)
+        )
+        _store_url = url
+    return _store
+
+
+class PipelineNotFoundError(Exception):
+    pass
+
+
+def _load(pipeline_id: str, fields: List[str]) -> List[Optional[str]]:
+    values = _get_store().get(pipeline_id, ["spec", *fields])
+    if values[0] is None:
+        raise PipelineNotFoundError(f"pipeline {pipeline_id} expired or never existed")
+    return values
+
+
+def load_stage(pipeline_id: str, stage: str) -> Tuple[dict, List[dict]]:
+    """The pipeline request and the artifacts of the stage's dependencies, in order"""
+    (spec_json,) = _load(pipeline_id, [])
+    deps = json.loads(spec_json)[stage]["deps"]
+    _, req_json, *artifacts = _load(
+        pipeline_id, ["req", *[f"artifact:{d}" for d in deps]]
+    )
+    return json.loads(req_json), [json.loads(a) if a else {} for a in artifacts]
+
+
+SendTask = Callable[..., object]
+
+
+def _dependents(spec: dict, stage: str) -> List[str]:
+    return [s for s, stage_spec in spec.items() if stage in stage_spec["deps"]]
+
+
+def complete_stage(
+    pipeline_id: str, stage: str, result: Optional[dict], send_task: SendTask
+) -> List[str]:
+    """
+    Stores the result of a finished stage and sends the dependents it made ready,
+    returns their names. A stage that returned no result failed
+    """
+    if result is None:
+        fail_stage(pipeline_id, stage)
+        return []
+    (spec_json,) = _load(pipeline_id, [])
+    spec = json.loads(spec_json)
+    dependents = _dependents(spec, stage)
+    ready = _get_store().complete(pipeline_id, stage, json.dumps(result), dependents)
+    for s in ready:
+        stage_spec = spec[s]
+        send_task(
+            stage_spec["task"],
+            kwargs={"pipeline_id": pipeline_id},
+            task_id=stage_spec["task_id"],
+            queue=stage_spec["queue"],
+            priority=stage_spec["priority"],
+        )
+    if not dependents:
+        _get_store().delete(pipeline_id)
+    return ready
+
+
+def fail_stage(pipeline_id: str, stage: str) -> None:
+    """Marks every stage that depends (transitively) on a failed stage as failed"""
+    try:
+        spec_json, req_json = _load(pipeline_id, ["req"])
+    except PipelineNotFoundError:
+        return
+    spec = json.loads(spec_json)
+    req = json.loads(req_json)
+    blocked: List[str] = []
+    todo = _dependents(spec, stage)
+    while todo:
+        s = todo.pop(0)
+        if s not in blocked:
+            blocked.append(s)
+            todo.extend(_dependents(spec, s))
+    log.error("pipeline %s stage %s failed, skipping %s", pipeline_id, stage, blocked)
+    _get_store().delete(pipeline_id)
+    for s in blocked:
+        try:
+            upload_task_status_update(
+                UpdateTaskStatusRequest(
+                    mentor=req.get("mentor"),
+                    question=req.get("question"),
+                    task_id=spec[s]["task_id"],
+                    new_status="FAILED",
+                )
+            )
+        except Exception as x:
+            log.warning("failed to mark skipped stage %s as failed: %s", s, x)
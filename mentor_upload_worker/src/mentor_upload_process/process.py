@@ -5,13 +5,14 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 from contextlib import contextmanager
+import hashlib
 from datetime import datetime
 
 from os import environ, path, makedirs, remove
 from pathlib import Path
-from tempfile import mkdtemp
-from shutil import copyfile, rmtree
-from typing import List, Tuple
+from shutil import copyfile
+import threading
+from typing import List, Optional, Tuple
 import urllib.request
 
 import boto3
@@ -54,10 +55,40 @@ from .api import (
     import_task_update_gql,
     ImportTaskUpdateGQLRequest,
 )
+from .cancellation import (
+    CancellationToken,
+    TaskCancelledError,
+    raise_if_cancelled,
+    request_cancel,
+    s3_transfer_callback,
+)
+from .early_media import delete_early_media, wait_for_early_media
+from .progress import PublishProgress, ThrottledProgress
+from .tracing import span
+from .work_dirs import (
+    claim_work_dir,
+    create_work_dir,
+    delete_work_dir,
+    get_work_dir_reserve_factor,
+)
+
+
+def _upload_shard(file_name: str) -> str:
+    # must match upload_shard in the api's upload_layout
+    name_split = path.splitext(file_name)[0].split("-")
+    mentor = name_split[-2] if len(name_split) >= 3 else ""
+    return hashlib.sha256((mentor or file_name).encode("utf-8")).hexdigest()[:2]
 
 
 def upload_path(p: str) -> str:
-    return path.join(environ.get("UPLOADS") or "./uploads", p)
+    uploads = environ.get("UPLOADS") or "./uploads"
+    full_path = path.join(uploads, p)
+    if path.basename(p) == p and not path.exists(full_path):
+        # queued before the upload root was migrated to the sharded layout
+        sharded_path = path.join(uploads, _upload_shard(p), p)
+        if path.exists(sharded_path):
+            return sharded_path
+    return full_path
 
 
 def _require_env(n: str) -> str:
@@ -67,8 +98,21 @@ def _require_env(n: str) -> str:
     return env_val
 
 
+_boto3_sessions = threading.local()
+
+
+def _boto3_session() -> boto3.session.Session:
+    # boto3's default session is not thread safe, with the threads pool every
+    # thread gets its own (clients are safe to use once created)
+    session = getattr(_boto3_sessions, "session", None)
+    if session is None:
+        session = boto3.session.Session()
+        _boto3_sessions.session = session
+    return session
+
+
 def _create_s3_client() -> S3Client:
-    return boto3.client(
+    return _boto3_session().client(
         "s3",
         region_name=_require_env("STATIC_AWS_REGION"),
         aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
@@ -81,43 +125,63 @@ def _new_work_dir_name() -> str:
 
 
 @contextmanager
-def _video_work_dir(source_path: str):
-    media_work_dir = (
-        Path(environ.get("TRANSCODE_WORK_DIR") or mkdtemp()) / _new_work_dir_name()
+def _video_work_dir(source_path: str, task_id: str = ""):
+    """
+    Work dir shared by the stages of one answer upload,
+    deleted by finalization (or on failure), otherwise collected as an orphan
+    """
+    source_bytes = path.getsize(source_path)
+    media_work_dir = create_work_dir(
+        _new_work_dir_name(),
+        task_id,
+        reserve_bytes=int(source_bytes * get_work_dir_reserve_factor()),
+        input_bytes=source_bytes,
     )
-    makedirs(media_work_dir)
     video_file = media_work_dir / path.basename(source_path)
-    copyfile(source_path, video_file)
+    try:
+        copyfile(source_path, video_file)
+    except Exception:
+        delete_work_dir(media_work_dir)
+        raise
     yield (video_file, media_work_dir)
 
 
-@contextmanager
 def _delete_video_work_dir(work_dir: str):
-    try:
-        rmtree(str(work_dir))
-    except Exception as x:
-        import logging
+    delete_work_dir(work_dir)
 
-        logging.error(f"failed to delete media work dir {work_dir}")
-        logging.exception(x)
+
+def _delete_stage_outputs(files: List[str]) -> None:
+    """
+    Transcode and transcribe run in parallel on the same work dir, a failed one
+    only removes what it wrote. The dir goes with finalization (or gc_orphans)
+    """
+    for f in files:
+        try:
+            remove(f)
+        except FileNotFoundError:
+            pass
+        except OSError as x:
+            import logging
+
+            logging.warning(f"failed to delete stage output {f}: {x}")
 
 
 @contextmanager
-def _trimming_work_dir():
-    media_work_dir = (
-        Path(environ.get("TRANSCODE_WORK_DIR") or mkdtemp()) / _new_work_dir_name()
-    )
+def _trimming_work_dir(task_id: str = ""):
+    media_work_dir = create_work_dir(_new_work_dir_name(), task_id)
     try:
-        makedirs(media_work_dir)
         yield media_work_dir
     finally:
-        try:
-            rmtree(str(media_work_dir))
-        except Exception as x:
-            import logging
+        delete_work_dir(media_work_dir)
+
+
+def _failed_status(x: Exception) -> str:
+    return "CANCELLED" if isinstance(x, TaskCancelledError) else "FAILED"
 
-            logging.error(f"failed to delete media work dir {media_work_dir}")
-            logging.exception(x)
+
+def _s3_upload_cancel_args(cancel_token: Optional[CancellationToken]) -> dict:
+    callback = s3_transfer_callback(cancel_token)
+    return {"Callback": callback} if callback else {}
 
 
 def cancel_task(req: CancelTaskRequest) -> CancelTaskResponse:
@@ -129,7 +193,10 @@ def cancel_task(req: CancelTaskRequest) -> CancelTaskResponse:
             new_status="CANCELLING",
         )
     )
-    # TODO: potentially need to cancel s3 upload and aws transcribe if they have already started?
+    # a running stage picks this up between steps, kills its ffmpeg process group
+    # and aborts in-flight s3 uploads (an aws transcribe job already submitted
+    # runs to completion, but its result is discarded)
+    request_cancel(req.get("task_id"))
     upload_task_status_update(
         UpdateTaskStatusRequest(
             mentor=req.get("mentor"),
@@ -145,7 +212,12 @@ def is_idle_question(question_id: str) -> bool:
     return name == "_IDLE_"
 
 
-def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
+def trim_upload_stage(
+    req: ProcessAnswerRequest,
+    task_id: str,
+    on_progress: Optional[PublishProgress] = None,
+    cancel_token: Optional[CancellationToken] = None,
+):
     trim = req.get("trim", None)
     video_path = req.get("video_path", "")
     if not video_path:
@@ -169,7 +241,7 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
             )
         )
         raise Exception(f"video not found for path '{video_path}'")
-    with _video_work_dir(video_path_full) as context:
+    with _video_work_dir(video_path_full, task_id) as context:
         try:
             video_file, work_dir = context
             upload_task_status_update(
@@ -182,7 +254,15 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
             )
             if trim:
                 trim_file = work_dir / "trim.mp4"
-                video_trim(video_file, trim_file, trim.get("start"), trim.get("end"))
+                progress = ThrottledProgress(on_progress, ["trim"])
+                video_trim(
+                    video_file,
+                    trim_file,
+                    trim.get("start"),
+                    trim.get("end"),
+                    on_progress=progress.step("trim"),
+                    cancel_token=cancel_token,
+                )
                 from shutil import copyfile
 
                 copyfile(trim_file, video_file)
@@ -205,7 +285,7 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
                     mentor=req.get("mentor"),
                     question=req.get("question"),
                     task_id=task_id,
-                    new_status="FAILED",
+                    new_status=_failed_status(x),
                 )
             )
 
@@ -253,12 +333,19 @@ def extract_params_for_transcode_transcribe_stages(
     return params
 
 
-def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
+def transcode_stage(
+    dict_tuple: dict,
+    req: ProcessAnswerRequest,
+    task_id: str,
+    on_progress: Optional[PublishProgress] = None,
+    cancel_token: Optional[CancellationToken] = None,
+):
     params = extract_params_for_transcode_transcribe_stages(dict_tuple, req, task_id)
     try:
         mentor = params.get("mentor")
         question = params.get("question")
         work_dir = Path(params.get("work_dir"))
+        claim_work_dir(work_dir, task_id)
         video_file = Path(params.get("video_file"))
         MediaUpload = Tuple[  # noqa: N806
             str, str, str, str, str
@@ -272,15 +359,30 @@ def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                 new_status="IN_PROGRESS",
             )
         )
-        video_mobile_file = work_dir / "mobile.mp4"
-        video_encode_for_mobile(video_file, video_mobile_file)
+        progress = ThrottledProgress(on_progress, ["transcode-mobile", "transcode-web"])
+        early_media = wait_for_early_media(params.get("early_media_dir", ""))
+        video_mobile_file = (early_media or work_dir) / "mobile.mp4"
+        if not early_media:
+            video_encode_for_mobile(
+                video_file,
+                video_mobile_file,
+                on_progress=progress.step("transcode-mobile"),
+                cancel_token=cancel_token,
+            )
         media_uploads.append(
             ("video", "mobile", "mobile.mp4", "video/mp4", video_mobile_file)
         )
-        video_web_file = work_dir / "web.mp4"
-        video_encode_for_web(video_file, video_web_file)
+        video_web_file = (early_media or work_dir) / "web.mp4"
+        if not early_media:
+            video_encode_for_web(
+                video_file,
+                video_web_file,
+                on_progress=progress.step("transcode-web"),
+                cancel_token=cancel_token,
+            )
         media_uploads.append(("video", "web", "web.mp4", "video/mp4", video_web_file))
 
+        raise_if_cancelled(cancel_token)
         media = []
         s3 = _create_s3_client()
         s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
@@ -295,12 +397,14 @@ def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                         "url": item_path,
                     }
                 )
-                s3.upload_file(
-                    str(file),
-                    s3_bucket,
-                    item_path,
-                    ExtraArgs={"ContentType": content_type},
-                )
+                with span("s3.upload_file", kind="client"):
+                    s3.upload_file(
+                        str(file),
+                        s3_bucket,
+                        item_path,
+                        ExtraArgs={"ContentType": content_type},
+                        **_s3_upload_cancel_args(cancel_token),
+                    )
             else:
                 import logging
 
@@ -323,26 +427,48 @@ def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
         import logging
 
         logging.exception(x)
-        _delete_video_work_dir(work_dir)
+        _delete_stage_outputs(
+            [
+                path.join(params.get("work_dir"), "mobile.mp4"),
+                path.join(params.get("work_dir"), "web.mp4"),
+            ]
+        )
         upload_task_status_update(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
                 task_id=task_id,
-                new_status="FAILED",
+                new_status=_failed_status(x),
             )
         )
 
 
-def transcribe_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
+def transcribe_stage(
+    dict_tuple: dict,
+    req: ProcessAnswerRequest,
+    task_id: str,
+    on_progress: Optional[PublishProgress] = None,
+    cancel_token: Optional[CancellationToken] = None,
+):
     params = extract_params_for_transcode_transcribe_stages(dict_tuple, req, task_id)
     try:
         mentor = params.get("mentor")
         question = params.get("question")
         work_dir = params.get("work_dir")
+        claim_work_dir(work_dir, task_id)
         video_file = params.get("video_file")
         is_idle = is_idle_question(question)
-        audio_file = video_to_audio(video_file)
+        progress = ThrottledProgress(on_progress, ["extract-audio"])
+        early_media = wait_for_early_media(params.get("early_media_dir", ""))
+        audio_file = (
+            str(early_media / "audio.mp3")
+            if early_media
+            else video_to_audio(
+                video_file,
+                on_progress=progress.step("extract-audio"),
+                cancel_token=cancel_token,
+            )
+        )
         transcript = ""
         subtitles = ""
         if not is_idle:
@@ -354,14 +480,17 @@ def transcribe_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                     new_status="IN_PROGRESS",
                 )
             )
+            raise_if_cancelled(cancel_token)
             transcription_service = transcribe.init_transcription_service()
-            transcribe_result = transcription_service.transcribe(
-                [
-                    transcribe.TranscribeJobRequest(
-                        sourceFile=audio_file, generateSubtitles=True
-                    )
-                ]
-            )
+            with span("transcribe", kind="client"):
+                transcribe_result = transcription_service.transcribe(
+                    [
+                        transcribe.TranscribeJobRequest(
+                            sourceFile=audio_file, generateSubtitles=True
+                        )
+                    ]
+                )
+            raise_if_cancelled(cancel_token)
             job_result = transcribe_result.first()
             transcript = job_result.transcript if job_result else ""
             subtitles = job_result.subtitles if job_result else ""
@@ -378,13 +507,14 @@ def transcribe_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
         import logging
 
         logging.exception(x)
-        _delete_video_work_dir(work_dir)
+        # the audio extracted from the video, early media are finalization's
+        _delete_stage_outputs([f"{path.splitext(params.get('video_file'))[0]}.mp3"])
         upload_task_status_update(
             UpdateTaskStatusRequest(
                 mentor=mentor,
                 question=question,
                 task_id=task_id,
-                new_status="FAILED",
+                new_status=_failed_status(x),
             )
         )
 
@@ -450,11 +580,17 @@ def get_video_and_vtt_file_paths(work_dir: str):
     return video_web_file, vtt_file
 
 
-def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
+def finalization_stage(
+    dict_tuple: dict,
+    req: ProcessAnswerRequest,
+    task_id: str,
+    cancel_token: Optional[CancellationToken] = None,
+):
     params = extract_params_for_finalization_stage(dict_tuple, req, task_id)
     mentor = params.get("mentor")
     question = params.get("question")
     work_dir = Path(params.get("work_dir"))
+    claim_work_dir(work_dir, task_id)
     try:
         video_path_full = upload_path(params["video_path"])
         upload_task_status_update(
@@ -484,6 +620,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
                 logging.error(f"Failed to create vtt file at {vtt_file}")
                 logging.exception(vtt_err)
 
+        raise_if_cancelled(cancel_token)
         if media_uploads:
             s3 = _create_s3_client()
             s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
@@ -498,12 +635,14 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
                             "url": item_path,
                         }
                     )
-                    s3.upload_file(
-                        str(file),
-                        s3_bucket,
-                        item_path,
-                        ExtraArgs={"ContentType": content_type},
-                    )
+                    with span("s3.upload_file", kind="client"):
+                        s3.upload_file(
+                            str(file),
+                            s3_bucket,
+                            item_path,
+                            ExtraArgs={"ContentType": content_type},
+                            **_s3_upload_cancel_args(cancel_token),
+                        )
                 else:
                     import logging
 
@@ -538,7 +677,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
                 mentor=req.get("mentor"),
                 question=req.get("question"),
                 task_id=task_id,
-                new_status="FAILED",
+                new_status=_failed_status(x),
             )
         )
     finally:
@@ -547,6 +686,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
             #  We generally do want to clean these up, but maybe should have a flag
             # in the job request like "disable_delete_file_on_complete" (default False)
             _delete_video_work_dir(work_dir)
+            delete_early_media(params.get("early_media_dir", ""))
             remove(video_path_full)
         except Exception as x:
             import logging
@@ -555,8 +695,13 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
             logging.exception(x)
 
 
-def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
-    with _trimming_work_dir() as context:
+def trim_existing_upload(
+    req: TrimExistingUploadRequest,
+    task_id: str,
+    on_progress: Optional[PublishProgress] = None,
+    cancel_token: Optional[CancellationToken] = None,
+):
+    with _trimming_work_dir(task_id) as context:
         try:
             work_dir = context
             mentor = req.get("mentor")
@@ -587,11 +732,22 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
             mobile_video_url = mobile_media["url"]
             web_trim_file = work_dir / "web_trim.mp4"
             mobile_trim_file = work_dir / "mobile_trim.mp4"
+            progress = ThrottledProgress(on_progress, ["trim-web", "trim-mobile"])
             existing_video_trim(
-                web_video_url, web_trim_file, trim.get("start"), trim.get("end")
+                web_video_url,
+                web_trim_file,
+                trim.get("start"),
+                trim.get("end"),
+                on_progress=progress.step("trim-web"),
+                cancel_token=cancel_token,
             )
             existing_video_trim(
-                mobile_video_url, mobile_trim_file, trim.get("start"), trim.get("end")
+                mobile_video_url,
+                mobile_trim_file,
+                trim.get("start"),
+                trim.get("end"),
+                on_progress=progress.step("trim-mobile"),
+                cancel_token=cancel_token,
             )
             media_uploads = []
             new_media = []
@@ -621,6 +777,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
             else:
                 new_media.append(vtt_media)
 
+            raise_if_cancelled(cancel_token)
             if media_uploads:
                 s3 = _create_s3_client()
                 s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
@@ -635,12 +792,14 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
                                 "url": item_path,
                             }
                         )
-                        s3.upload_file(
-                            str(file),
-                            s3_bucket,
-                            item_path,
-                            ExtraArgs={"ContentType": content_type},
-                        )
+                        with span("s3.upload_file", kind="client"):
+                            s3.upload_file(
+                                str(file),
+                                s3_bucket,
+                                item_path,
+                                ExtraArgs={"ContentType": content_type},
+                                **_s3_upload_cancel_args(cancel_token),
+                            )
                     else:
                         import logging
 
@@ -673,7 +832,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
                     mentor=mentor,
                     question=question,
                     task_id=task_id,
-                    new_status="FAILED",
+                    new_status=_failed_status(x),
                     transcript=transcript,
                     media=answer_media,
                 )
@@ -717,12 +876,13 @@ def regen_vtt(req: RegenVTTRequest):
                             "url": item_path,
                         }
                     )
-                    s3.upload_file(
-                        str(file),
-                        s3_bucket,
-                        item_path,
-                        ExtraArgs={"ContentType": content_type},
-                    )
+                    with span("s3.upload_file", kind="client"):
+                        s3.upload_file(
+                            str(file),
+                            s3_bucket,
+                            item_path,
+                            ExtraArgs={"ContentType": content_type},
+                        )
                 else:
                     import logging
 
@@ -772,12 +932,13 @@ def process_transfer_video(req: ProcessTransferRequest, task_id: str):
                 s3 = _create_s3_client()
                 s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
                 content_type = "text/vtt" if typ == "subtitles" else "video/mp4"
-                s3.upload_file(
-                    file_path,
-                    s3_bucket,
-                    item_path,
-                    ExtraArgs={"ContentType": content_type},
-                )
+                with span("s3.upload_file", kind="client"):
+                    s3.upload_file(
+                        file_path,
+                        s3_bucket,
+                        item_path,
+                        ExtraArgs={"ContentType": content_type},
+                    )
                 m["needsTransfer"] = False
                 m["url"] = item_path
 
@@ -877,12 +1038,13 @@ def process_transfer_mentor(req: ProcessTransferMentor, task_id: str):
                         s3 = _create_s3_client()
                         s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
                         content_type = "text/vtt" if typ == "subtitles" else "video/mp4"
-                        s3.upload_file(
-                            file_path,
-                            s3_bucket,
-                            item_path,
-                            ExtraArgs={"ContentType": content_type},
-                        )
+                        with span("s3.upload_file", kind="client"):
+                            s3.upload_file(
+                                file_path,
+                                s3_bucket,
+                                item_path,
+                                ExtraArgs={"ContentType": content_type},
+                            )
                         m["needsTransfer"] = False
                         m["url"] = item_path
                         update_media_vars = {"mentor": mentor, "question": question}
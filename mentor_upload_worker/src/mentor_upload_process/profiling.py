@@ -0,0 +1,126 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+cProfile/tracemalloc profiling shared by the api and the worker. The flask
+and celery hooks are in mentor_upload_api.profiling and mentor_upload_tasks.profiling
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+log = logging.getLogger()
+
+# set by the api on the tasks of a request that asked to be profiled
+PROFILE_TASK_HEADER = "mentor_upload_profile"
+
+
+def is_profiling_enabled() -> bool:
+    return os.environ.get("PROFILING_ENABLED", "") == "true"
+
+
+def get_profiling_dir() -> str:
+    return os.environ.get("PROFILING_DIR") or "./profiles"
+
+
+def get_profiling_sample_rate() -> float:
+    return float(os.environ.get("PROFILING_SAMPLE_RATE") or "1.0")
+
+
+def get_profiling_min_interval_secs() -> float:
+    return float(os.environ.get("PROFILING_MIN_INTERVAL_SECS") or "60")
+
+
+def get_tracemalloc_frames() -> int:
+    return int(os.environ.get("PROFILING_TRACEMALLOC_FRAMES") or "10")
+
+
+_last_profile_started = 0.0
+_active = False
+_lock = threading.Lock()
+
+
+def _acquire(forced: bool) -> bool:
+    """
+    Decides whether the next unit of work gets profiled.
+    Only one profile runs at a time per process and profiles are at least
+    PROFILING_MIN_INTERVAL_SECS apart, so this can stay on in production.
+    A forced (per-request) profile skips sampling but not the rate limit.
+    """
+    global _last_profile_started, _active
+    if not forced and not is_profiling_enabled():
+        return False
+    if not forced and random.random() >= get_profiling_sample_rate():
+        return False
+    with _lock:
+        now = time.monotonic()
+        if _active or (
+            _last_profile_started
+            and now - _last_profile_started < get_profiling_min_interval_secs()
+        ):
+            return False
+        _active = True
+        _last_profile_started = now
+        return True
+
+
+def _release() -> None:
+    global _active
+    with _lock:
+        _active = False
+
+
+def profile_path(key: str, ext: str) -> str:
+    safe_key = re.sub(r"[^\w.-]", "_", key) or "unknown"
+    return os.path.join(get_profiling_dir(), f"{safe_key}.{ext}")
+
+
+@contextmanager
+def profile(key: str, forced: bool = False):
+    """
+    Runs the enclosed block under cProfile and tracemalloc (when selected)
+    and writes {PROFILING_DIR}/{key}.prof and {key}.tracemalloc
+    """
+    if not _acquire(forced):
+        yield False
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as x:
+        # another profiler (e.g. a debugger) is already active
+        log.warning("profiling %s skipped: %s", key, x)
+        _release()
+        yield False
+        return
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(get_tracemalloc_frames())
+    try:
+        yield True
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _release()
+        _write_profile(key, profiler, snapshot)
+
+
+def _write_profile(key: str, profiler: cProfile.Profile, snapshot) -> None:
+    try:
+        os.makedirs(get_profiling_dir(), exist_ok=True)
+        profiler.dump_stats(profile_path(key, "prof"))
+        snapshot.dump(profile_path(key, "tracemalloc"))
+        log.info("wrote profile %s", profile_path(key, "prof"))
+    except Exception as x:
+        log.warning("failed to write profile %s: %s", key, x)
@@ -0,0 +1,81 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import threading
+import time
+from os import environ
+from typing import Callable, List, Optional
+
+from .media_tools import FFmpegProgress, ProgressCallback
+
+PublishProgress = Callable[[dict], None]
+
+
+def get_progress_update_interval_secs() -> float:
+    return float(environ.get("PROGRESS_UPDATE_INTERVAL_SECS") or "3")
+
+
+class ThrottledProgress:
+    """
+    Combines the ffmpeg progress of the steps of a stage into one percent-complete
+    and publishes it at most once every PROGRESS_UPDATE_INTERVAL_SECS
+    """
+
+    def __init__(
+        self,
+        publish: Optional[PublishProgress],
+        steps: List[str],
+        interval_secs: Optional[float] = None,
+    ):
+        self.publish = publish
+        self.steps = steps
+        self.interval_secs = (
+            get_progress_update_interval_secs()
+            if interval_secs is None
+            else interval_secs
+        )
+        self._started = time.monotonic()
+        self._last_published: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def step(self, name: str) -> Optional[ProgressCallback]:
+        """Returns the ffmpeg progress callback for a step, None when not publishing"""
+        if self.publish is None:
+            return None
+        index = self.steps.index(name)
+
+        def on_progress(p: FFmpegProgress) -> None:
+            self._update(name, index, p)
+
+        return on_progress
+
+    def _update(self, name: str, index: int, p: FFmpegProgress) -> None:
+        now = time.monotonic()
+        is_last = p.done and index == len(self.steps) - 1
+        with self._lock:
+            if (
+                not is_last
+                and self._last_published is not None
+                and now - self._last_published < self.interval_secs
+            ):
+                return
+            self._last_published = now
+        percent = (100.0 * index + max(p.percent, 0.0)) / len(self.steps)
+        if len(self.steps) == 1 or is_last:
+            eta_secs = p.eta_secs
+        elif percent > 0:
+            # ffmpeg only knows the eta of the current step, extrapolate the rest
+            eta_secs = (now - self._started) * (100.0 - percent) / percent
+        else:
+            eta_secs = -1.0
+        self.publish(
+            {
+                "step": name,
+                "percent": round(percent, 1),
+                "eta_secs": round(eta_secs, 1),
+                "speed": p.speed,
+            }
+        )
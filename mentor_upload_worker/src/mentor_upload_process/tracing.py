@@ -0,0 +1,301 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Tracing shared by the api and the worker: spans with W3C traceparent
+propagation, exported as json lines or OTLP/HTTP. The flask and celery
+hooks are in mentor_upload_api.tracing and mentor_upload_tasks.tracing
+"""
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Dict, List, Optional
+
+import requests
+
+log = logging.getLogger()
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+def is_tracing_enabled() -> bool:
+    return os.environ.get("TRACING_ENABLED", "") == "true"
+
+
+_default_service_name = "mentor-upload"
+
+
+def set_default_service_name(name: str) -> None:
+    """Name of the service exporting spans, unless TRACE_SERVICE_NAME is set"""
+    global _default_service_name
+    _default_service_name = name
+
+
+def get_trace_service_name() -> str:
+    return os.environ.get("TRACE_SERVICE_NAME") or _default_service_name
+
+
+def get_trace_exporter_name() -> str:
+    # "file" writes one json span per line, "otlp" posts OTLP/HTTP json
+    return os.environ.get("TRACE_EXPORTER") or "file"
+
+
+def get_trace_export_file() -> str:
+    return os.environ.get("TRACE_EXPORT_FILE") or "./traces.jsonl"
+
+
+def get_trace_otlp_endpoint() -> str:
+    return os.environ.get("TRACE_OTLP_ENDPOINT") or "http://localhost:4318/v1/traces"
+
+
+@dataclass
+class SpanContext:
+    trace_id: str
+    span_id: str
+    is_remote: bool = False
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: str = ""
+    kind: str = "internal"
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict[str, str] = field(default_factory=dict)
+    error: str = ""
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = str(value)
+
+
+_current_context: ContextVar[Optional[SpanContext]] = ContextVar(
+    "mentor_upload_trace_context", default=None
+)
+
+
+def _new_id(num_bytes: int) -> str:
+    return binascii.hexlify(os.urandom(num_bytes)).decode("ascii")
+
+
+def current_context() -> Optional[SpanContext]:
+    return _current_context.get()
+
+
+def current_trace_id() -> str:
+    ctx = current_context()
+    return ctx.trace_id if ctx else ""
+
+
+def format_traceparent(ctx: SpanContext) -> str:
+    return f"00-{ctx.trace_id}-{ctx.span_id}-01"
+
+
+def parse_traceparent(traceparent: str) -> Optional[SpanContext]:
+    try:
+        _, trace_id, span_id, _ = (traceparent or "").strip().split("-")
+    except ValueError:
+        return None
+    if len(trace_id) != 32 or len(span_id) != 16:
+        return None
+    return SpanContext(trace_id=trace_id, span_id=span_id, is_remote=True)
+
+
+class FileSpanExporter:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(f"{json.dumps(_span_to_dict(s))}\n" for s in spans)
+        with self._lock:
+            with open(self.file_path, "a") as f:
+                f.write(lines)
+
+
+class OTLPHttpSpanExporter:
+    def __init__(self, endpoint: str, service_name: str):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]) -> None:
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "mentor_upload_process.tracing"},
+                            "spans": [_span_to_otlp(s) for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        res = requests.post(self.endpoint, json=body, timeout=5)
+        res.raise_for_status()
+
+
+_OTLP_SPAN_KINDS = {
+    "internal": 1,
+    "server": 2,
+    "client": 3,
+    "producer": 4,
+    "consumer": 5,
+}
+
+
+def _span_to_dict(s: Span) -> dict:
+    return {
+        "service": get_trace_service_name(),
+        "name": s.name,
+        "kind": s.kind,
+        "trace_id": s.context.trace_id,
+        "span_id": s.context.span_id,
+        "parent_id": s.parent_id,
+        "start_ns": s.start_ns,
+        "end_ns": s.end_ns,
+        "duration_ms": (s.end_ns - s.start_ns) / 1_000_000,
+        "attributes": s.attributes,
+        "error": s.error,
+    }
+
+
+def _span_to_otlp(s: Span) -> dict:
+    otlp_span = {
+        "traceId": s.context.trace_id,
+        "spanId": s.context.span_id,
+        "name": s.name,
+        "kind": _OTLP_SPAN_KINDS.get(s.kind, 1),
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [
+            {"key": k, "value": {"stringValue": v}} for k, v in s.attributes.items()
+        ],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        otlp_span["parentSpanId"] = s.parent_id
+    return otlp_span
+
+
+def create_span_exporter():
+    if get_trace_exporter_name() == "otlp":
+        return OTLPHttpSpanExporter(get_trace_otlp_endpoint(), get_trace_service_name())
+    return FileSpanExporter(get_trace_export_file())
+
+
+_exporter = None
+_finished_spans: List[Span] = []
+_finished_spans_lock = threading.Lock()
+MAX_BUFFERED_SPANS = 512
+
+
+def _get_exporter():
+    global _exporter
+    if _exporter is None:
+        _exporter = create_span_exporter()
+    return _exporter
+
+
+def flush_spans() -> None:
+    with _finished_spans_lock:
+        spans = list(_finished_spans)
+        _finished_spans.clear()
+    if not spans:
+        return
+    try:
+        _get_exporter().export(spans)
+    except Exception as x:
+        # tracing must never break an upload
+        log.warning("failed to export %d trace spans: %s", len(spans), x)
+
+
+def _on_span_end(s: Span, is_local_root: bool) -> None:
+    with _finished_spans_lock:
+        _finished_spans.append(s)
+        buffered = len(_finished_spans)
+    if is_local_root or buffered >= MAX_BUFFERED_SPANS:
+        flush_spans()
+
+
+@contextmanager
+def span(
+    name: str,
+    parent: Optional[SpanContext] = None,
+    kind: str = "internal",
+    **attributes,
+):
+    """
+    Runs the enclosed block as a child span of the current (or given) trace context.
+    Ids are always propagated so logs and task headers can be correlated,
+    spans are only recorded and exported when TRACING_ENABLED=true
+    """
+    parent = parent or current_context()
+    ctx = SpanContext(
+        trace_id=parent.trace_id if parent else _new_id(16), span_id=_new_id(8)
+    )
+    token = _current_context.set(ctx)
+    if not is_tracing_enabled():
+        try:
+            yield None
+        finally:
+            _current_context.reset(token)
+        return
+    s = Span(
+        name=name,
+        context=ctx,
+        parent_id=parent.span_id if parent else "",
+        kind=kind,
+        start_ns=time.time_ns(),
+    )
+    for k, v in attributes.items():
+        s.set_attribute(k, v)
+    try:
+        yield s
+    except BaseException as x:
+        s.error = repr(x)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_context.reset(token)
+        _on_span_end(s, is_local_root=parent is None or parent.is_remote)
+
+
+def traced(name: str, kind: str = "client"):
+    """Decorator that records every call to the wrapped function as a span"""
+
+    def traced_wrapper(f):
+        @wraps(f)
+        def traced_function(*args, **kwargs):
+            with span(name, kind=kind):
+                return f(*args, **kwargs)
+
+        return traced_function
+
+    return traced_wrapper
+
+
+def inject_headers(headers: dict) -> dict:
+    ctx = current_context()
+    if ctx and headers is not None:
+        headers[TRACEPARENT_HEADER] = format_traceparent(ctx)
+    return headers
@@ -0,0 +1,273 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from os import environ
+from pathlib import Path
+from shutil import rmtree
+from tempfile import gettempdir
+from typing import List, Optional
+
+log = logging.getLogger()
+
+OWNER_FILE = ".owner.json"
+# bytes the job reserved when it created the work dir
+RESERVATION_FILE = ".reserved"
+# taken by every process (on every host sharing the root) creating a work dir
+LOCK_FILE = ".lock"
+
+
+class WorkDirQuotaExceededError(Exception):
+    pass
+
+
+def get_work_dir_root() -> Path:
+    return Path(
+        environ.get("TRANSCODE_WORK_DIR")
+        or os.path.join(gettempdir(), "mentor-upload-work")
+    )
+
+
+def is_ram_scratch_enabled() -> bool:
+    return environ.get("RAM_SCRATCH_ENABLED", "") == "true"
+
+
+def get_ram_scratch_root() -> Path:
+    return Path(environ.get("RAM_SCRATCH_DIR") or "/dev/shm/mentor-upload-work")
+
+
+def get_ram_scratch_max_input_bytes() -> int:
+    return int(environ.get("RAM_SCRATCH_MAX_INPUT_BYTES") or str(50 * 1024 * 1024))
+
+
+def get_ram_scratch_budget_bytes() -> int:
+    # total for all work dirs in ram on this host
+    return int(environ.get("RAM_SCRATCH_BUDGET_BYTES") or str(512 * 1024 * 1024))
+
+
+def get_work_dir_quota_bytes() -> int:
+    # 0 means no quota
+    return int(environ.get("WORK_DIR_QUOTA_BYTES") or "0")
+
+
+def get_work_dir_reserve_factor() -> float:
+    # a job writes about this many copies of its source video (copy, trim, web, mobile)
+    return float(environ.get("WORK_DIR_RESERVE_FACTOR") or "4")
+
+
+def get_work_dir_ttl_secs() -> float:
+    return float(environ.get("WORK_DIR_TTL_SECS") or "21600")
+
+
+def get_work_dir_gc_interval_secs() -> float:
+    return float(environ.get("WORK_DIR_GC_INTERVAL_SECS") or "3600")
+
+
+_lock = threading.Lock()
+
+
+def _dir_size(p: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(p):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass  # deleted while walking
+    return total
+
+
+def _reserved_bytes(work_dir: Path) -> Optional[int]:
+    try:
+        with open(work_dir / RESERVATION_FILE) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def work_dir_usage_bytes(root: Optional[Path] = None) -> int:
+    """
+    What the work dirs under root reserved, without walking them. Work dirs
+    created without a reservation are counted by their size
+    """
+    root = root or get_work_dir_root()
+    if not root.is_dir():
+        return 0
+    total = 0
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        reserved = _reserved_bytes(Path(entry.path))
+        total += _dir_size(Path(entry.path)) if reserved is None else reserved
+    return total
+
+
+@contextmanager
+def _creation_lock():
+    """Serializes reservations between threads, pool processes and hosts"""
+    root = get_work_dir_root()
+    os.makedirs(root, exist_ok=True)
+    with _lock, open(root / LOCK_FILE, "a") as lock_file:
+        fcntl.lockf(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+
+def _roots() -> List[Path]:
+    roots = [get_work_dir_root()]
+    if is_ram_scratch_enabled():
+        roots.append(get_ram_scratch_root())
+    return roots
+
+
+def _use_ram_scratch(input_bytes: Optional[int], reserve_bytes: int) -> bool:
+    """
+    Short clips get their work dir on tmpfs to skip disk (often network volume) io.
+    All stages of a job must then run on the same host, since they share the dir
+    """
+    if (
+        not is_ram_scratch_enabled()
+        or input_bytes is None
+        or input_bytes > get_ram_scratch_max_input_bytes()
+    ):
+        return False
+    root = get_ram_scratch_root()
+    try:
+        os.makedirs(root, exist_ok=True)
+    except OSError as x:
+        log.warning("ram scratch dir %s unavailable: %s", root, x)
+        return False
+    return work_dir_usage_bytes(root) + reserve_bytes <= get_ram_scratch_budget_bytes()
+
+
+def _write_owner(work_dir: Path, task_id: str) -> None:
+    with open(work_dir / OWNER_FILE, "w") as f:
+        json.dump(
+            {
+                "task_id": task_id,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "created": time.time(),
+            },
+            f,
+        )
+
+
+def read_owner(work_dir: Path) -> dict:
+    try:
+        with open(Path(work_dir) / OWNER_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def create_work_dir(
+    name: str,
+    task_id: str = "",
+    reserve_bytes: int = 0,
+    input_bytes: Optional[int] = None,
+) -> Path:
+    """
+    Creates a work dir owned by task_id, in ram when input_bytes is small enough
+    (see RAM_SCRATCH_*) otherwise under the work dir root.
+    Raises WorkDirQuotaExceededError when the root (plus reserve_bytes
+    for what the job will write) would exceed WORK_DIR_QUOTA_BYTES,
+    even after removing expired orphans. reserve_bytes stays counted
+    against the quota until the work dir is deleted
+    """
+    quota = get_work_dir_quota_bytes()
+    with _creation_lock():
+        if _use_ram_scratch(input_bytes, reserve_bytes):
+            root = get_ram_scratch_root()
+            quota = 0  # already checked against the ram budget
+        else:
+            root = get_work_dir_root()
+        if quota > 0 and work_dir_usage_bytes() + reserve_bytes > quota:
+            gc_orphans()
+            usage = work_dir_usage_bytes()
+            if usage + reserve_bytes > quota:
+                raise WorkDirQuotaExceededError(
+                    f"work dir quota exceeded: {usage} bytes used, {reserve_bytes} needed, quota {quota}"
+                )
+        work_dir = root / name
+        os.makedirs(work_dir)
+        _write_owner(work_dir, task_id)
+        if reserve_bytes:
+            with open(work_dir / RESERVATION_FILE, "w") as f:
+                f.write(str(reserve_bytes))
+    return work_dir
+
+
+def claim_work_dir(work_dir: Path, task_id: str) -> None:
+    """Records that a later stage is now using the work dir, which also resets its ttl"""
+    work_dir = Path(work_dir)
+    if work_dir.is_dir():
+        _write_owner(work_dir, task_id)
+
+
+def delete_work_dir(work_dir: Path) -> None:
+    try:
+        rmtree(str(work_dir))
+    except FileNotFoundError:
+        pass
+    except Exception as x:
+        log.error(f"failed to delete media work dir {work_dir}")
+        log.exception(x)
+
+
+def _last_active(work_dir: Path) -> float:
+    owner_file = work_dir / OWNER_FILE
+    return (owner_file if owner_file.exists() else work_dir).stat().st_mtime
+
+
+def gc_orphans(now: Optional[float] = None) -> List[Path]:
+    """Deletes work dirs that no stage has claimed for longer than WORK_DIR_TTL_SECS"""
+    now = time.time() if now is None else now
+    ttl = get_work_dir_ttl_secs()
+    deleted = []
+    entries = [e for root in _roots() if root.is_dir() for e in root.iterdir()]
+    for entry in entries:
+        try:
+            if not entry.is_dir() or now - _last_active(entry) < ttl:
+                continue
+        except FileNotFoundError:
+            continue
+        log.info(
+            "deleting orphaned work dir %s %s", entry, read_owner(entry) or "(no owner)"
+        )
+        delete_work_dir(entry)
+        deleted.append(entry)
+    return deleted
+
+
+_gc_thread: Optional[threading.Thread] = None
+
+
+def start_periodic_gc() -> None:
+    """Collects orphans now and every WORK_DIR_GC_INTERVAL_SECS in a daemon thread"""
+    global _gc_thread
+    if _gc_thread is not None:
+        return
+
+    def gc_loop():
+        while True:
+            try:
+                gc_orphans()
+            except Exception as x:
+                log.exception(x)
+            time.sleep(get_work_dir_gc_interval_secs())
+
+    _gc_thread = threading.Thread(target=gc_loop, name="work-dir-gc", daemon=True)
+    _gc_thread.start()
@@ -9,6 +9,8 @@ from logging.config import dictConfig
 import os
 import json
 
+from mentor_upload_process.tracing import current_trace_id
+
 
 class JSONFormatter(logging.Formatter):
     RECORD_ATTRS = [
@@ -33,6 +35,9 @@ class JSONFormatter(logging.Formatter):
         payload["logger"] = payload["name"]
         del payload["name"]
         payload["message"] = record.getMessage()
+        trace_id = current_trace_id()
+        if trace_id:
+            payload["trace_id"] = trace_id
         return payload
 
     def format(self, record):
@@ -0,0 +1,67 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""Celery hooks of the profiling in mentor_upload_process.profiling"""
+from typing import Dict
+
+from mentor_upload_process.profiling import PROFILE_TASK_HEADER, profile
+
+
+def _is_profile_requested(task, args, kwargs) -> bool:
+    """
+    Pipeline stages only get a pipeline id, so they are profiled on request
+    via the task header. Other tasks have "profile" in their req as well
+    """
+    if getattr(task.request, PROFILE_TASK_HEADER, False):
+        return True
+    req = (kwargs or {}).get("req")
+    if req is None and args:
+        req = args[0]
+    return isinstance(req, dict) and bool(req.get("profile"))
+
+
+_task_profiles: Dict[str, object] = {}
+
+
+def _task_prerun(task_id=None, task=None, args=None, kwargs=None, **kw):
+    cm = profile(
+        f"{task.name.rsplit('.', 1)[-1]}-{task_id}",
+        forced=_is_profile_requested(task, args, kwargs),
+    )
+    if cm.__enter__():
+        _task_profiles[task_id] = cm
+    else:
+        cm.__exit__(None, None, None)
+
+
+def _task_postrun(task_id=None, **kwargs):
+    cm = _task_profiles.pop(task_id, None)
+    if cm is not None:
+        cm.__exit__(None, None, None)
+
+
+def _before_task_publish(headers=None, **kwargs):
+    from celery import current_task
+
+    # the next stages of a profiled pipeline are sent from inside its tasks
+    if (
+        headers is not None
+        and current_task is not None
+        and getattr(current_task.request, PROFILE_TASK_HEADER, False)
+    ):
+        headers[PROFILE_TASK_HEADER] = True
+
+
+def install_celery_profiling() -> None:
+    """
+    Profiles task bodies sampled by PROFILING_* env
+    or sent with the profile header or "profile": true in their req
+    """
+    from celery.signals import before_task_publish, task_postrun, task_prerun
+
+    before_task_publish.connect(_before_task_publish, weak=False)
+    task_prerun.connect(_task_prerun, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
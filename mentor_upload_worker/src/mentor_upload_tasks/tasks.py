@@ -11,6 +11,8 @@ load_dotenv()  # take environment variables from .env.
 import os  # NOQA
 import logging  # NOQA
 from celery import Celery  # NOQA
+from celery.exceptions import MaxRetriesExceededError  # NOQA
+from celery.signals import worker_init, worker_process_init, worker_ready  # NOQA
 from kombu import Exchange, Queue  # NOQA
 
 from mentor_upload_process import (  # NOQA
@@ -21,28 +23,45 @@ from mentor_upload_process import (  # NOQA
     ProcessTransferMentor,
     ProcessTransferRequest,
     TrimExistingUploadRequest,
-    process,
     RegenVTTRequest,
 )
+from mentor_upload_process import pipeline  # NOQA
+from mentor_upload_tasks import profiling, tracing  # NOQA
+from mentor_upload_process.api import (  # NOQA
+    UpdateTaskStatusRequest,
+    upload_task_status_update,
+)
+from mentor_upload_process.cancellation import CancellationToken  # NOQA
+from mentor_upload_process.fair_queue import (  # NOQA
+    release_transcode_slot,
+    try_acquire_transcode_slot,
+)
+from mentor_upload_process.work_dirs import (  # NOQA
+    WorkDirQuotaExceededError,
+    start_periodic_gc,
+)
 
 log = logging.getLogger()
 
-if os.environ.get("IS_SENTRY_ENABLED", "") == "true":
-    log.info("SENTRY enabled, calling init")
-    import sentry_sdk  # NOQA E402
-    from sentry_sdk.integrations.celery import CeleryIntegration  # NOQA E402
 
-    sentry_sdk.init(
-        dsn=os.environ.get("SENTRY_DSN_MENTOR_UPLOAD"),
-        # include project so issues can be filtered in sentry:
-        environment=os.environ.get("PYTHON_ENV", "careerfair-qa"),
-        integrations=[CeleryIntegration()],
-        # Set traces_sample_rate to 1.0 to capture 100%
-        # of transactions for performance monitoring.
-        # We recommend adjusting this value in production.
-        traces_sample_rate=0.20,
-        debug=os.environ.get("SENTRY_DEBUG_UPLOADER", "") == "true",
-    )
+def is_worker_warmup_enabled() -> bool:
+    return os.environ.get("WORKER_WARMUP_ENABLED", "") == "true"
+
+
+def get_work_dir_quota_retry_secs() -> int:
+    return int(os.environ.get("WORK_DIR_QUOTA_RETRY_SECS") or "60")
+
+
+def get_work_dir_quota_max_retries() -> int:
+    return int(os.environ.get("WORK_DIR_QUOTA_MAX_RETRIES") or "30")
+
+
+def get_fair_queue_retry_secs() -> int:
+    return int(os.environ.get("FAIR_QUEUE_RETRY_SECS") or "15")
+
+
+def get_fair_queue_max_retries() -> int:
+    return int(os.environ.get("FAIR_QUEUE_MAX_RETRIES") or "240")
 
 
 def get_queue_trim_upload_stage() -> str:
@@ -65,6 +84,15 @@ def get_queue_cancel_task() -> str:
     return os.environ.get("CANCEL_TASK_QUEUE_NAME") or "cancel"
 
 
+def get_broker_transport_options() -> dict:
+    # must match the api: one redis list per priority, 0 consumed first and 9 last
+    return {"priority_steps": list(range(10)), "sep": ":"}
+
+
+# interactive lane, unknown duration (see get_task_priority in the api)
+DEFAULT_TASK_PRIORITY = 2
+
+
 broker_url = (
     os.environ.get("UPLOAD_CELERY_BROKER_URL")
     or os.environ.get("CELERY_BROKER_URL")
@@ -83,6 +111,8 @@ celery_config = {
         or "redis://redis:6379/0"
     ),
     "result_serializer": os.environ.get("CELERY_RESULT_SERIALIZER", "json"),
+    "broker_transport_options": get_broker_transport_options(),
+    "task_default_priority": DEFAULT_TASK_PRIORITY,
     "task_default_queue": get_queue_finalization_stage(),
     "task_default_exchange": get_queue_finalization_stage(),
     # for debugging:
@@ -147,48 +177,249 @@ celery_config = {
 
 log.info("%s", {"celery_config": celery_config})
 celery.conf.update(celery_config)
+tracing.install_celery_tracing()
+profiling.install_celery_profiling()
 
 
-@celery.task()
+@worker_init.connect
+def init_sentry(**kwargs):
+    if os.environ.get("IS_SENTRY_ENABLED", "") != "true":
+        return
+    log.info("SENTRY enabled, calling init")
+    import sentry_sdk
+    from sentry_sdk.integrations.celery import CeleryIntegration
+
+    sentry_sdk.init(
+        dsn=os.environ.get("SENTRY_DSN_MENTOR_UPLOAD"),
+        # include project so issues can be filtered in sentry:
+        environment=os.environ.get("PYTHON_ENV", "careerfair-qa"),
+        integrations=[CeleryIntegration()],
+        # Set traces_sample_rate to 1.0 to capture 100%
+        # of transactions for performance monitoring.
+        # We recommend adjusting this value in production.
+        traces_sample_rate=0.20,
+        debug=os.environ.get("SENTRY_DEBUG_UPLOADER", "") == "true",
+    )
+
+
+def _process():
+    # process pulls in boto3, transcribe, pymediainfo and ffmpy,
+    # only pay for them in the children that run a stage
+    from mentor_upload_process import process
+
+    return process
+
+
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    """
+    Loads process and the s3 service model in every pool child as it starts,
+    so its first task doesn't pay for them
+    """
+    if not is_worker_warmup_enabled():
+        return
+    try:
+        from pymediainfo import MediaInfo
+
+        _process()._create_s3_client()
+        MediaInfo.can_parse()
+    except Exception as x:
+        log.warning("worker warm up failed: %s", x)
+
+
+@worker_ready.connect
+def on_worker_ready(**kwargs):
+    # collects work dirs leaked by crashed chords, now and periodically
+    start_periodic_gc()
+
+
+def _defer_when_disk_full(
+    task, x: WorkDirQuotaExceededError, req, pipeline_id: str = "", stage: str = ""
+):
+    log.warning("deferring task %s: %s", task.request.id, x)
+    try:
+        return task.retry(
+            exc=x,
+            countdown=get_work_dir_quota_retry_secs(),
+            max_retries=get_work_dir_quota_max_retries(),
+        )
+    except (MaxRetriesExceededError, WorkDirQuotaExceededError):
+        # out of retries celery raises exc (MaxRetriesExceededError without one)
+        log.error("giving up on task %s, work dir still full", task.request.id)
+        try:
+            upload_task_status_update(
+                UpdateTaskStatusRequest(
+                    mentor=req.get("mentor"),
+                    question=req.get("question"),
+                    task_id=task.request.id,
+                    new_status="FAILED",
+                )
+            )
+        except Exception as update_err:
+            log.exception("failed to mark task failed: %s", update_err)
+        _fail_pipeline_stage(pipeline_id, stage)
+        raise
+
+
+def _publish_progress(task):
+    """Publishes stage progress as the PROGRESS state/info of the running task"""
+    task_id = task.request.id
+
+    def publish(meta: dict) -> None:
+        task.update_state(task_id=task_id, state="PROGRESS", meta=meta)
+
+    return publish
+
+
+def _load_pipeline_stage(pipeline_id: str, stage: str, dict_tuple, req):
+    """
+    Stages sent by a pipeline get their request and inputs from its store.
+    The request is None when the pipeline is gone (a parallel stage failed)
+    """
+    if not pipeline_id:
+        return dict_tuple, req
+    try:
+        req, artifacts = pipeline.load_stage(pipeline_id, stage)
+    except pipeline.PipelineNotFoundError as x:
+        log.warning("skipping %s stage: %s", stage, x)
+        return None, None
+    return artifacts, req
+
+
+def _complete_pipeline_stage(pipeline_id: str, stage: str, result):
+    if pipeline_id:
+        try:
+            pipeline.complete_stage(pipeline_id, stage, result, celery.send_task)
+        except pipeline.PipelineNotFoundError as x:
+            # a parallel stage failed after this one was done
+            log.warning("%s stage finished, not continuing: %s", stage, x)
+    return result
+
+
+def _fail_pipeline_stage(pipeline_id: str, stage: str) -> None:
+    if pipeline_id:
+        pipeline.fail_stage(pipeline_id, stage)
+
+
+@celery.task(acks_late=True)
 def trim_upload_stage(
-    req: ProcessAnswerRequest,
+    req: ProcessAnswerRequest = None, pipeline_id: str = ""
 ) -> ProcessAnswerResponse:
+    _, req = _load_pipeline_stage(pipeline_id, "trim_upload", None, req)
+    if req is None:
+        return None
     log.info(req)
     task_id = trim_upload_stage.request.id
     log.debug(trim_upload_stage.request)
-    return process.trim_upload_stage(req, task_id)
-
-
-@celery.task()
+    try:
+        result = _process().trim_upload_stage(
+            req,
+            task_id,
+            on_progress=_publish_progress(trim_upload_stage),
+            cancel_token=CancellationToken(task_id),
+        )
+    except WorkDirQuotaExceededError as x:
+        raise _defer_when_disk_full(
+            trim_upload_stage, x, req, pipeline_id, "trim_upload"
+        )
+    except Exception:
+        _fail_pipeline_stage(pipeline_id, "trim_upload")
+        raise
+    return _complete_pipeline_stage(pipeline_id, "trim_upload", result)
+
+
+@celery.task(acks_late=True)
 def transcode_stage(
-    dict_tuple: dict,
-    req: ProcessAnswerRequest,
+    dict_tuple: dict = None,
+    req: ProcessAnswerRequest = None,
+    pipeline_id: str = "",
 ) -> ProcessAnswerResponse:
+    dict_tuple, req = _load_pipeline_stage(pipeline_id, "transcode", dict_tuple, req)
+    if req is None:
+        return None
     log.info("transcode stage: %s, %s", dict_tuple, req)
     task_id = transcode_stage.request.id
     log.debug(transcode_stage.request)
-    return process.transcode_stage(dict_tuple, req, task_id)
+    mentor = req.get("mentor")
+    job_id = req.get("video_path") or task_id
+    if not try_acquire_transcode_slot(mentor, job_id):
+        if transcode_stage.request.retries < get_fair_queue_max_retries():
+            # mentor is at their in-flight limit, go to the back of the queue
+            # so jobs of other mentors run in between
+            log.info("transcode of %s deferred, mentor %s is busy", job_id, mentor)
+            raise transcode_stage.retry(
+                countdown=get_fair_queue_retry_secs(),
+                max_retries=get_fair_queue_max_retries(),
+            )
+        log.warning("transcode of %s waited too long, running over limit", job_id)
+    try:
+        result = _process().transcode_stage(
+            dict_tuple,
+            req,
+            task_id,
+            on_progress=_publish_progress(transcode_stage),
+            cancel_token=CancellationToken(task_id),
+        )
+    except Exception:
+        _fail_pipeline_stage(pipeline_id, "transcode")
+        raise
+    finally:
+        release_transcode_slot(mentor, job_id)
+    return _complete_pipeline_stage(pipeline_id, "transcode", result)
 
 
 @celery.task()
 def transcribe_stage(
-    dict_tuple: dict,
-    req: ProcessAnswerRequest,
+    dict_tuple: dict = None,
+    req: ProcessAnswerRequest = None,
+    pipeline_id: str = "",
 ) -> ProcessAnswerResponse:
+    dict_tuple, req = _load_pipeline_stage(pipeline_id, "transcribe", dict_tuple, req)
+    if req is None:
+        return None
     log.info("transcribe stage: %s, %s", dict_tuple, req)
     task_id = transcribe_stage.request.id
     log.debug(transcribe_stage.request)
-    return process.transcribe_stage(dict_tuple, req, task_id)
+    try:
+        result = _process().transcribe_stage(
+            dict_tuple,
+            req,
+            task_id,
+            on_progress=_publish_progress(transcribe_stage),
+            cancel_token=CancellationToken(task_id),
+        )
+    except Exception:
+        _fail_pipeline_stage(pipeline_id, "transcribe")
+        raise
+    return _complete_pipeline_stage(pipeline_id, "transcribe", result)
 
 
 @celery.task()
 def finalization_stage(
-    dict_tuple: dict, req: ProcessAnswerRequest
+    dict_tuple: dict = None,
+    req: ProcessAnswerRequest = None,
+    pipeline_id: str = "",
 ) -> ProcessAnswerResponse:
+    if pipeline_id:
+        artifacts, req = _load_pipeline_stage(pipeline_id, "finalization", None, req)
+        if req is None:
+            return None
+        # same shape as the result of the chord of (transcode, transcribe)
+        dict_tuple = [artifacts]
     log.info("finalization stage: %s, %s", dict_tuple, req)
     task_id = finalization_stage.request.id
     log.debug(finalization_stage.request)
-    return process.finalization_stage(dict_tuple, req=req, task_id=task_id)
+    try:
+        result = _process().finalization_stage(
+            dict_tuple,
+            req=req,
+            task_id=task_id,
+            cancel_token=CancellationToken(task_id),
+        )
+    except Exception:
+        _fail_pipeline_stage(pipeline_id, "finalization")
+        raise
+    return _complete_pipeline_stage(pipeline_id, "finalization", result)
 
 
 @celery.task()
@@ -196,35 +427,45 @@ def process_transfer_video(req: ProcessTransferRequest):
     log.info("process_transfer_video: %s", req)
     task_id = process_transfer_video.request.id
     log.debug(process_transfer_video.request)
-    return process.process_transfer_video(req, task_id)
+    return _process().process_transfer_video(req, task_id)
 
 
 @celery.task()
 def process_transfer_mentor(req: ProcessTransferMentor):
     task_id = process_transfer_mentor.request.id
     log.debug(process_transfer_mentor.request)
-    return process.process_transfer_mentor(req, task_id)
+    return _process().process_transfer_mentor(req, task_id)
 
 
-@celery.task()
+@celery.task(acks_late=True)
 def trim_existing_upload(req: TrimExistingUploadRequest):
     log.info("trim_existing_upload stage: %s", req)
     task_id = trim_existing_upload.request.id
     log.debug(trim_existing_upload.request)
-    return process.trim_existing_upload(req, task_id)
+    try:
+        return _process().trim_existing_upload(
+            req,
+            task_id,
+            on_progress=_publish_progress(trim_existing_upload),
+            cancel_token=CancellationToken(task_id),
+        )
+    except WorkDirQuotaExceededError as x:
+        raise _defer_when_disk_full(trim_existing_upload, x, req)
 
 
 @celery.task()
 def regen_vtt(req: RegenVTTRequest):
     log.info(req)
-    return process.regen_vtt(req)
+    return _process().regen_vtt(req)
 
 
 @celery.task()
 def cancel_task(req: CancelTaskRequest) -> CancelTaskResponse:
     log.info("cancel_task: %s", req)
-    t = process.cancel_task(req)
-    celery.control.revoke(req.get("task_id"), terminate=True)
+    t = _process().cancel_task(req)
+    # no terminate: a running stage stops itself (and its ffmpeg children) once
+    # it sees the cancel request, killing the pool process would orphan them
+    celery.control.revoke(req.get("task_id"))
     return t
 
 
@@ -0,0 +1,73 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""Celery hooks of the tracing in mentor_upload_process.tracing"""
+from typing import Dict
+
+from mentor_upload_process.tracing import (
+    TRACEPARENT_HEADER,
+    inject_headers,
+    parse_traceparent,
+    set_default_service_name,
+    span,
+)
+
+set_default_service_name("mentor-upload-worker")
+
+
+def _before_task_publish(headers=None, **kwargs):
+    inject_headers(headers)
+
+
+_task_spans: Dict[str, object] = {}
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    cm = span(
+        f"celery.task {task.name}",
+        parent=parse_traceparent(getattr(task.request, TRACEPARENT_HEADER, "")),
+        kind="consumer",
+        **{"celery.task_id": task_id, "celery.queue": _task_queue(task)},
+    )
+    cm.__enter__()
+    _task_spans[task_id] = cm
+
+
+def _task_postrun(task_id=None, state=None, **kwargs):
+    cm = _task_spans.pop(task_id, None)
+    if cm is None:
+        return
+    cm.__exit__(None, None, None)
+
+
+def _task_failure(task_id=None, exception=None, **kwargs):
+    cm = _task_spans.pop(task_id, None)
+    if cm is None:
+        return
+    cm.__exit__(type(exception), exception, getattr(exception, "__traceback__", None))
+
+
+def _task_queue(task) -> str:
+    delivery_info = getattr(task.request, "delivery_info", None) or {}
+    return delivery_info.get("routing_key") or ""
+
+
+def install_celery_tracing() -> None:
+    """
+    Continues the trace started by the api for every task the worker runs
+    and propagates it to any task published from inside (e.g. chord callbacks)
+    """
+    from celery.signals import (
+        before_task_publish,
+        task_failure,
+        task_postrun,
+        task_prerun,
+    )
+
+    before_task_publish.connect(_before_task_publish, weak=False)
+    task_prerun.connect(_task_prerun, weak=False)
+    task_failure.connect(_task_failure, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
@@ -0,0 +1,103 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Starts a celery worker for one of the worker profiles, e.g.
+
+    python -m mentor_upload_tasks.worker --profile cpu
+"""
+import argparse
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from mentor_upload_tasks.tasks import (
+    celery,
+    get_queue_cancel_task,
+    get_queue_finalization_stage,
+    get_queue_transcode_stage,
+    get_queue_transcribe_stage,
+    get_queue_trim_upload_stage,
+)
+
+
+def get_worker_profile() -> str:
+    return os.environ.get("WORKER_PROFILE") or "all"
+
+
+def get_cpu_worker_concurrency() -> int:
+    return int(os.environ.get("CPU_WORKER_CONCURRENCY") or str(os.cpu_count() or 1))
+
+
+def get_io_worker_concurrency() -> int:
+    return int(os.environ.get("IO_WORKER_CONCURRENCY") or "32")
+
+
+@dataclass
+class WorkerProfile:
+    queues: Callable[[], List[str]]
+    pool: str = ""
+    concurrency: Optional[Callable[[], int]] = None
+    prefetch_multiplier: int = 0
+
+
+WORKER_PROFILES = {
+    # ffmpeg bound: one process per core, and never reserve a transcode
+    # another idle worker could start (trim/transcode tasks are acks_late)
+    "cpu": WorkerProfile(
+        queues=lambda: [get_queue_trim_upload_stage(), get_queue_transcode_stage()],
+        pool="prefork",
+        concurrency=get_cpu_worker_concurrency,
+        prefetch_multiplier=1,
+    ),
+    # mostly waiting on aws transcribe, s3 and graphql
+    # (transfers are routed to the finalization queue)
+    "io": WorkerProfile(
+        queues=lambda: [
+            get_queue_transcribe_stage(),
+            get_queue_finalization_stage(),
+            get_queue_cancel_task(),
+        ],
+        pool="threads",
+        concurrency=get_io_worker_concurrency,
+        prefetch_multiplier=4,
+    ),
+    # everything in one worker with celery defaults, as before the split
+    "all": WorkerProfile(queues=lambda: []),
+}
+
+
+def worker_argv(profile_name: str, loglevel: str = "INFO") -> List[str]:
+    if profile_name not in WORKER_PROFILES:
+        raise ValueError(
+            f"unknown worker profile '{profile_name}', expected one of {list(WORKER_PROFILES)}"
+        )
+    profile = WORKER_PROFILES[profile_name]
+    argv = ["worker", f"--loglevel={loglevel}"]
+    queues = profile.queues()
+    if queues:
+        argv.append(f"--queues={','.join(queues)}")
+    if profile.pool:
+        argv.append(f"--pool={profile.pool}")
+    if profile.concurrency:
+        argv.append(f"--concurrency={profile.concurrency()}")
+    if profile.prefetch_multiplier:
+        argv.append(f"--prefetch-multiplier={profile.prefetch_multiplier}")
+    return argv
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="run a mentor upload worker")
+    parser.add_argument(
+        "--profile", choices=list(WORKER_PROFILES), default=get_worker_profile()
+    )
+    parser.add_argument("--loglevel", default="INFO")
+    parsed = parser.parse_args(args)
+    celery.worker_main(worker_argv(parsed.profile, parsed.loglevel))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import multiprocessing
+import threading
+import time
+from unittest.mock import patch
+
+import ffmpy
+import pytest
+
+from mentor_upload_process.cancellation import (
+    CancellationToken,
+    TaskCancelledError,
+    is_cancel_requested,
+    request_cancel,
+    s3_transfer_callback,
+)
+from mentor_upload_process.media_tools import run_ffmpeg
+
+
+@pytest.fixture(autouse=True)
+def memory_cancel_store(monkeypatch):
+    monkeypatch.setenv("CANCEL_STORE_URL", f"memory://{time.time_ns()}")
+
+
+def test_it_sees_cancel_requested_for_its_task_only():
+    token = CancellationToken("task-1", poll_interval_secs=0)
+    other = CancellationToken("task-2", poll_interval_secs=0)
+    assert not token.is_cancelled()
+    request_cancel("task-1")
+    assert token.is_cancelled()
+    assert not other.is_cancelled()
+    with pytest.raises(TaskCancelledError):
+        token.raise_if_cancelled()
+
+
+def test_it_throttles_cancel_lookups():
+    token = CancellationToken("task-1", poll_interval_secs=3600)
+    assert not token.is_cancelled()
+    request_cancel("task-1")
+    assert not token.is_cancelled()
+
+
+def test_s3_callback_aborts_transfer_once_cancelled():
+    assert s3_transfer_callback(None) is None
+    callback = s3_transfer_callback(CancellationToken("task-1", poll_interval_secs=0))
+    callback(1024)
+    request_cancel("task-1")
+    with pytest.raises(TaskCancelledError):
+        callback(1024)
+
+
+class _SleepFFmpeg(ffmpy.FFmpeg):
+    """The real ffmpy.FFmpeg, running a long sleep in place of ffmpeg"""
+
+    def __init__(self, global_options=None, inputs=None, outputs=None):
+        super().__init__(executable="sleep", global_options="30")
+
+
+@patch("ffmpy.FFmpeg", _SleepFFmpeg)
+def test_it_kills_ffmpeg_process_group_on_cancel():
+    token = CancellationToken("task-1", poll_interval_secs=0.1)
+    threading.Timer(0.3, request_cancel, args=["task-1"]).start()
+    started = time.monotonic()
+    with pytest.raises(TaskCancelledError):
+        run_ffmpeg(
+            inputs={"in.mp4": None}, outputs={"out.mp4": None}, cancel_token=token
+        )
+    assert time.monotonic() - started < 10
+
+
+@patch("ffmpy.FFmpeg")
+def test_it_does_not_start_ffmpeg_when_already_cancelled(mock_ffmpeg_cls):
+    request_cancel("task-1")
+    with pytest.raises(TaskCancelledError):
+        run_ffmpeg(
+            inputs={"in.mp4": None},
+            outputs={"out.mp4": None},
+            cancel_token=CancellationToken("task-1"),
+        )
+    mock_ffmpeg_cls.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "executable,expected_error",
+    [("true", None), ("false", ffmpy.FFRuntimeError)],
+)
+def test_it_runs_ffmpeg_to_completion_when_not_cancelled(executable, expected_error):
+    class _FFmpeg(ffmpy.FFmpeg):
+        def __init__(self, global_options=None, inputs=None, outputs=None):
+            super().__init__(executable=executable)
+
+    with patch("ffmpy.FFmpeg", _FFmpeg), (
+        pytest.raises(expected_error) if expected_error else nullcontext()
+    ):
+        run_ffmpeg(
+            inputs={"in.mp4": None},
+            outputs={"out.mp4": None},
+            cancel_token=CancellationToken("task-1"),
+        )
+
+
+def _wait_for_cancel(task_id: str, store_url: str) -> bool:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if is_cancel_requested(task_id, store_url):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_file_store_is_shared_with_spawned_processes(tmpdir):
+    store_url = f"file://{tmpdir.join('cancel')}"
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as p:
+        cancelled = p.submit(_wait_for_cancel, "task-1", store_url)
+        request_cancel("task-1", store_url)
+        assert cancelled.result(timeout=30)
+    assert not is_cancel_requested("task-2", store_url)
+
+
+def test_file_store_keeps_task_ids_out_of_paths(tmpdir):
+    store_url = f"file://{tmpdir.join('cancel')}"
+    request_cancel("../../escaped", store_url)
+    assert is_cancel_requested("../../escaped", store_url)
+    assert tmpdir.listdir() == [tmpdir.join("cancel")]
+
+
+def test_file_store_removes_expired_markers(tmpdir, monkeypatch):
+    store_url = f"file://{tmpdir}"
+    monkeypatch.setenv("CANCEL_TTL_SECS", "0")
+    request_cancel("task-1", store_url)
+    assert not is_cancel_requested("task-1", store_url)
+    monkeypatch.delenv("CANCEL_TTL_SECS")
+    request_cancel("task-2", store_url)
+    assert is_cancel_requested("task-2", store_url)
+    assert len(tmpdir.listdir()) == 1
@@ -0,0 +1,63 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+import os
+import time
+
+import pytest
+
+from mentor_upload_process.early_media import delete_early_media, wait_for_early_media
+
+
+@pytest.fixture
+def uploads(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOADS", str(tmpdir))
+    monkeypatch.setenv("PROGRESSIVE_INGEST_WAIT_SECS", "0.05")
+    return tmpdir
+
+
+def _write_early_media(uploads, ok: bool, files=("mobile.mp4", "web.mp4", "audio.mp3")):
+    media_dir = uploads.mkdir(".early").mkdir("abc")
+    for f in files:
+        media_dir.join(f).write("x")
+    media_dir.join("done.json").write(json.dumps({"ok": ok}))
+    return media_dir
+
+
+def test_returns_early_media_dir_once_done(uploads):
+    media_dir = _write_early_media(uploads, ok=True)
+    assert str(wait_for_early_media(".early/abc", poll_secs=0.01)) == str(media_dir)
+    delete_early_media(".early/abc")
+    assert not media_dir.exists()
+
+
+@pytest.mark.parametrize(
+    "ok,files",
+    [(False, ("mobile.mp4", "web.mp4", "audio.mp3")), (True, ("mobile.mp4",))],
+)
+def test_falls_back_when_ingest_failed_or_is_incomplete(uploads, ok, files):
+    _write_early_media(uploads, ok=ok, files=files)
+    assert wait_for_early_media(".early/abc", poll_secs=0.01) is None
+
+
+def test_falls_back_when_ingest_never_finishes(uploads):
+    uploads.mkdir(".early").mkdir("abc")
+    assert wait_for_early_media(".early/abc", poll_secs=0.01) is None
+    assert wait_for_early_media("", poll_secs=0.01) is None
+
+
+def test_falls_back_as_soon_as_the_ingest_stops_beating(uploads, monkeypatch):
+    monkeypatch.setenv("PROGRESSIVE_INGEST_WAIT_SECS", "600")
+    monkeypatch.setenv("PROGRESSIVE_INGEST_STALE_SECS", "30")
+    media_dir = uploads.mkdir(".early").mkdir("abc")
+    heartbeat = media_dir.join("heartbeat.json")
+    heartbeat.write("{}")
+    stale = time.time() - 60
+    os.utime(str(heartbeat), (stale, stale))
+    started = time.monotonic()
+    assert wait_for_early_media(".early/abc", poll_secs=0.01) is None
+    assert time.monotonic() - started < 5
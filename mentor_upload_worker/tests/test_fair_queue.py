@@ -0,0 +1,68 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from mentor_upload_process import fair_queue
+from mentor_upload_process.fair_queue import (
+    add_pending_job,
+    count_pending_jobs,
+    release_transcode_slot,
+    try_acquire_transcode_slot,
+)
+
+
+@pytest.fixture(autouse=True)
+def memory_fair_queue(monkeypatch):
+    monkeypatch.setenv("FAIR_QUEUE_ENABLED", "true")
+    monkeypatch.setenv("FAIR_QUEUE_STORE_URL", "memory://")
+    monkeypatch.setenv("MENTOR_MAX_INFLIGHT_TRANSCODES", "2")
+    monkeypatch.setattr(fair_queue, "_store", None)
+
+
+def test_it_limits_inflight_transcodes_per_mentor():
+    assert try_acquire_transcode_slot("m1", "a")
+    assert try_acquire_transcode_slot("m1", "b")
+    assert not try_acquire_transcode_slot("m1", "c")
+    # other mentors are not affected by m1's backlog
+    assert try_acquire_transcode_slot("m2", "x")
+
+
+def test_it_reacquires_slot_already_held_by_job():
+    assert try_acquire_transcode_slot("m1", "a")
+    assert try_acquire_transcode_slot("m1", "b")
+    assert try_acquire_transcode_slot("m1", "a")
+
+
+def test_release_frees_slot_and_pending_job():
+    add_pending_job("m1", "a")
+    add_pending_job("m1", "b")
+    assert count_pending_jobs("m1") == 2
+    assert try_acquire_transcode_slot("m1", "a")
+    assert try_acquire_transcode_slot("m1", "b")
+    release_transcode_slot("m1", "a")
+    assert count_pending_jobs("m1") == 1
+    assert try_acquire_transcode_slot("m1", "c")
+
+
+def test_slots_of_crashed_jobs_expire(monkeypatch):
+    monkeypatch.setenv("FAIR_QUEUE_SLOT_TTL_SECS", "10")
+    assert try_acquire_transcode_slot("m1", "a")
+    assert try_acquire_transcode_slot("m1", "b")
+    now = time.time()
+    monkeypatch.setattr(fair_queue, "time", SimpleNamespace(time=lambda: now + 11))
+    assert try_acquire_transcode_slot("m1", "c")
+
+
+def test_it_does_not_limit_when_disabled(monkeypatch):
+    monkeypatch.delenv("FAIR_QUEUE_ENABLED")
+    for job in ["a", "b", "c"]:
+        assert try_acquire_transcode_slot("m1", job)
+    add_pending_job("m1", "a")
+    assert count_pending_jobs("m1") == 0
@@ -0,0 +1,117 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_process.media_tools import (
+    FFmpegProgress,
+    FFmpegProgressParser,
+    run_ffmpeg,
+)
+from mentor_upload_process.progress import ThrottledProgress
+
+PROGRESS_BLOCKS = [
+    "frame=30\nout_time_us=2000000\nout_time_ms=2000000\nspeed=2.00x\nprogress=continue\n",
+    "frame=60\nout_time_us=5000000\nout_time_ms=5000000\nspeed=2.5x\nprogress=continue\n",
+    "frame=80\nout_time_us=N/A\nspeed=N/A\nprogress=end\n",
+]
+
+
+def _feed_all(parser: FFmpegProgressParser, text: str):
+    return [p for p in (parser.feed(line) for line in text.splitlines()) if p]
+
+
+def test_it_parses_percent_speed_and_eta_from_progress_blocks():
+    parser = FFmpegProgressParser(duration_secs=10.0)
+    updates = _feed_all(parser, "".join(PROGRESS_BLOCKS))
+    assert updates == [
+        FFmpegProgress(
+            out_time_secs=2.0, speed=2.0, percent=20.0, eta_secs=4.0, done=False
+        ),
+        FFmpegProgress(
+            out_time_secs=5.0, speed=2.5, percent=50.0, eta_secs=2.0, done=False
+        ),
+        FFmpegProgress(
+            out_time_secs=0.0, speed=0.0, percent=100.0, eta_secs=0.0, done=True
+        ),
+    ]
+
+
+def test_it_reports_unknown_percent_without_duration():
+    updates = _feed_all(FFmpegProgressParser(), PROGRESS_BLOCKS[0])
+    assert updates[0].percent == -1.0
+    assert updates[0].eta_secs == -1.0
+
+
+@patch("ffmpy.FFmpeg")
+def test_it_runs_ffmpeg_without_progress_args_when_no_callback(mock_ffmpeg_cls):
+    run_ffmpeg(inputs={"in.mp4": None}, outputs={"out.mp4": ("-y",)})
+    mock_ffmpeg_cls.assert_called_once_with(
+        inputs={"in.mp4": None}, outputs={"out.mp4": ("-y",)}
+    )
+    mock_ffmpeg_cls.return_value.run.assert_called_once_with()
+
+
+@patch("ffmpy.FFmpeg")
+def test_it_feeds_ffmpeg_progress_file_to_callback(mock_ffmpeg_cls):
+    def mock_ffmpeg_constructor(global_options=None, inputs=None, outputs=None):
+        progress_file = global_options[global_options.index("-progress") + 1]
+
+        def run():
+            with open(progress_file, "a") as f:
+                for block in PROGRESS_BLOCKS:
+                    f.write(block)
+                    f.flush()
+
+        inst = Mock()
+        inst.run.side_effect = run
+        return inst
+
+    mock_ffmpeg_cls.side_effect = mock_ffmpeg_constructor
+    updates = []
+    run_ffmpeg(
+        inputs={"in.mp4": None},
+        outputs={"out.mp4": ("-y",)},
+        on_progress=updates.append,
+        duration_secs=10.0,
+    )
+    assert [u.percent for u in updates] == [20.0, 50.0, 100.0]
+
+
+@pytest.mark.parametrize(
+    "interval_secs,expected_percents",
+    [
+        (0, [10.0, 25.0, 50.0, 60.0, 75.0, 100.0]),
+        # throttled: only the first update and the final one get through
+        (3600, [10.0, 100.0]),
+    ],
+)
+def test_it_combines_and_throttles_step_progress(interval_secs, expected_percents):
+    published = []
+    progress = ThrottledProgress(
+        published.append, ["mobile", "web"], interval_secs=interval_secs
+    )
+    for step in ["mobile", "web"]:
+        on_progress = progress.step(step)
+        for percent in [20.0, 50.0]:
+            on_progress(
+                FFmpegProgress(
+                    out_time_secs=0, speed=1.0, percent=percent, eta_secs=1, done=False
+                )
+            )
+        on_progress(
+            FFmpegProgress(
+                out_time_secs=0, speed=1.0, percent=100.0, eta_secs=0, done=True
+            )
+        )
+    assert [p["percent"] for p in published] == expected_percents
+    assert published[-1]["step"] == "web"
+
+
+def test_it_does_not_create_callbacks_when_not_publishing():
+    assert ThrottledProgress(None, ["trim"]).step("trim") is None
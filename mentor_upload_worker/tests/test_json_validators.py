@@ -0,0 +1,66 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import time
+from unittest.mock import patch
+
+import jsonschema
+
+from mentor_upload_process.api import import_mentor_gql_response_schema
+from mentor_upload_process.helpers import validate_json
+from mentor_upload_process.json_validation import get_json_validator
+
+IMPORT_RESPONSE = {
+    "data": {
+        "api": {
+            "mentorImport": {
+                "answers": [
+                    {
+                        "hasUntransferredMedia": True,
+                        "question": {"_id": f"q{i}"},
+                        "webMedia": {"type": "video", "tag": "web", "url": "w.mp4"},
+                        "mobileMedia": None,
+                        "vttMedia": None,
+                    }
+                    for i in range(3)
+                ]
+            }
+        }
+    }
+}
+
+
+def test_validator_is_compiled_once_per_schema():
+    validator = get_json_validator(import_mentor_gql_response_schema)
+    assert get_json_validator(import_mentor_gql_response_schema) is validator
+
+
+def _validate_uncached(instance, schema) -> list:
+    # what jsonschema.validate does on every call
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return list(cls(schema).iter_errors(instance))
+
+
+def _time_validations(validate, n: int = 50) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        validate()
+    return time.perf_counter() - start
+
+
+def test_benchmark_import_mentor_response_schema(record_property):
+    validator = get_json_validator(import_mentor_gql_response_schema)
+    uncached = _time_validations(
+        lambda: _validate_uncached(IMPORT_RESPONSE, import_mentor_gql_response_schema)
+    )
+    cached = _time_validations(lambda: list(validator.iter_errors(IMPORT_RESPONSE)))
+    # recorded, not asserted: wall clock ratios are too noisy on shared runners
+    record_property("uncached_secs", uncached)
+    record_property("cached_secs", cached)
+    with patch.object(type(validator), "check_schema") as check_schema:
+        validate_json(IMPORT_RESPONSE, import_mentor_gql_response_schema)
+        check_schema.assert_not_called()
@@ -0,0 +1,148 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+from unittest.mock import Mock, call, patch
+
+import pytest
+
+from mentor_upload_process import pipeline
+
+SPEC = {
+    "trim_upload": {"deps": []},
+    "transcode": {"deps": ["trim_upload"]},
+    "transcribe": {"deps": ["trim_upload"]},
+    "finalization": {"deps": ["transcode", "transcribe"]},
+}
+REQ = {"mentor": "m1", "question": "q1", "video_path": "v.mp4"}
+
+
+@pytest.fixture(autouse=True)
+def memory_pipeline_store(monkeypatch):
+    monkeypatch.setenv("PIPELINE_STORE_URL", "memory://")
+    monkeypatch.setattr(pipeline, "_store", None)
+
+
+@pytest.fixture
+def pipeline_id() -> str:
+    # what the api stores when it starts an upload pipeline
+    spec = {
+        name: {
+            "task": f"mentor_upload_tasks.tasks.{name}_stage",
+            "task_id": f"{name}-task-id",
+            "queue": name,
+            "priority": 1,
+            **s,
+        }
+        for name, s in SPEC.items()
+    }
+    fields = {"spec": json.dumps(spec), "req": json.dumps(REQ)}
+    fields.update({f"waiting:{n}": str(len(s["deps"])) for n, s in SPEC.items()})
+    pipeline._get_store().create("p1", fields, 60)
+    return "p1"
+
+
+def _sent(name: str):
+    return call(
+        f"mentor_upload_tasks.tasks.{name}_stage",
+        kwargs={"pipeline_id": "p1"},
+        task_id=f"{name}-task-id",
+        queue=name,
+        priority=1,
+    )
+
+
+def test_it_sends_stages_once_all_their_dependencies_completed(pipeline_id):
+    send_task = Mock()
+    trim = {"video_file": "/w/video.mp4", "work_dir": "/w"}
+    assert pipeline.complete_stage(pipeline_id, "trim_upload", trim, send_task) == [
+        "transcode",
+        "transcribe",
+    ]
+    assert send_task.call_args_list == [_sent("transcode"), _sent("transcribe")]
+    assert pipeline.load_stage(pipeline_id, "transcode") == (REQ, [trim])
+    send_task.reset_mock()
+    pipeline.complete_stage(pipeline_id, "transcode", {"media": []}, send_task)
+    send_task.assert_not_called()
+    pipeline.complete_stage(pipeline_id, "transcribe", {"transcript": "t"}, send_task)
+    assert send_task.call_args_list == [_sent("finalization")]
+    assert pipeline.load_stage(pipeline_id, "finalization") == (
+        REQ,
+        [{"media": []}, {"transcript": "t"}],
+    )
+
+
+def test_redelivered_stage_does_not_send_dependents_again(pipeline_id):
+    send_task = Mock()
+    pipeline.complete_stage(pipeline_id, "trim_upload", {"work_dir": "/w"}, send_task)
+    pipeline.complete_stage(pipeline_id, "trim_upload", {"work_dir": "/w"}, send_task)
+    assert send_task.call_count == 2
+
+
+def test_last_stage_deletes_pipeline(pipeline_id):
+    send_task = Mock()
+    for stage in ["trim_upload", "transcode", "transcribe", "finalization"]:
+        pipeline.complete_stage(pipeline_id, stage, {}, send_task)
+    with pytest.raises(pipeline.PipelineNotFoundError):
+        pipeline.load_stage(pipeline_id, "finalization")
+
+
+@patch.object(pipeline, "upload_task_status_update")
+def test_failed_stage_marks_stages_depending_on_it_failed(
+    mock_status_update, pipeline_id
+):
+    send_task = Mock()
+    pipeline.complete_stage(pipeline_id, "trim_upload", {}, send_task)
+    send_task.reset_mock()
+    # stages return None when they failed
+    pipeline.complete_stage(pipeline_id, "transcode", None, send_task)
+    send_task.assert_not_called()
+    assert [c.args[0].task_id for c in mock_status_update.call_args_list] == [
+        "finalization-task-id"
+    ]
+    with pytest.raises(pipeline.PipelineNotFoundError):
+        pipeline.load_stage(pipeline_id, "transcribe")
+
+
+@patch.object(pipeline, "upload_task_status_update")
+def test_sibling_of_a_failed_stage_ends_quietly(mock_status_update, pipeline_id):
+    from mentor_upload_tasks import tasks
+
+    send_task = Mock()
+    pipeline.complete_stage(pipeline_id, "trim_upload", {}, send_task)
+    pipeline.complete_stage(pipeline_id, "transcode", None, send_task)
+    # transcribe had not started yet
+    assert tasks._load_pipeline_stage(pipeline_id, "transcribe", None, None) == (
+        None,
+        None,
+    )
+    # transcribe was already done when transcode failed
+    result = {"transcript": "t", "subtitles": ""}
+    assert tasks._complete_pipeline_stage(pipeline_id, "transcribe", result) == result
+
+
+@patch.object(pipeline, "upload_task_status_update")
+def test_stage_out_of_disk_retries_fails_its_task_and_pipeline(
+    mock_pipeline_status_update, pipeline_id
+):
+    from mentor_upload_tasks import tasks
+    from mentor_upload_process.work_dirs import WorkDirQuotaExceededError
+
+    x = WorkDirQuotaExceededError("work dir quota exceeded")
+    task = Mock()
+    task.request.id = "trim_upload-task-id"
+    # what celery does once max_retries is exceeded
+    task.retry.side_effect = x
+    with patch.object(tasks, "upload_task_status_update") as mock_status_update:
+        with pytest.raises(WorkDirQuotaExceededError):
+            tasks._defer_when_disk_full(task, x, REQ, pipeline_id, "trim_upload")
+    assert mock_status_update.call_args.args[0].task_id == "trim_upload-task-id"
+    assert mock_status_update.call_args.args[0].new_status == "FAILED"
+    assert [c.args[0].task_id for c in mock_pipeline_status_update.call_args_list] == [
+        "transcode-task-id",
+        "transcribe-task-id",
+        "finalization-task-id",
+    ]
@@ -536,7 +536,7 @@ class _TestFinalizationExample:
 @responses.activate
 @patch("mentor_upload_process.process._delete_video_work_dir")
 @patch("mentor_upload_process.process.get_video_and_vtt_file_paths")
-@patch("boto3.client")
+@patch("mentor_upload_process.process._boto3_session")
 @pytest.mark.parametrize(
     "ex",
     [
@@ -580,7 +580,7 @@ class _TestFinalizationExample:
     ],
 )
 def test_finalization_stage(
-    mock_boto3_client: Mock,
+    mock_boto3_session: Mock,
     mock_get_video_and_vtt_file: Mock,
     mock_delete_work_dir: Mock,
     monkeypatch,
@@ -593,7 +593,7 @@ def test_finalization_stage(
         monkeypatch,
         tmpdir,
     ):
-        mock_s3 = mock_s3_client(mock_boto3_client)
+        mock_s3 = mock_s3_client(mock_boto3_session)
         # Since transcoding step did not run in this given context, we need to manually create the file that it would have created for finalization
         vtt_file = tmpdir / "subtitles.vtt"
         makedirs(path.dirname(vtt_file), exist_ok=True)
@@ -696,7 +696,7 @@ class _TestTrimExistingVideo:
 @patch("mentor_upload_process.process.fetch_text_from_url")
 @patch("mentor_upload_process.process.fetch_answer_transcript_and_media")
 @patch("ffmpy.FFmpeg")
-@patch("boto3.client")
+@patch("mentor_upload_process.process._boto3_session")
 @pytest.mark.parametrize(
     "ex",
     [
@@ -715,7 +715,7 @@ class _TestTrimExistingVideo:
     ],
 )
 def test_trim_existing_video(
-    mock_boto3_client: Mock,
+    mock_boto3_session: Mock,
     mock_ffmpeg_cls: Mock,
     mock_fetch_answer_transcript_and_media: Mock,
     mock_fetch_text_from_url: Mock,
@@ -725,7 +725,7 @@ def test_trim_existing_video(
     ex: _TestTrimExistingVideo,
 ):
     with _test_env(ex.video_name, ex.timestamp, monkeypatch, tmpdir) as work_dir:
-        mock_s3 = mock_s3_client(mock_boto3_client)
+        mock_s3 = mock_s3_client(mock_boto3_session)
         req = {
             "mentor": ex.mentor,
             "question": ex.question,
@@ -823,7 +823,7 @@ class _TestTranscodeStageExample:
 
 @responses.activate
 @patch("ffmpy.FFmpeg")
-@patch("boto3.client")
+@patch("mentor_upload_process.process._boto3_session")
 @pytest.mark.parametrize(
     "ex",
     [
@@ -840,7 +840,7 @@ class _TestTranscodeStageExample:
     ],
 )
 def test_transcode_stage(
-    mock_boto3_client: Mock,
+    mock_boto3_session: Mock,
     mock_ffmpeg_cls: Mock,
     monkeypatch,
     tmpdir,
@@ -868,7 +868,7 @@ def test_transcode_stage(
         }
 
         _mock_ffmpeg(mock_ffmpeg_cls)
-        mock_s3 = mock_s3_client(mock_boto3_client)
+        mock_s3 = mock_s3_client(mock_boto3_session)
         from mentor_upload_process.process import transcode_stage
 
         expected_gql = [
@@ -915,6 +915,32 @@ def test_transcode_stage(
         mock_s3.upload_file.assert_has_calls(expected_upload_file_calls)
 
 
+@patch("mentor_upload_process.process.upload_task_status_update")
+@patch("mentor_upload_process.process.video_encode_for_web")
+@patch("mentor_upload_process.process.video_encode_for_mobile")
+def test_failed_transcode_keeps_the_work_dir_transcribe_is_using(
+    mock_encode_for_mobile: Mock,
+    mock_encode_for_web: Mock,
+    mock_task_status_update: Mock,
+    tmpdir,
+):
+    from mentor_upload_process.process import transcode_stage
+
+    work_dir = tmpdir.mkdir("work")
+    video_file = work_dir.join("video.mp4")
+    video_file.write("video")
+    work_dir.join("mobile.mp4").write("mobile")
+    mock_encode_for_web.side_effect = Exception("ffmpeg failed")
+    transcode_stage(
+        [{"video_file": str(video_file), "work_dir": str(work_dir)}],
+        {"mentor": "m1", "question": "q1", "video_path": "video.mp4"},
+        "t1",
+    )
+    assert video_file.exists()
+    assert not work_dir.join("mobile.mp4").exists()
+    assert mock_task_status_update.call_args.args[0].new_status == "FAILED"
+
+
 @responses.activate
 def test_raises_if_video_path_not_specified():
     req = {"mentor": "m1", "question": "q1"}
@@ -971,7 +997,9 @@ def test_raises_if_video_path_not_specified():
 
 
 @responses.activate
-def test_raises_if_video_not_found_for_path():
+def test_raises_if_video_not_found_for_path(monkeypatch, tmpdir):
+    # failed stages leave the (relative) work dir to finalization
+    monkeypatch.chdir(tmpdir)
     req = {"mentor": "m1", "question": "q1", "video_path": "not_exists.mp4"}
     caught_exception = None
     expected_gql = [
@@ -1045,7 +1073,7 @@ class _TestRegenVTT:
 @patch("mentor_upload_process.media_tools.find_duration")
 @patch("mentor_upload_process.process.fetch_answer_transcript_and_media")
 @patch("ffmpy.FFmpeg")
-@patch("boto3.client")
+@patch("mentor_upload_process.process._boto3_session")
 @pytest.mark.parametrize(
     "ex",
     [
@@ -1064,7 +1092,7 @@ class _TestRegenVTT:
     ],
 )
 def test_regen_vtt(
-    mock_boto3_client: Mock,
+    mock_boto3_session: Mock,
     mock_ffmpeg_cls: Mock,
     mock_fetch_answer_transcript_and_media: Mock,
     mock_find_duration: Mock,
@@ -1073,7 +1101,7 @@ def test_regen_vtt(
     ex: _TestTrimExistingVideo,
 ):
     with _test_env(ex.video_name, ex.timestamp, monkeypatch, tmpdir) as work_dir:
-        mock_s3 = mock_s3_client(mock_boto3_client)
+        mock_s3 = mock_s3_client(mock_boto3_session)
         req = {
             "mentor": ex.mentor,
             "question": ex.question,
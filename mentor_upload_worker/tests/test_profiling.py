@@ -0,0 +1,86 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import os
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_process import profiling
+from mentor_upload_tasks import profiling as task_profiling
+
+
+@pytest.fixture(autouse=True)
+def profiling_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILING_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILING_MIN_INTERVAL_SECS", "3600")
+    monkeypatch.setattr(profiling, "_last_profile_started", 0.0)
+    monkeypatch.setattr(profiling, "_active", False)
+
+
+def _profiled(key: str, forced: bool = False) -> bool:
+    with profiling.profile(key, forced=forced) as profiled:
+        sum(i * i for i in range(1000))
+    return profiled
+
+
+def test_it_does_not_profile_unless_enabled_or_forced(monkeypatch, tmp_path):
+    monkeypatch.delenv("PROFILING_ENABLED", raising=False)
+    assert not _profiled("task-1")
+    assert os.listdir(tmp_path) == []
+
+
+def test_it_writes_cprofile_and_tracemalloc_files_keyed_by_task(tmp_path):
+    assert _profiled("transcode_stage-task/1", forced=True)
+    assert sorted(os.listdir(tmp_path)) == [
+        "transcode_stage-task_1.prof",
+        "transcode_stage-task_1.tracemalloc",
+    ]
+
+
+def test_it_rate_limits_profiles(monkeypatch):
+    monkeypatch.setenv("PROFILING_ENABLED", "true")
+    assert _profiled("task-1")
+    assert not _profiled("task-2")
+    assert not _profiled("task-3", forced=True)
+    monkeypatch.setenv("PROFILING_MIN_INTERVAL_SECS", "0")
+    assert _profiled("task-4")
+
+
+def test_it_samples_when_enabled_by_env(monkeypatch):
+    monkeypatch.setenv("PROFILING_ENABLED", "true")
+    monkeypatch.setenv("PROFILING_SAMPLE_RATE", "0")
+    assert not _profiled("task-1")
+    assert _profiled("task-2", forced=True)
+
+
+def _task(**headers):
+    return SimpleNamespace(
+        name="tasks.transcode_stage", request=SimpleNamespace(**headers)
+    )
+
+
+def test_stages_are_profiled_on_request_without_loading_the_pipeline(monkeypatch):
+    from mentor_upload_process import pipeline
+
+    monkeypatch.delenv("PROFILING_ENABLED", raising=False)
+    monkeypatch.setattr(pipeline, "_get_store", Mock(side_effect=AssertionError))
+    requested = _task(**{profiling.PROFILE_TASK_HEADER: True})
+    assert task_profiling._is_profile_requested(requested, [], {"pipeline_id": "p1"})
+    assert not task_profiling._is_profile_requested(_task(), [], {"pipeline_id": "p1"})
+    assert task_profiling._is_profile_requested(_task(), [{"profile": True}], {})
+    assert not task_profiling._is_profile_requested(_task(), [], {"req": {}})
+
+
+def test_the_profile_header_is_passed_on_to_the_next_stages():
+    headers: dict = {}
+    with patch("celery.current_task", _task()):
+        task_profiling._before_task_publish(headers=headers)
+    assert headers == {}
+    with patch("celery.current_task", _task(**{profiling.PROFILE_TASK_HEADER: True})):
+        task_profiling._before_task_publish(headers=headers)
+    assert headers == {profiling.PROFILE_TASK_HEADER: True}
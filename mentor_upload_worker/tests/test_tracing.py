@@ -0,0 +1,79 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from mentor_upload_process import tracing
+from mentor_upload_tasks import tracing as task_tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_SPAN_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture
+def export_file(monkeypatch, tmp_path):
+    export_file = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACING_ENABLED", "true")
+    monkeypatch.setenv("TRACE_EXPORT_FILE", str(export_file))
+    monkeypatch.setattr(tracing, "_exporter", None)
+    return export_file
+
+
+def _task(name: str = "mentor_upload_tasks.tasks.transcode_stage"):
+    return SimpleNamespace(
+        name=name,
+        request=SimpleNamespace(
+            traceparent=f"00-{TRACE_ID}-{PARENT_SPAN_ID}-01",
+            delivery_info={"routing_key": "transcode"},
+        ),
+    )
+
+
+def _exported(export_file):
+    return [json.loads(line) for line in export_file.read_text().splitlines()]
+
+
+def test_task_continues_the_trace_from_its_headers(export_file):
+    task_tracing._task_prerun(task_id="task-1", task=_task())
+    assert tracing.current_trace_id() == TRACE_ID
+    # tasks published from inside the task carry the task's span as parent
+    headers = tracing.inject_headers({})
+    task_span_id = headers["traceparent"].split("-")[2]
+    task_tracing._task_postrun(task_id="task-1", state="SUCCESS")
+    assert tracing.current_context() is None
+    spans = _exported(export_file)
+    assert len(spans) == 1
+    assert spans[0]["trace_id"] == TRACE_ID
+    assert spans[0]["parent_id"] == PARENT_SPAN_ID
+    assert spans[0]["span_id"] == task_span_id
+    assert spans[0]["kind"] == "consumer"
+    assert spans[0]["attributes"]["celery.queue"] == "transcode"
+    assert spans[0]["error"] == ""
+
+
+def test_task_failure_ends_the_span_with_the_error(export_file):
+    task_tracing._task_prerun(task_id="task-2", task=_task())
+    task_tracing._task_failure(task_id="task-2", exception=ValueError("bad video"))
+    # postrun still fires after a failure, the span must not end twice
+    task_tracing._task_postrun(task_id="task-2", state="FAILURE")
+    assert tracing.current_context() is None
+    spans = _exported(export_file)
+    assert len(spans) == 1
+    assert "bad video" in spans[0]["error"]
+
+
+def test_task_without_headers_starts_a_new_trace(export_file):
+    task = _task()
+    task.request = SimpleNamespace()
+    task_tracing._task_prerun(task_id="task-3", task=task)
+    trace_id = tracing.current_trace_id()
+    task_tracing._task_postrun(task_id="task-3", state="SUCCESS")
+    spans = _exported(export_file)
+    assert spans[0]["trace_id"] == trace_id != TRACE_ID
+    assert spans[0]["parent_id"] == ""
@@ -0,0 +1,35 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import hashlib
+from os import path
+
+from mentor_upload_process.process import upload_path
+
+FILE_NAME = "1111-aaaa-m1-q1.mp4"
+
+
+def test_upload_path_finds_uploads_migrated_to_shards(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOADS", str(tmpdir))
+    assert upload_path(FILE_NAME) == path.join(str(tmpdir), FILE_NAME)
+    shard = hashlib.sha256(b"m1").hexdigest()[:2]
+    tmpdir.mkdir(shard).join(FILE_NAME).write("x")
+    assert upload_path(FILE_NAME) == path.join(str(tmpdir), shard, FILE_NAME)
+    assert upload_path(f"{shard}/{FILE_NAME}") == path.join(
+        str(tmpdir), shard, FILE_NAME
+    )
+
+
+def test_each_thread_gets_its_own_boto3_session():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from mentor_upload_process import process
+
+    with ThreadPoolExecutor(4) as executor:
+        sessions = list(executor.map(lambda _: process._boto3_session(), range(4)))
+    session = process._boto3_session()
+    assert session is process._boto3_session()
+    assert all(s is not session for s in sessions)
@@ -0,0 +1,144 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from mentor_upload_process import work_dirs
+from mentor_upload_process.work_dirs import (
+    WorkDirQuotaExceededError,
+    claim_work_dir,
+    create_work_dir,
+    gc_orphans,
+    read_owner,
+)
+
+
+@pytest.fixture
+def work_dir_root(monkeypatch, tmp_path):
+    root = tmp_path / "work"
+    monkeypatch.setenv("TRANSCODE_WORK_DIR", str(root))
+    monkeypatch.setenv("WORK_DIR_TTL_SECS", "60")
+    monkeypatch.delenv("WORK_DIR_QUOTA_BYTES", raising=False)
+    return root
+
+
+def _age(p, secs: float) -> None:
+    t = time.time() - secs
+    os.utime(p, (t, t))
+
+
+def test_it_records_owner_task_of_work_dir(work_dir_root):
+    work_dir = create_work_dir("job1", "task-trim")
+    assert work_dir == work_dir_root / "job1"
+    assert read_owner(work_dir)["task_id"] == "task-trim"
+    claim_work_dir(work_dir, "task-transcode")
+    assert read_owner(work_dir)["task_id"] == "task-transcode"
+
+
+def test_it_collects_only_work_dirs_idle_longer_than_ttl(work_dir_root):
+    idle = create_work_dir("idle", "task-1")
+    active = create_work_dir("active", "task-2")
+    no_owner = work_dir_root / "no-owner"
+    no_owner.mkdir()
+    _age(idle / work_dirs.OWNER_FILE, 120)
+    _age(no_owner, 120)
+    assert sorted(gc_orphans()) == sorted([idle, no_owner])
+    assert active.is_dir()
+    assert not idle.exists()
+
+
+def test_claim_resets_ttl(work_dir_root):
+    work_dir = create_work_dir("job1", "task-1")
+    _age(work_dir / work_dirs.OWNER_FILE, 120)
+    claim_work_dir(work_dir, "task-2")
+    assert gc_orphans() == []
+
+
+def test_it_refuses_work_dirs_over_quota_after_gc(work_dir_root, monkeypatch):
+    monkeypatch.setenv("WORK_DIR_QUOTA_BYTES", "1000")
+    busy = create_work_dir("busy", "task-1")
+    (busy / "video.mp4").write_bytes(b"0" * 800)
+    with pytest.raises(WorkDirQuotaExceededError):
+        create_work_dir("job2", "task-2", reserve_bytes=500)
+    assert not (work_dir_root / "job2").exists()
+    # once the busy dir is an orphan, gc frees enough space
+    _age(busy / work_dirs.OWNER_FILE, 120)
+    assert create_work_dir("job2", "task-2", reserve_bytes=500).is_dir()
+    assert not busy.exists()
+
+
+@pytest.fixture
+def ram_scratch_root(monkeypatch, tmp_path, work_dir_root):
+    root = tmp_path / "shm"
+    monkeypatch.setenv("RAM_SCRATCH_ENABLED", "true")
+    monkeypatch.setenv("RAM_SCRATCH_DIR", str(root))
+    monkeypatch.setenv("RAM_SCRATCH_MAX_INPUT_BYTES", "100")
+    monkeypatch.setenv("RAM_SCRATCH_BUDGET_BYTES", "1000")
+    return root
+
+
+@pytest.mark.parametrize(
+    "input_bytes,reserve_bytes,expect_ram",
+    [
+        (50, 200, True),
+        (None, 200, False),
+        (101, 200, False),
+        (50, 1001, False),
+    ],
+)
+def test_it_puts_short_clips_in_ram_scratch(
+    ram_scratch_root, work_dir_root, input_bytes, reserve_bytes, expect_ram
+):
+    work_dir = create_work_dir(
+        "job1", "task-1", reserve_bytes=reserve_bytes, input_bytes=input_bytes
+    )
+    assert work_dir.parent == (ram_scratch_root if expect_ram else work_dir_root)
+
+
+def test_it_falls_back_to_disk_when_ram_budget_used(ram_scratch_root, work_dir_root):
+    first = create_work_dir("job1", "task-1", reserve_bytes=700, input_bytes=50)
+    second = create_work_dir("job2", "task-2", reserve_bytes=400, input_bytes=50)
+    assert first.parent == ram_scratch_root
+    assert second.parent == work_dir_root
+
+
+def test_it_collects_orphans_in_ram_scratch(ram_scratch_root):
+    work_dir = create_work_dir("job1", "task-1", input_bytes=50)
+    _age(work_dir / work_dirs.OWNER_FILE, 120)
+    assert gc_orphans() == [work_dir]
+
+
+def test_reservations_count_against_the_quota(work_dir_root, monkeypatch):
+    monkeypatch.setenv("WORK_DIR_QUOTA_BYTES", "1000")
+    # nothing written yet, the reservation alone fills the quota
+    create_work_dir("job1", "task-1", reserve_bytes=600)
+    with pytest.raises(WorkDirQuotaExceededError):
+        create_work_dir("job2", "task-2", reserve_bytes=600)
+    work_dirs.delete_work_dir(work_dir_root / "job1")
+    assert create_work_dir("job2", "task-2", reserve_bytes=600).is_dir()
+
+
+def _create_reserved(args):
+    root, name = args
+    os.environ["TRANSCODE_WORK_DIR"] = root
+    os.environ["WORK_DIR_QUOTA_BYTES"] = "1000"
+    try:
+        create_work_dir(name, name, reserve_bytes=400)
+        return True
+    except WorkDirQuotaExceededError:
+        return False
+
+
+def test_concurrent_processes_cannot_overbook(work_dir_root):
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        created = pool.map(
+            _create_reserved, [(str(work_dir_root), f"job{i}") for i in range(8)]
+        )
+    assert sum(created) == 2
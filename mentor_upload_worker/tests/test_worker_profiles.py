@@ -0,0 +1,42 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import pytest
+
+from mentor_upload_tasks.worker import worker_argv
+
+
+def test_cpu_profile_runs_prefork_sized_to_cores(monkeypatch):
+    monkeypatch.setenv("CPU_WORKER_CONCURRENCY", "8")
+    assert worker_argv("cpu") == [
+        "worker",
+        "--loglevel=INFO",
+        "--queues=trim_upload,transcode",
+        "--pool=prefork",
+        "--concurrency=8",
+        "--prefetch-multiplier=1",
+    ]
+
+
+def test_io_profile_runs_thread_pool(monkeypatch):
+    monkeypatch.delenv("IO_WORKER_CONCURRENCY", raising=False)
+    assert worker_argv("io", loglevel="DEBUG") == [
+        "worker",
+        "--loglevel=DEBUG",
+        "--queues=transcribe,finalization,cancel",
+        "--pool=threads",
+        "--concurrency=32",
+        "--prefetch-multiplier=4",
+    ]
+
+
+def test_all_profile_keeps_celery_defaults():
+    assert worker_argv("all") == ["worker", "--loglevel=INFO"]
+
+
+def test_it_rejects_unknown_profiles():
+    with pytest.raises(ValueError):
+        worker_argv("gpu")
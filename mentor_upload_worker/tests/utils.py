@@ -42,11 +42,11 @@ def fixture_upload(p="") -> str:
     return fixture_path(path.join("uploads", p))
 
 
-def mock_s3_client(mock_boto3_client: Mock) -> Mock:
+def mock_s3_client(mock_boto3_session: Mock) -> Mock:
     mock_s3_client = Bunch(upload_file=Mock())
 
     def return_clients(client_type, **kwargs):
         return mock_s3_client if client_type == "s3" else None
 
-    mock_boto3_client.side_effect = return_clients
+    mock_boto3_session.return_value.client.side_effect = return_clients
     return mock_s3_client